@@ -6,48 +6,25 @@ poetry install
 
 {
         poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT ebpf-map
+        poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT ebpf-keyed-map --map-type percpu-hash
 
         poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT lttng-ust-map
         poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT lttng-kernel-map
 
         poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT lttng-ust-ringbuffer --num-subbuf 4 --subbuf-size 4K
         poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT lttng-kernel-ringbuffer --num-subbuf 4 --subbuf-size 4K
+        poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT ebpf-ringbuf --num-subbuf 4 --subbuf-size 4K
+        poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT ebpf-perfbuf --num-subbuf 4 --subbuf-size 4K
 
         poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT lttng-ust-ringbuffer --num-subbuf 4 --subbuf-size 8M
         poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT lttng-kernel-ringbuffer --num-subbuf 4 --subbuf-size 8M
+        poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT ebpf-ringbuf --num-subbuf 4 --subbuf-size 8M
+        poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT ebpf-perfbuf --num-subbuf 4 --subbuf-size 8M
 
-        # Capture as much info as possible that might influence the benchmark results.
-        # Some tools may not be available; this is really a best-effort for quick
-        # diagnostics.
-        echo "Machine summary"
-        echo "---------------"
-        echo ""
-        echo "cpu info"
-        echo "--------"
-        cat /proc/cpuinfo
-        echo ""
-        echo "mem info"
-        echo "--------"
-        cat /proc/meminfo
-        echo ""
-        echo "numa info"
-        echo "---------"
-        numactl --hardware
-        echo ""
-        echo "kernel:"
-        echo "-------"
-        uname -a
-        echo ""
-        echo "distro info:"
-        echo "------------"
-        lsb_release -a
-        echo ""
-        echo "kernel cfg:"
-        echo "-----------"
-        zcat /proc/config.gz
-        cat "/boot/config-$(uname -r)"
-        echo ""
-        echo "lshw:"
-        echo "-----------"
-        lshw
+        poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT --loss-tolerance 1 lttng-ust-ringbuffer --num-subbuf 4 --subbuf-size 8M --output-dir /dev/shm
+        poetry run bench --workload build/workload --duration $DURATION --iteration-count $ITER_COUNT --loss-tolerance 1 lttng-kernel-ringbuffer --num-subbuf 4 --subbuf-size 8M --output-dir /dev/shm --output-type splice
+
+        # Fingerprint of the host and its sources of noise, which might influence
+        # the benchmark results.
+        poetry run bench --workload build/workload preflight
 } > results
\ No newline at end of file
@@ -0,0 +1,3 @@
+from lc22bench.bench import cli
+
+cli()
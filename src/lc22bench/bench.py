@@ -1,20 +1,64 @@
 import click
+import contextlib
 import os
 import sys
 import logging
 import subprocess
 import random
-import psutil
-import pandas
-
-from bcc import BPF
-from bcc.utils import printb
-from time import sleep
+import re
+import shutil
+import signal
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+from typing import TYPE_CHECKING, Callable, Optional
+from time import perf_counter, time
 from tabulate import tabulate
-from humanfriendly import parse_size, format_size
+from datetime import datetime
+
+from lc22bench.ebpf_cache import ebpf_object_cache, default_cache_dir
+from lc22bench.keys import KEY_DISTRIBUTIONS, KEY_SEQUENCE_LENGTH, MAX_KEY_COUNT
+from lc22bench.lifecycle import loaded_modules, terminate_process, unload_modules
+from lc22bench.lttng_config import (
+    snapshot_session_description,
+    streaming_session_description,
+)
+from lc22bench.perf_counters import perf_counters, per_event
+from lc22bench.matrix import (
+    PLACEMENT_POLICIES,
+    cpu_slots,
+    expand_matrix,
+    load_matrix,
+    matrix_runner,
+    parse_cpu_list,
+)
+from lc22bench.results import (
+    current_placement,
+    encode_parameters,
+    host_fingerprint,
+    make_run_id,
+    results_store,
+)
+
+# bcc (and with it libbcc and LLVM), pandas and numpy are imported by the
+# scenarios and commands that use them, keeping `bench --help` fast
+if TYPE_CHECKING:
+    import pandas
+
+    from lc22bench.histogram import latency_histogram
+    from lc22bench.profiler import stack_profiler
+    from lc22bench.telemetry import workload_telemetry
+    from lc22bench.tuning import buffer_geometry_search
 
 logger = logging.getLogger(__name__)
 
+# Functions listed in the summary of a scenario's on-CPU profile
+PROFILE_TOP_FUNCTIONS = 10
+
+# Free nodes of an LRU hash that each CPU takes from the shared free list at
+# a time (LOCAL_FREE_TARGET of the kernel's kernel/bpf/bpf_lru_list.c)
+LRU_LOCAL_FREE_TARGET = 128
+
 
 class benchmark:
     def __init__(
@@ -27,26 +71,120 @@ class benchmark:
         self._thread_count = thread_count
         self._duration_s = duration_s
         self._result = None
+        self._telemetry = None
+        self._counters = None
+        self._backend_counts = None
+        self._backend_gauges = None
+        self._thread_cpus = None
+        self._latency_histogram = None
+        self._profile = None
+        # Teardown of everything set up, unwound in reverse order
+        self._resources = contextlib.ExitStack()
 
     @property
     def workload_type(self) -> str:
         raise NotImplementedError
 
-    def run(self) -> None:
-        result = subprocess.run(
-            [
-                self._workload_path,
-                str(self._thread_count),
-                str(self._duration_s),
-                self.workload_type,
-            ],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=sys.stderr,
-        )
+    @property
+    def thread_count(self) -> int:
+        return self._thread_count
+
+    def setup(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self._resources.close()
+
+    def __enter__(self):
+        try:
+            self.setup()
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
-        output = result.stdout.decode("utf-8")
-        self._result = float(output.split(" ")[0])
+    def run(
+        self,
+        workload_options: Optional[dict] = None,
+        counters: Optional[perf_counters] = None,
+        profiler: Optional["stack_profiler"] = None,
+    ) -> None:
+        from lc22bench.histogram import parse_workload_latency
+        from lc22bench.telemetry import telemetry_reader
+
+        options = [
+            "--{name}={value}".format(name=name, value=value)
+            for name, value in (workload_options or {}).items()
+        ]
+
+        backend_counts_before = self._read_backend_counts()
+        if counters is not None:
+            counters.start()
+
+        telemetry_read_fd, telemetry_write_fd = os.pipe()
+        telemetry = telemetry_reader(telemetry_read_fd)
+        telemetry.start()
+        try:
+            try:
+                process = subprocess.Popen(
+                    [
+                        self._workload_path,
+                        "--telemetry-fd={fd}".format(fd=telemetry_write_fd),
+                    ]
+                    + options
+                    + [
+                        str(self._thread_count),
+                        str(self._duration_s),
+                        self.workload_type,
+                    ],
+                    stdout=subprocess.PIPE,
+                    stderr=sys.stderr,
+                    pass_fds=(telemetry_write_fd,),
+                )
+            finally:
+                # The workload holds the only remaining write end of the pipe
+                os.close(telemetry_write_fd)
+            if profiler is not None:
+                profiler.follow(process.pid)
+
+            try:
+                output, _ = process.communicate()
+            except BaseException:
+                process.kill()
+                process.wait()
+                raise
+
+            if counters is not None:
+                self._counters = counters.stop()
+            if profiler is not None:
+                self._profile = profiler.stop()
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, process.args)
+        finally:
+            # The pipe reaches its end once the workload exits, or if it
+            # couldn't be started
+            telemetry.join()
+
+        self._telemetry = telemetry.parse()
+        self._backend_counts = {
+            name: value - backend_counts_before.get(name, 0)
+            for name, value in self._read_backend_counts().items()
+        }
+        self._backend_gauges = self._read_backend_gauges()
+
+        # "X ns per event", then "thread cpus: CPU,CPU,..." and the latency
+        # histograms of the sampled events
+        lines = output.decode("utf-8").splitlines()
+        self._result = float(lines[0].split(" ")[0])
+        for line in lines[1:]:
+            if line.startswith("thread cpus:"):
+                self._thread_cpus = [
+                    int(cpu) for cpu in line.split(":", 1)[1].strip().split(",")
+                ]
+        self._latency_histogram = parse_workload_latency(lines[1:])
 
     @property
     def result(self) -> float:
@@ -54,8 +192,111 @@ class benchmark:
             raise AssertionError
         return self._result
 
-    def __del__(self):
-        pass
+    @property
+    def telemetry(self) -> "workload_telemetry":
+        if self._telemetry is None:
+            raise AssertionError
+        return self._telemetry
+
+    @property
+    def counters(self) -> Optional[dict]:
+        return self._counters
+
+    @property
+    def thread_cpus(self) -> Optional[list[int]]:
+        return self._thread_cpus
+
+    @property
+    def latency_histogram(self) -> Optional["latency_histogram"]:
+        return self._latency_histogram
+
+    @property
+    def latency_unit(self) -> str:
+        # The kernel workload times whole writes of batch_size events
+        return "write" if self.workload_type == "kernel" else "event"
+
+    @property
+    def profile(self) -> Optional[dict[str, int]]:
+        # Sample count of every folded stack of the workload
+        return self._profile
+
+    def _read_backend_counts(self) -> dict:
+        """
+        Cumulative event counts of the tracing backend: "recorded" events,
+        "discarded_events" (when "recorded" is missing, every other event was
+        recorded), "lost_packets" of LTTng channels, "consumer_busy_ns" for
+        backends drained by a consumer during the run (this process, or
+        LTTng's consumer daemon) and "bytes_written" for backends streaming to
+        disk. Sampled before and after each run.
+        """
+        return {}
+
+    def _read_backend_gauges(self) -> dict:
+        """
+        State of the tracing backend at the end of a run, such as the
+        "consumer_rss_bytes" of the consumer daemon.
+        """
+        return {}
+
+    @property
+    def event_accounting(self) -> dict:
+        """Reconcile the events emitted by the workload with the backend's counts."""
+        emitted = int(self.telemetry.per_thread_event_counts.sum())
+        backend_counts = self._backend_counts or {}
+        backend_gauges = self._backend_gauges or {}
+        recorded = backend_counts.get("recorded")
+        discarded = backend_counts.get("discarded_events")
+        if recorded is None and discarded is not None:
+            recorded = emitted - discarded
+
+        elapsed_s = self.telemetry.timestamps_ns[-1] / 1e9
+        return {
+            "emitted_events": emitted,
+            "recorded_events": recorded,
+            "discarded_events": discarded,
+            "lost_packets": backend_counts.get("lost_packets"),
+            # Neither recorded nor reported as discarded by the tracer
+            "unaccounted_events": (
+                emitted - recorded - discarded
+                if recorded is not None and discarded is not None
+                else None
+            ),
+            "loss_ratio": (
+                1.0 - recorded / emitted if recorded is not None and emitted else None
+            ),
+            "recorded_events_per_s": (
+                recorded / elapsed_s if recorded is not None and elapsed_s else None
+            ),
+            # Throughput of a consumer of this process while it was draining
+            "consumer_events_per_s": (
+                recorded / (backend_counts["consumer_busy_ns"] / 1e9)
+                if backend_counts.get("consumer_busy_ns") and recorded is not None
+                else None
+            ),
+            "consumer_cpu_s": (
+                backend_counts["consumer_busy_ns"] / 1e9
+                if "consumer_busy_ns" in backend_counts
+                else None
+            ),
+            "consumer_rss_bytes": backend_gauges.get("consumer_rss_bytes"),
+            "bytes_written": backend_counts.get("bytes_written"),
+            "written_mb_per_s": (
+                backend_counts["bytes_written"] / 1e6 / elapsed_s
+                if "bytes_written" in backend_counts and elapsed_s
+                else None
+            ),
+        }
+
+    def reset(self) -> None:
+        # Prepare a warm benchmark for another iteration
+        self._result = None
+        self._telemetry = None
+        self._counters = None
+        self._backend_counts = None
+        self._backend_gauges = None
+        self._thread_cpus = None
+        self._latency_histogram = None
+        self._profile = None
 
 
 class kernel_benchmark(benchmark):
@@ -73,7 +314,13 @@ class kernel_benchmark(benchmark):
             )
             sys.exit(1)
 
+    def setup(self) -> None:
+        benchmark.setup(self)
+
         # Load benchmark modules
+        # FIXME: something (ebpf program?) appears to hold a reference to
+        # the lttng-bench module, preventing its unloading.
+        # It is left loaded as it doesn't change the benchmark results anyhow.
         subprocess.run(
             "modprobe lttng-bench".split(" "),
             check=True,
@@ -85,27 +332,44 @@ class kernel_benchmark(benchmark):
     def workload_type(self) -> str:
         return "kernel"
 
-    def __del__(self):
-        benchmark.__del__(self)
-        # FIXME: something (ebpf program?) appears to hold a reference to
-        # the lttng-bench module, preventing its unloading.
-        # skip it as it doesn't change the benchmark results anyhow.
-        # subprocess.run(
-        #    "rmmod lttng-bench".split(" "),
-        #    check=True,
-        #    stdout=sys.stdout,
-        #    stderr=sys.stderr,
-        # )
-
 
-class ebpf_map_benchmark(kernel_benchmark):
+class ebpf_benchmark(kernel_benchmark):
     def __init__(
         self,
         workload_path: str,
         thread_count: int,
         duration_s: int,
+        program_cache: Optional[ebpf_object_cache] = None,
     ):
         kernel_benchmark.__init__(self, workload_path, thread_count, duration_s)
+        self._program_cache = program_cache
+        self._program = None
+
+    def _load_program(self, src: str):
+        from bcc import BPF
+
+        if self._program_cache is not None:
+            program = self._program_cache.load(src, BPF.TRACEPOINT)
+        else:
+            program = BPF(text=src)
+        self._resources.callback(program.cleanup)
+
+        # The bpf maps remain persistent until the program is cleaned up
+        self._program = program
+        return program
+
+    def _attach_program(self, fn_name: str) -> None:
+        self._program.attach_tracepoint(
+            tp="lttng_bench:lttng_bench_event", fn_name=fn_name
+        )
+        self._resources.callback(
+            self._program.detach_tracepoint, tp="lttng_bench:lttng_bench_event"
+        )
+
+
+class ebpf_map_benchmark(ebpf_benchmark):
+    def setup(self) -> None:
+        ebpf_benchmark.setup(self)
 
         src = """
         BPF_PERCPU_ARRAY(test_map, u64, 1024);
@@ -116,25 +380,287 @@ class ebpf_map_benchmark(kernel_benchmark):
         }
         """
 
-        program = BPF(text=src)
-        program.attach_tracepoint(tp="lttng_bench:lttng_bench_event", fn_name="my_func")
+        self._load_program(src)
+        self._attach_program("my_func")
 
-        # The bpf map remains persistent as long as this object exists
-        self._program = program
+    def view(self):
+        values = self._program["test_map"].getvalue_array(0)
+        print(tabulate(enumerate(values.tolist()), headers=["CPU ID", "Value"]))
+
+    def _read_backend_counts(self) -> dict:
+        return {"recorded": int(self._program["test_map"].sum_array(0))}
+
+    def reset(self) -> None:
+        ebpf_benchmark.reset(self)
+        self._program["test_map"].clear()
+
+
+class ebpf_keyed_map_benchmark(ebpf_benchmark):
+    """
+    Count events per key in a map of `key_count` keys. The events of the
+    lttng-bench module carry no key, so the program replays a key sequence
+    drawn from `key_distribution`, one key per event, from a per-CPU cursor.
+    """
+
+    # Declaration of the map of each type, and the increment of the count of
+    # the event's key
+    _MAPS = {
+        "percpu-array": (
+            "BPF_PERCPU_ARRAY(counts, u64, {max_entries});",
+            """
+            u64 *count = counts.lookup(key);
+            if (count) {
+                (*count)++;
+            }
+            """,
+        ),
+        "percpu-hash": (
+            "BPF_PERCPU_HASH(counts, u32, u64, {max_entries});",
+            """
+            u64 *count = counts.lookup_or_try_init(key, &zero);
+            if (count) {
+                (*count)++;
+            } else {
+                dropped.increment(0, 1);
+            }
+            """,
+        ),
+        "hash": (
+            "BPF_HASH(counts, u32, u64, {max_entries});",
+            """
+            u64 *count = counts.lookup_or_try_init(key, &zero);
+            if (count) {
+                __sync_fetch_and_add(count, 1);
+            } else {
+                dropped.increment(0, 1);
+            }
+            """,
+        ),
+        "lru-hash": (
+            'BPF_TABLE("lru_hash", u32, u64, counts, {max_entries});',
+            """
+            u64 *count = counts.lookup_or_try_init(key, &zero);
+            if (count) {
+                __sync_fetch_and_add(count, 1);
+            } else {
+                dropped.increment(0, 1);
+            }
+            """,
+        ),
+    }
+
+    def __init__(
+        self,
+        workload_path: str,
+        thread_count: int,
+        duration_s: int,
+        map_type: str,
+        key_count: int,
+        key_distribution: str,
+        program_cache: Optional[ebpf_object_cache] = None,
+    ):
+        ebpf_benchmark.__init__(
+            self, workload_path, thread_count, duration_s, program_cache
+        )
+        self._map_type = map_type
+        self._key_count = key_count
+        self._key_distribution = key_distribution
+
+    def setup(self) -> None:
+        from lc22bench.keys import key_sequence
+
+        ebpf_benchmark.setup(self)
+
+        declaration, increment = self._MAPS[self._map_type]
+        max_entries = self._key_count
+        if self._map_type == "lru-hash":
+            from bcc.utils import get_possible_cpus
+
+            # An LRU hash evicts keys once the shared free list runs out, while
+            # other CPUs may still hold free nodes: leave room for those, so
+            # that every replayed key fits and no count is evicted
+            max_entries += LRU_LOCAL_FREE_TARGET * len(get_possible_cpus())
+
+        src = """
+        BPF_ARRAY(key_sequence, u32, {sequence_length});
+        BPF_PERCPU_ARRAY(key_cursor, u32, 1);
+        BPF_PERCPU_ARRAY(dropped, u64, 1);
+        {declaration}
+
+        int record_event(void *ctx) {{
+            int cursor_index = 0;
+            u64 zero = 0;
+            u32 *cursor = key_cursor.lookup(&cursor_index);
+            if (!cursor) {{
+                return 0;
+            }}
+
+            u32 index = (*cursor)++ & {index_mask};
+            u32 *key = key_sequence.lookup(&index);
+            if (!key) {{
+                return 0;
+            }}
+            {increment}
+            return 0;
+        }}
+        """.format(
+            sequence_length=KEY_SEQUENCE_LENGTH,
+            declaration=declaration.format(max_entries=max_entries),
+            index_mask=KEY_SEQUENCE_LENGTH - 1,
+            increment=increment,
+        )
+
+        # The sequence is a map rather than part of the program text, so that
+        # the program is compiled once for all distributions
+        program = self._load_program(src)
+        sequence = program["key_sequence"]
+        keys = key_sequence(self._key_count, self._key_distribution)
+        sequence.items_update_batch(
+            (sequence.Key * len(keys))(*range(len(keys))),
+            (sequence.Leaf * len(keys))(*keys.tolist()),
+        )
+        self._attach_program("record_event")
 
     def view(self):
-        table = []
-        i = 0
-        for val in self._program["test_map"][0]:
-            table.append([i, val])
-            i = i + 1
+        keys, values = self._program["counts"].items_array()
+        counts = values.sum(axis=-1) if values.ndim > 1 else values
+        print(
+            tabulate(
+                sorted(zip(keys.tolist(), counts.tolist()), key=lambda item: -item[1]),
+                headers=["Key", "Value"],
+            )
+        )
+
+    def _read_backend_counts(self) -> dict:
+        _, values = self._program["counts"].items_array()
+        return {
+            "recorded": int(values.sum()),
+            "discarded_events": int(self._program["dropped"].sum_array(0)),
+        }
+
+    def reset(self) -> None:
+        ebpf_benchmark.reset(self)
+        self._program["counts"].clear()
+        self._program["dropped"].clear()
+
+
+class ebpf_stream_benchmark(ebpf_benchmark):
+    """
+    Stream a sample of every event to a consumer thread of this process,
+    which drains the buffers while the workload runs. Buffers hold as much as
+    LTTng's `num_subbuf` sub-buffers of `subbuf_size` bytes per CPU.
+    """
+
+    # Sample of each event: its timestamp and the first 8 bytes of its
+    # payload, which follows the 8 bytes of common tracepoint fields
+    _SAMPLE_SRC = """
+        struct bench_sample {
+            u64 timestamp;
+            u64 payload;
+        };
+
+        static __always_inline void fill_sample(struct bench_sample *sample, void *ctx) {
+            sample->timestamp = bpf_ktime_get_ns();
+            bpf_probe_read_kernel(&sample->payload, sizeof(sample->payload), (char *) ctx + 8);
+        }
+        """
+
+    def __init__(
+        self,
+        workload_path: str,
+        thread_count: int,
+        duration_s: int,
+        num_subbuf: int,
+        subbuf_size: int,
+        program_cache: Optional[ebpf_object_cache] = None,
+    ):
+        ebpf_benchmark.__init__(
+            self, workload_path, thread_count, duration_s, program_cache
+        )
+        self._per_cpu_size = num_subbuf * subbuf_size
+        self._consumer = None
+
+    def _program_src(self) -> str:
+        raise NotImplementedError
+
+    def _open_consumer(self):
+        raise NotImplementedError
+
+    def setup(self) -> None:
+        ebpf_benchmark.setup(self)
+
+        self._load_program(self._SAMPLE_SRC + self._program_src())
+        self._consumer = self._resources.enter_context(self._open_consumer())
+        self._consumer.start()
+        self._attach_program("record_event")
+
+    def _read_backend_counts(self) -> dict:
+        return self._consumer.counts()
+
+
+class ebpf_ringbuf_benchmark(ebpf_stream_benchmark):
+    def _program_src(self) -> str:
+        from bcc.utils import get_online_cpus
+
+        from lc22bench.stream_records import ringbuf_page_count
+
+        return """
+        BPF_RINGBUF_OUTPUT(events, {page_count});
+        BPF_PERCPU_ARRAY(dropped, u64, 1);
+
+        int record_event(void *ctx) {{
+            struct bench_sample sample;
+
+            fill_sample(&sample, ctx);
+            if (events.ringbuf_output(&sample, sizeof(sample), 0)) {{
+                dropped.increment(0, 1);
+            }}
+            return 0;
+        }}
+        """.format(
+            page_count=ringbuf_page_count(self._per_cpu_size, len(get_online_cpus()))
+        )
+
+    def _open_consumer(self):
+        from bcc.utils import get_online_cpus
 
-        print(tabulate(table, headers=["CPU ID", "Value"]))
+        from lc22bench.ebpf_stream import ringbuf_consumer
+        from lc22bench.stream_records import ringbuf_page_count
 
-    def __del__(self):
-        self._program.detach_tracepoint(tp="lttng_bench:lttng_bench_event")
-        del self._program
-        kernel_benchmark.__del__(self)
+        return ringbuf_consumer(
+            self._program["events"].map_fd,
+            ringbuf_page_count(self._per_cpu_size, len(get_online_cpus())),
+        )
+
+    def _read_backend_counts(self) -> dict:
+        # Samples that didn't fit in the ring buffer never reach the consumer
+        counts = ebpf_stream_benchmark._read_backend_counts(self)
+        counts["discarded_events"] += int(self._program["dropped"].sum_array(0))
+        return counts
+
+
+class ebpf_perfbuf_benchmark(ebpf_stream_benchmark):
+    def _program_src(self) -> str:
+        return """
+        BPF_PERF_OUTPUT(events);
+
+        int record_event(void *ctx) {
+            struct bench_sample sample;
+
+            fill_sample(&sample, ctx);
+            events.perf_submit(ctx, &sample, sizeof(sample));
+            return 0;
+        }
+        """
+
+    def _open_consumer(self):
+        from lc22bench.ebpf_stream import perf_buffer_consumer
+        from lc22bench.stream_records import perf_buffer_page_count
+
+        return perf_buffer_consumer(
+            self._program["events"].map_fd,
+            perf_buffer_page_count(self._per_cpu_size),
+        )
 
 
 class lttng_benchmark:
@@ -147,14 +673,39 @@ class lttng_benchmark:
         self._channel_name = "channel_" + self._random_string(8)
         self._map_name = "map_" + self._random_string(8)
         self._trigger_name = "trigger_" + self._random_string(8)
+        self._sessiond_pid = None
+        self._trace_dir = None
 
-        self._run_lttng_bin_cmd("lttng-sessiond", "-d")
+    def setup(self) -> None:
+        # sessiond loads the LTTng modules it needs; unload them once it's gone
+        modules_before = set(loaded_modules())
+        self._resources.callback(self._unload_lttng_modules, modules_before)
+
+        run_dir = tempfile.mkdtemp(prefix="lc22bench-")
+        self._resources.callback(shutil.rmtree, run_dir, ignore_errors=True)
+
+        # Daemonizing returns once the session daemon is ready
+        pid_file = os.path.join(run_dir, "lttng-sessiond.pid")
+        self._run_lttng_bin_cmd("lttng-sessiond", "-d --pidfile " + pid_file)
+        with open(pid_file) as pid:
+            self._sessiond_pid = int(pid.read())
+        self._resources.callback(terminate_process, self._sessiond_pid)
+
+    @staticmethod
+    def _unload_lttng_modules(modules_before: set[str]) -> None:
+        unload_modules(
+            {
+                name
+                for name in loaded_modules()
+                if name.startswith("lttng") and name not in modules_before
+            }
+        )
 
     @staticmethod
     def _random_string(length: int) -> str:
         return "".join(chr(random.randrange(65, 90)) for i in range(length))
 
-    def _run_lttng_bin_cmd(self, binary_name: str, cmd_args: str) -> None:
+    def _lttng_bin_cmd(self, binary_name: str, cmd_args: str) -> list[str]:
         if len(self._lttng_install_path) > 0:
             if not self._lttng_install_path.endswith("/"):
                 bin_path = self._lttng_install_path + "/{binary_name} "
@@ -164,37 +715,173 @@ class lttng_benchmark:
             bin_path = "{binary_name} "
 
         cmd = bin_path.format(binary_name=binary_name) + cmd_args
+        return cmd.split(" ")
+
+    def _run_lttng_bin_cmd(self, binary_name: str, cmd_args: str) -> None:
         subprocess.run(
-            cmd.split(" "), check=True, stdout=subprocess.DEVNULL, stderr=sys.stderr
+            self._lttng_bin_cmd(binary_name, cmd_args),
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=sys.stderr,
         )
 
     def _run_lttng_cmd(self, cmd_args: str) -> None:
         self._run_lttng_bin_cmd("lttng", cmd_args)
 
-    def view(self):
-        pass
-
-    @staticmethod
-    def process_exists(name: str) -> bool:
-        for process in psutil.process_iter(["name", "cmdline"]):
-            if (
-                process.info["name"] == name
-                or process.info["cmdline"]
-                and process.info["cmdline"][0] == name
-            ):
-                return True
-        return False
-
-    def __del__(self):
-        subprocess.run(
-            "killall lttng-sessiond".split(" "),
+    def _lttng_cmd_output(self, cmd_args: str) -> str:
+        return subprocess.run(
+            self._lttng_bin_cmd("lttng", cmd_args),
             check=True,
-            stdout=sys.stdout,
+            stdout=subprocess.PIPE,
             stderr=sys.stderr,
+        ).stdout.decode("utf-8")
+
+    def _load_session(self, description: str) -> None:
+        # Apply a whole session configuration in a single request to sessiond
+        with tempfile.NamedTemporaryFile("w", suffix=".lttng") as config_file:
+            config_file.write(description)
+            config_file.flush()
+            self._run_lttng_cmd(
+                "load --input-path {path} {session_name}".format(
+                    path=config_file.name, session_name=self._session_name
+                )
+            )
+
+    def _load_ringbuffer_session(
+        self,
+        domain: str,
+        events: list[str],
+        num_subbuf: int,
+        subbuf_size: int,
+        output_dir: Optional[str],
+        output_type: str,
+        read_timer_interval_us: Optional[int],
+    ) -> None:
+        # Snapshot session, unless the trace is streamed to `output_dir`
+        if output_dir is None:
+            description = snapshot_session_description(
+                self._session_name,
+                domain,
+                self._channel_name,
+                subbuf_size,
+                num_subbuf,
+                events,
+                read_timer_interval_us,
+            )
+        else:
+            # A directory of its own, whose size is the amount of trace written
+            self._trace_dir = tempfile.mkdtemp(
+                prefix="lc22bench-trace-", dir=output_dir
+            )
+            self._resources.callback(shutil.rmtree, self._trace_dir, ignore_errors=True)
+            description = streaming_session_description(
+                self._session_name,
+                domain,
+                self._channel_name,
+                subbuf_size,
+                num_subbuf,
+                events,
+                self._trace_dir,
+                output_type.upper(),
+                read_timer_interval_us,
+            )
+
+        self._load_session(description)
+        self._resources.callback(self._run_lttng_cmd, "destroy " + self._session_name)
+
+    def _consumer_processes(self) -> list:
+        import psutil
+
+        # sessiond spawns a consumer daemon per domain (and ABI) it traces
+        try:
+            children = psutil.Process(self._sessiond_pid).children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+        consumers = []
+        for process in children:
+            with contextlib.suppress(psutil.NoSuchProcess):
+                if process.name() == "lttng-consumerd":
+                    consumers.append(process)
+        return consumers
+
+    def _snapshot_counts(self) -> dict:
+        from lc22bench.ctf import scan_trace
+
+        # Overwrite mode channels report overwritten packets, but never any
+        # discarded events: count the events left in their buffers instead
+        counts = {"lost_packets": self._channel_counts().get("lost_packets", 0)}
+        with tempfile.TemporaryDirectory(prefix="lc22bench-snapshot-") as snapshot_dir:
+            self._run_lttng_cmd(
+                "snapshot record --session {session_name} file://{path}".format(
+                    session_name=self._session_name, path=snapshot_dir
+                )
+            )
+            counts["recorded"] = scan_trace(snapshot_dir)["events"]
+        return counts
+
+    def _ringbuffer_counts(self) -> dict:
+        import psutil
+
+        from lc22bench.ctf import scan_trace
+
+        if self._trace_dir is None:
+            return self._snapshot_counts()
+
+        # Stopping the session flushes its buffers to the trace, whose events
+        # are then counted from its packet headers
+        self._run_lttng_cmd("stop " + self._session_name)
+        counts = self._channel_counts()
+        trace = scan_trace(self._trace_dir)
+        self._run_lttng_cmd("start " + self._session_name)
+        counts["recorded"] = trace["events"]
+        counts["bytes_written"] = trace["bytes"]
+
+        consumer_cpu_s = 0.0
+        for process in self._consumer_processes():
+            with contextlib.suppress(psutil.NoSuchProcess):
+                cpu_times = process.cpu_times()
+                consumer_cpu_s += cpu_times.user + cpu_times.system
+        counts["consumer_busy_ns"] = int(consumer_cpu_s * 1e9)
+        return counts
+
+    def _consumer_gauges(self) -> dict:
+        import psutil
+
+        rss_bytes = 0
+        for process in self._consumer_processes():
+            with contextlib.suppress(psutil.NoSuchProcess):
+                rss_bytes += process.memory_info().rss
+        return {"consumer_rss_bytes": rss_bytes}
+
+    def _map_value(self, key: str) -> int:
+        # Sum the value of `key` over every table (per-UID, per-CPU, ...) shown
+        value = 0
+        for match in re.finditer(
+            r"\|\s*{key}\s*\|\s*(-?\d+)".format(key=re.escape(key)),
+            self._lttng_cmd_output("view-map " + self._map_name),
+        ):
+            value += int(match.group(1))
+        return value
+
+    def _channel_counts(self) -> dict:
+        session = ElementTree.fromstring(
+            self._lttng_cmd_output("--mi xml list " + self._session_name)
         )
-        # wait for sessiond to die
-        while self.process_exists("lttng-sessiond"):
-            pass
+        for channel in session.iterfind(".//{*}channel"):
+            if channel.findtext("{*}name") != self._channel_name:
+                continue
+
+            counts = {}
+            for name in ("discarded_events", "lost_packets"):
+                value = channel.findtext("{*}attributes/{*}" + name)
+                if value is not None:
+                    counts[name] = int(value)
+            return counts
+
+        return {}
+
+    def view(self):
+        pass
 
 
 class lttng_kernel_benchmark(kernel_benchmark, lttng_benchmark):
@@ -208,21 +895,12 @@ class lttng_kernel_benchmark(kernel_benchmark, lttng_benchmark):
         kernel_benchmark.__init__(self, workload_path, thread_count, duration_s)
         lttng_benchmark.__init__(self, lttng_bin_install_path)
 
-        # Load benchmark probe
-        subprocess.run("modprobe lttng-bench-tp".split(" "), check=True)
-
-    def __del__(self):
-        kernel_benchmark.__del__(self)
-        lttng_benchmark.__del__(self)
-        subprocess.run("rmmod lttng-bench-tp".split(" "), check=True)
+    def setup(self) -> None:
+        kernel_benchmark.setup(self)
+        lttng_benchmark.setup(self)
 
-        # Workaround: remove sticky modules
-        result = subprocess.run("lsmod", check=True, stdout=subprocess.PIPE)
-        lsmod_list = result.stdout.decode("utf-8")
-        for line in lsmod_list.split("\n"):
-            module_name = line.split(" ")[0]
-            if "lttng" in module_name:
-                subprocess.run(["rmmod", module_name], check=False)
+        # Load benchmark probe, unloaded along with the other LTTng modules
+        subprocess.run("modprobe lttng-bench-tp".split(" "), check=True)
 
 
 class lttng_kernel_ringbuffer_benchmark(lttng_kernel_benchmark):
@@ -234,6 +912,9 @@ class lttng_kernel_ringbuffer_benchmark(lttng_kernel_benchmark):
         duration_s: int,
         num_subbuf: int,
         subbuf_size: int,
+        output_dir: Optional[str] = None,
+        output_type: str = "mmap",
+        read_timer_interval_us: Optional[int] = None,
     ):
         lttng_kernel_benchmark.__init__(
             self,
@@ -245,31 +926,32 @@ class lttng_kernel_ringbuffer_benchmark(lttng_kernel_benchmark):
 
         self._num_subbuf = num_subbuf
         self._subbuf_size = subbuf_size
-
-        self._run_lttng_cmd(
-            "create {session_name} --snapshot".format(session_name=self._session_name)
-        )
-        self._run_lttng_cmd(
-            "enable-channel --session {session_name} --kernel --subbuf-size={subbuf_size} --num-subbuf={num_subbuf} {channel_name}".format(
-                session_name=self._session_name,
-                channel_name=self._channel_name,
-                num_subbuf=num_subbuf,
-                subbuf_size=subbuf_size,
-            )
-        )
-        self._run_lttng_cmd(
-            "enable-event --kernel --channel {channel_name} lttng_bench_event".format(
-                session_name=self._session_name,
-                channel_name=self._channel_name,
-            )
-        )
-        self._run_lttng_cmd(
-            "start {session_name}".format(session_name=self._session_name)
+        self._output_dir = output_dir
+        self._output_type = output_type
+        self._read_timer_interval_us = read_timer_interval_us
+
+    def setup(self) -> None:
+        lttng_kernel_benchmark.setup(self)
+
+        self._load_ringbuffer_session(
+            "KERNEL",
+            ["lttng_bench_event"],
+            self._num_subbuf,
+            self._subbuf_size,
+            self._output_dir,
+            self._output_type,
+            self._read_timer_interval_us,
         )
 
-    def __del__(self):
-        self._run_lttng_cmd("destroy " + self._session_name)
-        lttng_kernel_benchmark.__del__(self)
+    def _read_backend_counts(self) -> dict:
+        return self._ringbuffer_counts()
+
+    def _read_backend_gauges(self) -> dict:
+        return self._consumer_gauges()
+
+    def reset(self) -> None:
+        lttng_kernel_benchmark.reset(self)
+        self._run_lttng_cmd("clear " + self._session_name)
 
 
 class lttng_kernel_map_benchmark(lttng_kernel_benchmark):
@@ -288,9 +970,13 @@ class lttng_kernel_map_benchmark(lttng_kernel_benchmark):
             duration_s,
         )
 
+    def setup(self) -> None:
+        lttng_kernel_benchmark.setup(self)
+
         self._run_lttng_cmd(
             "create {session_name} --snapshot".format(session_name=self._session_name)
         )
+        self._resources.callback(self._run_lttng_cmd, "destroy " + self._session_name)
         self._run_lttng_cmd(
             "add-map --session {session_name} --kernel --bitness=64 --max-key-count=1024 {map_name}".format(
                 session_name=self._session_name, map_name=self._map_name
@@ -303,6 +989,10 @@ class lttng_kernel_map_benchmark(lttng_kernel_benchmark):
                 map_name=self._map_name,
             )
         )
+        self._resources.callback(
+            self._run_lttng_cmd,
+            "remove-trigger {trigger_name}".format(trigger_name=self._trigger_name),
+        )
         self._run_lttng_cmd(
             "start {session_name}".format(session_name=self._session_name)
         )
@@ -314,12 +1004,8 @@ class lttng_kernel_map_benchmark(lttng_kernel_benchmark):
     def view(self) -> None:
         self._run_lttng_cmd("view-map " + self._map_name)
 
-    def __del__(self):
-        self._run_lttng_cmd("destroy " + self._session_name)
-        self._run_lttng_cmd(
-            "remove-trigger {trigger_name}".format(trigger_name=self._trigger_name)
-        )
-        lttng_kernel_benchmark.__del__(self)
+    def _read_backend_counts(self) -> dict:
+        return {"recorded": self._map_value("bench_key")}
 
 
 class userspace_benchmark(benchmark):
@@ -335,8 +1021,19 @@ class userspace_benchmark(benchmark):
     def workload_type(self) -> str:
         return "ust"
 
-    def __del__(self):
-        benchmark.__del__(self)
+
+class empty_loop_benchmark(benchmark):
+    def __init__(
+        self,
+        workload_path: str,
+        thread_count: int,
+        duration_s: int,
+    ):
+        benchmark.__init__(self, workload_path, thread_count, duration_s)
+
+    @property
+    def workload_type(self) -> str:
+        return "empty"
 
 
 class lttng_ust_benchmark(userspace_benchmark, lttng_benchmark):
@@ -350,9 +1047,9 @@ class lttng_ust_benchmark(userspace_benchmark, lttng_benchmark):
         userspace_benchmark.__init__(self, workload_path, thread_count, duration_s)
         lttng_benchmark.__init__(self, lttng_bin_install_path)
 
-    def __del__(self):
-        userspace_benchmark.__del__(self)
-        lttng_benchmark.__del__(self)
+    def setup(self) -> None:
+        userspace_benchmark.setup(self)
+        lttng_benchmark.setup(self)
 
 
 class lttng_ust_ringbuffer_benchmark(lttng_ust_benchmark):
@@ -364,6 +1061,9 @@ class lttng_ust_ringbuffer_benchmark(lttng_ust_benchmark):
         duration_s: int,
         num_subbuf: int,
         subbuf_size: int,
+        output_dir: Optional[str] = None,
+        output_type: str = "mmap",
+        read_timer_interval_us: Optional[int] = None,
     ):
         lttng_ust_benchmark.__init__(
             self,
@@ -375,31 +1075,32 @@ class lttng_ust_ringbuffer_benchmark(lttng_ust_benchmark):
 
         self._num_subbuf = num_subbuf
         self._subbuf_size = subbuf_size
-
-        self._run_lttng_cmd(
-            "create {session_name} --snapshot".format(session_name=self._session_name)
-        )
-        self._run_lttng_cmd(
-            "enable-channel --session {session_name} --userspace --buffers-uid --subbuf-size={subbuf_size} --num-subbuf={num_subbuf} {channel_name}".format(
-                session_name=self._session_name,
-                channel_name=self._channel_name,
-                num_subbuf=num_subbuf,
-                subbuf_size=subbuf_size,
-            )
-        )
-        self._run_lttng_cmd(
-            "enable-event --userspace --channel {channel_name} lc2022:benchmark_event".format(
-                session_name=self._session_name,
-                channel_name=self._channel_name,
-            )
-        )
-        self._run_lttng_cmd(
-            "start {session_name}".format(session_name=self._session_name)
+        self._output_dir = output_dir
+        self._output_type = output_type
+        self._read_timer_interval_us = read_timer_interval_us
+
+    def setup(self) -> None:
+        lttng_ust_benchmark.setup(self)
+
+        self._load_ringbuffer_session(
+            "UST",
+            ["lc2022:benchmark_event"],
+            self._num_subbuf,
+            self._subbuf_size,
+            self._output_dir,
+            self._output_type,
+            self._read_timer_interval_us,
         )
 
-    def __del__(self):
-        self._run_lttng_cmd("destroy " + self._session_name)
-        lttng_ust_benchmark.__del__(self)
+    def _read_backend_counts(self) -> dict:
+        return self._ringbuffer_counts()
+
+    def _read_backend_gauges(self) -> dict:
+        return self._consumer_gauges()
+
+    def reset(self) -> None:
+        lttng_ust_benchmark.reset(self)
+        self._run_lttng_cmd("clear " + self._session_name)
 
 
 class lttng_ust_map_benchmark(lttng_ust_benchmark):
@@ -418,9 +1119,13 @@ class lttng_ust_map_benchmark(lttng_ust_benchmark):
             duration_s,
         )
 
+    def setup(self) -> None:
+        lttng_ust_benchmark.setup(self)
+
         self._run_lttng_cmd(
             "create {session_name} --snapshot".format(session_name=self._session_name)
         )
+        self._resources.callback(self._run_lttng_cmd, "destroy " + self._session_name)
         self._run_lttng_cmd(
             "add-map --session {session_name} --userspace --per-uid --bitness=64 --max-key-count=1024 {map_name}".format(
                 session_name=self._session_name, map_name=self._map_name
@@ -433,6 +1138,10 @@ class lttng_ust_map_benchmark(lttng_ust_benchmark):
                 map_name=self._map_name,
             )
         )
+        self._resources.callback(
+            self._run_lttng_cmd,
+            "remove-trigger {trigger_name}".format(trigger_name=self._trigger_name),
+        )
         self._run_lttng_cmd(
             "start {session_name}".format(session_name=self._session_name)
         )
@@ -440,37 +1149,371 @@ class lttng_ust_map_benchmark(lttng_ust_benchmark):
     def view(self) -> None:
         self._run_lttng_cmd("view-map " + self._map_name)
 
-    def __del__(self):
-        self._run_lttng_cmd("destroy " + self._session_name)
-        self._run_lttng_cmd(
-            "remove-trigger {trigger_name}".format(trigger_name=self._trigger_name)
-        )
-        lttng_ust_benchmark.__del__(self)
+    def _read_backend_counts(self) -> dict:
+        return {"recorded": self._map_value("bench_key")}
 
 
 class tracing_benchmark_results:
-    def __init__(self, name: str):
+    def __init__(self, name: str, scenario: str, parameters: Optional[dict] = None):
         self._times_per_event = []
+        self._steady_state_times_per_event = []
+        self._counters_per_event = []
+        self._event_accounting = []
+        self._setup_times = []
+        self._teardown_times = []
+        self._latency_histogram = None
+        self._latency_unit = "event"
+        self._profile = {}
         self._name = name
+        self._scenario = scenario
+        self._parameters = parameters or {}
+        self._run_id = make_run_id(scenario)
+        self.stop_reason = None
+        self.noise_score = None
+        self.profile_path = None
+
+    @property
+    def run_id(self) -> str:
+        return self._run_id
+
+    @property
+    def times_per_event(self) -> list[float]:
+        return self._times_per_event
+
+    @property
+    def profile(self) -> dict[str, int]:
+        return self._profile
+
+    @property
+    def loss_rate(self) -> float:
+        """
+        Share of the emitted events that the tracer didn't record: discarded,
+        overwritten or lost. Packets lost in iterations whose recorded events
+        are unknown count as losing every event.
+        """
+        emitted = recorded = 0
+        for accounting in self._event_accounting:
+            if accounting["recorded_events"] is None:
+                if accounting["lost_packets"]:
+                    return 1.0
+                continue
+            emitted += accounting["emitted_events"]
+            recorded += accounting["recorded_events"]
+        return 1.0 - recorded / emitted if emitted else 0.0
 
     def add_per_event_time(self, ns_per_event: float):
         self._times_per_event.append(ns_per_event)
 
-    def summarize(self) -> None:
-        header = self._name + " - " + "Time per event (ns)"
-        print(header)
-        print("".join("-" for i in range(len(header))))
-        print("Points: " + str(self._times_per_event))
-        print(pandas.Series(self._times_per_event).describe())
+    def add_steady_state_per_event_time(self, ns_per_event: float):
+        self._steady_state_times_per_event.append(ns_per_event)
 
+    def add_counters_per_event(self, counters_per_event: dict):
+        self._counters_per_event.append(counters_per_event)
 
-@click.group()
-@click.option("-d", "--debug", is_flag=True, help="Set logging level to DEBUG")
-@click.option("-w", "--workload", help="Workload binary path", required=True)
-@click.option("--lttng-binary-path", help="LTTng binary install path", default="")
-@click.option(
-    "--duration",
-    default=10,
+    def add_event_accounting(self, event_accounting: dict):
+        self._event_accounting.append(event_accounting)
+
+    def add_setup_time(self, setup_time_s: float):
+        self._setup_times.append(setup_time_s)
+
+    def add_teardown_time(self, teardown_time_s: float):
+        self._teardown_times.append(teardown_time_s)
+
+    def add_latency_histogram(self, histogram: "latency_histogram", unit: str):
+        self._latency_unit = unit
+        self._latency_histogram = (
+            histogram
+            if self._latency_histogram is None
+            else self._latency_histogram.merge(histogram)
+        )
+
+    def add_profile(self, folded: dict[str, int]):
+        from lc22bench.folded import merge_folded
+
+        self._profile = merge_folded(self._profile, folded)
+
+    def iteration_record(
+        self,
+        ctx: click.Context,
+        iteration: int,
+        cold_start: bool,
+        benchmark: benchmark,
+        steady_state_ns_per_event: Optional[float],
+        start_time: float,
+        end_time: float,
+    ) -> dict:
+        from lc22bench.histogram import LATENCY_QUANTILES
+
+        host = host_fingerprint()
+        telemetry = benchmark.telemetry
+        counters_per_event = per_event(
+            benchmark.counters or {}, int(telemetry.per_thread_event_counts.sum())
+        )
+        histogram = benchmark.latency_histogram
+        latency_quantiles = (
+            histogram.quantiles_ns(LATENCY_QUANTILES) if histogram is not None else {}
+        )
+        return {
+            "run_id": self._run_id,
+            "scenario": self._scenario,
+            "name": self._name,
+            "parameters": encode_parameters(self._parameters),
+            "iteration": iteration,
+            "cold_start": cold_start,
+            "thread_count": benchmark.thread_count,
+            "duration_s": ctx.obj["duration_s"],
+            "ns_per_event": benchmark.result,
+            "steady_state_ns_per_event": steady_state_ns_per_event,
+            "per_thread_event_counts": telemetry.per_thread_event_counts.tolist(),
+            "telemetry_interval_ns": telemetry.interval_ns,
+            "perf_counters": benchmark.counters,
+            **benchmark.event_accounting,
+            **{
+                name + "_per_event": value for name, value in counters_per_event.items()
+            },
+            "start_time": start_time,
+            "end_time": end_time,
+            "host_id": host["id"],
+            "host": host,
+            "placement": current_placement(),
+            "placement_policy": ctx.obj["workload_options"]["placement"],
+            "thread_cpus": benchmark.thread_cpus,
+            "latency_sample_period": ctx.obj["workload_options"][
+                "latency-sample-period"
+            ],
+            **{
+                "latency_" + name + "_ns": latency_quantiles.get(name)
+                for name in LATENCY_QUANTILES
+            },
+            "latency_max_ns": histogram.max_ns if histogram is not None else None,
+            "latency_unit": benchmark.latency_unit if histogram is not None else None,
+            "latency_histogram": (
+                histogram.to_dict() if histogram is not None else None
+            ),
+        }
+
+    def summarize_net(self, baseline: "tracing_benchmark_results") -> None:
+        """Summarize the time per event net of that of a baseline run."""
+        import pandas
+
+        from lc22bench.stats import median_difference
+
+        header = self._name + " - " + "Time per event net of baseline (ns)"
+        print(header)
+        print("".join("-" for i in range(len(header))))
+        raw_median = pandas.Series(self._times_per_event).median()
+        baseline_median = pandas.Series(baseline.times_per_event).median()
+        table = [["Raw", raw_median], ["Baseline", baseline_median]]
+        if len(self._times_per_event) >= 2 and len(baseline.times_per_event) >= 2:
+            net, low, high = median_difference(
+                baseline.times_per_event, self._times_per_event
+            )
+            table.append(
+                ["Net", net, "[{low:.3f}, {high:.3f}]".format(low=low, high=high)]
+            )
+        else:
+            table.append(["Net", raw_median - baseline_median])
+
+        print(
+            tabulate(
+                table, headers=["", "Median", "95% CI"], floatfmt=".3f", missingval=""
+            )
+        )
+
+    def summarize(self) -> None:
+        import pandas
+
+        from lc22bench.histogram import LATENCY_QUANTILES
+        from lc22bench.stats import bootstrap_ci, mad_outliers
+
+        header = self._name + " - " + "Time per event (ns)"
+        print(header)
+        print("".join("-" for i in range(len(header))))
+        print("Points: " + str(self._times_per_event))
+        print(pandas.Series(self._times_per_event).describe())
+
+        if len(self._times_per_event) >= 2:
+            low, high = bootstrap_ci(self._times_per_event)
+            print("Median 95% CI: [{low:.3f}, {high:.3f}]".format(low=low, high=high))
+            outliers = mad_outliers(self._times_per_event)
+            print(
+                "Outliers (MAD): "
+                + str(
+                    [
+                        point
+                        for point, outlier in zip(self._times_per_event, outliers)
+                        if outlier
+                    ]
+                )
+            )
+
+        if self.stop_reason:
+            print("Stopped: " + self.stop_reason)
+        if self.noise_score is not None:
+            print("Noise score: {score:.2f}".format(score=self.noise_score))
+
+        if self._steady_state_times_per_event:
+            header = self._name + " - " + "Steady-state time per event (ns)"
+            print(header)
+            print("".join("-" for i in range(len(header))))
+            print(pandas.Series(self._steady_state_times_per_event).describe())
+
+        if self._setup_times:
+            header = self._name + " - " + "Tracer setup and teardown time (s)"
+            print(header)
+            print("".join("-" for i in range(len(header))))
+            print(
+                pandas.DataFrame(
+                    {
+                        "setup": pandas.Series(self._setup_times, dtype=float),
+                        "teardown": pandas.Series(self._teardown_times, dtype=float),
+                    }
+                ).describe()
+            )
+
+        if self._event_accounting:
+            header = self._name + " - " + "Event accounting"
+            print(header)
+            print("".join("-" for i in range(len(header))))
+            accounting = pandas.DataFrame.from_records(self._event_accounting)
+            print("Emitted events: {:.0f}".format(accounting["emitted_events"].sum()))
+            if accounting["recorded_events"].notna().any():
+                print(
+                    accounting[
+                        [
+                            "loss_ratio",
+                            "recorded_events_per_s",
+                            "consumer_events_per_s",
+                            "consumer_cpu_s",
+                            "consumer_rss_bytes",
+                            "written_mb_per_s",
+                        ]
+                    ]
+                    .astype(float)
+                    .dropna(axis="columns", how="all")
+                    .describe()
+                    .transpose()
+                    .to_string()
+                )
+                discarded_events = accounting["discarded_events"].sum()
+                if discarded_events > 0:
+                    print(
+                        "{discarded_events:.0f} events were discarded or lost".format(
+                            discarded_events=discarded_events
+                        )
+                    )
+            else:
+                print("The tracer doesn't report the events it records")
+            lost_packets = accounting["lost_packets"].sum()
+            if lost_packets > 0:
+                print(
+                    "{lost_packets:.0f} packets were overwritten or lost".format(
+                        lost_packets=lost_packets
+                    )
+                )
+
+        if self._latency_histogram is not None:
+            header = (
+                self._name
+                + " - "
+                + "Latency of sampled {unit}s (ns)".format(unit=self._latency_unit)
+            )
+            print(header)
+            print("".join("-" for i in range(len(header))))
+            quantiles = self._latency_histogram.quantiles_ns(LATENCY_QUANTILES)
+            print(
+                tabulate(
+                    [
+                        [
+                            self._latency_histogram.sample_count,
+                            *quantiles.values(),
+                            self._latency_histogram.max_ns,
+                        ]
+                    ],
+                    headers=["Samples", *quantiles, "max"],
+                    floatfmt=".1f",
+                )
+            )
+
+        if self._counters_per_event:
+            header = self._name + " - " + "Performance counters per event"
+            print(header)
+            print("".join("-" for i in range(len(header))))
+            print(
+                pandas.DataFrame.from_records(self._counters_per_event)
+                .dropna(axis="columns", how="all")
+                .describe()
+            )
+
+        if self._profile:
+            from lc22bench.folded import function_shares
+
+            header = self._name + " - " + "On-CPU profile"
+            print(header)
+            print("".join("-" for i in range(len(header))))
+            print(
+                "{samples} samples, folded stacks saved to {path}".format(
+                    samples=sum(self._profile.values()), path=self.profile_path
+                )
+            )
+            # The workload's threads are always on a CPU, emitting events: the
+            # share of the samples of a function is its share of the time per
+            # event
+            median = pandas.Series(self._times_per_event).median()
+            shares = sorted(
+                function_shares(self._profile).items(),
+                key=lambda item: item[1][0],
+                reverse=True,
+            )
+            print(
+                tabulate(
+                    [
+                        [frame, self_share, inclusive_share, self_share * median]
+                        for frame, (self_share, inclusive_share) in shares[
+                            :PROFILE_TOP_FUNCTIONS
+                        ]
+                        if self_share > 0
+                    ],
+                    headers=["Function", "Self", "Inclusive", "Self (ns/event)"],
+                    floatfmt=["", ".2%", ".2%", ".3f"],
+                )
+            )
+
+
+def _parse_placement(ctx: click.Context, param: click.Parameter, value: str):
+    if value in PLACEMENT_POLICIES:
+        return value
+
+    try:
+        if parse_cpu_list(value):
+            return value
+    except ValueError:
+        pass
+    raise click.BadParameter(
+        "expected one of {policies} or a CPU list".format(
+            policies=", ".join(PLACEMENT_POLICIES)
+        )
+    )
+
+
+def _parse_positive_int_list(ctx: click.Context, param: click.Parameter, value: str):
+    try:
+        values = [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        raise click.BadParameter("expected a comma-separated list of integers")
+
+    if any(item <= 0 for item in values):
+        raise click.BadParameter("values must be positive")
+    return values
+
+
+@click.group()
+@click.option("-d", "--debug", is_flag=True, help="Set logging level to DEBUG")
+@click.option("-w", "--workload", help="Workload binary path")
+@click.option("--lttng-binary-path", help="LTTng binary install path", default="")
+@click.option(
+    "--duration",
+    default=10,
     show_default=True,
     help="Duration (in seconds) during which the benchmark must run per iteration",
     metavar="DURATION",
@@ -479,9 +1522,42 @@ class tracing_benchmark_results:
     "--iteration-count",
     default=10,
     show_default=True,
-    help="Number of iterations of the benchmark to run",
+    help="Number of iterations of the benchmark to run (minimum number of iterations with --adaptive)",
     metavar="ITERATION_COUNT",
 )
+@click.option(
+    "--adaptive",
+    is_flag=True,
+    help="Run iterations until the confidence interval of the median time per event is narrow enough",
+)
+@click.option(
+    "--target-ci-width",
+    default=0.01,
+    show_default=True,
+    help="With --adaptive, stop once the width of the confidence interval of the median is within WIDTH of the median",
+    metavar="WIDTH",
+)
+@click.option(
+    "--confidence",
+    default=0.95,
+    show_default=True,
+    help="Confidence level of the interval used by --adaptive",
+    metavar="LEVEL",
+)
+@click.option(
+    "--max-iterations",
+    default=200,
+    show_default=True,
+    help="With --adaptive, never run more than MAX_ITERATIONS iterations",
+    metavar="MAX_ITERATIONS",
+)
+@click.option(
+    "--time-budget",
+    default=0,
+    show_default=True,
+    help="With --adaptive, stop starting new iterations after BUDGET seconds (0 for no budget)",
+    metavar="BUDGET",
+)
 @click.option(
     "--thread-count",
     default=os.cpu_count(),
@@ -489,6 +1565,143 @@ class tracing_benchmark_results:
     help="Number of threads to use during workload",
     metavar="THREAD_COUNT",
 )
+@click.option(
+    "--threads",
+    default="",
+    callback=_parse_positive_int_list,
+    help="Comma-separated thread counts to sweep, e.g. 1,2,4,8 (overrides --thread-count); reports the scalability of every scenario",
+    metavar="THREAD_COUNTS",
+)
+@click.option(
+    "--efficiency-threshold",
+    default=0.8,
+    show_default=True,
+    help="With --threads, flag the thread count at which the parallel efficiency falls below THRESHOLD",
+    metavar="THRESHOLD",
+)
+@click.option(
+    "--placement",
+    default="ordered",
+    show_default=True,
+    callback=_parse_placement,
+    help="Placement of the workload's threads on the allowed CPUs: ordered (by CPU id), compact (fill SMT siblings first), spread (across NUMA nodes, one per core first), core (one per physical core) or a CPU list such as 0-3,8",
+    metavar="POLICY",
+)
+@click.option(
+    "--subtract-baseline",
+    is_flag=True,
+    help="Also run the baseline of each scenario (its workload without tracing) with the same settings, and report the time per event net of it",
+)
+@click.option(
+    "--warm-session",
+    is_flag=True,
+    help="Set up the tracer once per scenario and only clear its buffers or maps between iterations",
+)
+@click.option(
+    "--cold-restart-interval",
+    default=0,
+    show_default=True,
+    help="With --warm-session, tear down and set up the tracer again every RESTART_INTERVAL iterations (0 to never restart)",
+    metavar="RESTART_INTERVAL",
+)
+@click.option(
+    "--ebpf-cache-dir",
+    default=default_cache_dir(),
+    show_default=True,
+    help="Directory in which compiled eBPF programs are cached",
+    metavar="CACHE_DIR",
+)
+@click.option(
+    "--ebpf-cache-size",
+    default="64M",
+    show_default=True,
+    help="Evict the least recently used compiled eBPF programs beyond CACHE_SIZE bytes",
+    metavar="CACHE_SIZE",
+)
+@click.option(
+    "--no-ebpf-cache",
+    is_flag=True,
+    help="Compile eBPF programs on every iteration instead of using the cache",
+)
+@click.option(
+    "--telemetry-interval",
+    default=10,
+    show_default=True,
+    help="Interval (in milliseconds) at which the workload samples its per-thread event counters",
+    metavar="INTERVAL_MS",
+)
+@click.option(
+    "--latency-sample-period",
+    default=0,
+    show_default=True,
+    help="Time every PERIOD-th event (every PERIOD-th write for kernel scenarios) of each workload thread and report the latency percentiles (0 to never)",
+    metavar="PERIOD",
+)
+@click.option(
+    "--warmup",
+    default=1.0,
+    show_default=True,
+    help="Time (in seconds) excluded at the start of each iteration when computing the steady-state time per event",
+    metavar="WARMUP",
+)
+@click.option(
+    "--cooldown",
+    default=0.5,
+    show_default=True,
+    help="Time (in seconds) excluded at the end of each iteration when computing the steady-state time per event",
+    metavar="COOLDOWN",
+)
+@click.option(
+    "--loss-tolerance",
+    default=0.001,
+    show_default=True,
+    help="Fail if the events recorded by the tracer and emitted by the workload differ by more than TOLERANCE (relative to the emitted events)",
+    metavar="TOLERANCE",
+)
+@click.option(
+    "--no-perf-counters",
+    is_flag=True,
+    help="Don't count hardware and software performance events during each iteration",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Sample the workload's user and kernel stacks during each iteration and save the folded stacks of every scenario along with its results (the sampling adds to the time per event)",
+)
+@click.option(
+    "--profile-frequency",
+    type=click.IntRange(min=1),
+    default=999,
+    show_default=True,
+    help="With --profile, sample the stacks FREQUENCY times per second on each CPU",
+    metavar="FREQUENCY",
+)
+@click.option(
+    "--no-preflight",
+    is_flag=True,
+    help="Don't fingerprint the host and check it for sources of noise before each scenario",
+)
+@click.option(
+    "--max-noise-score",
+    default=1.0,
+    show_default=True,
+    help="Refuse to run a scenario when the noise score of the host (0 for a quiet host, 1 for the noisiest) exceeds SCORE",
+    metavar="SCORE",
+)
+@click.option(
+    "--results-dir",
+    default="bench-results",
+    show_default=True,
+    help="Directory in which the record of every iteration is saved",
+    metavar="RESULTS_DIR",
+)
+@click.option(
+    "--results-format",
+    type=click.Choice(["auto", "arrow", "jsonl"]),
+    default="auto",
+    show_default=True,
+    help="Format of saved results (auto uses Arrow IPC if pyarrow is installed, JSON lines otherwise)",
+)
 @click.pass_context
 def cli(
     ctx: click.Context,
@@ -496,8 +1709,34 @@ def cli(
     workload: str,
     duration: int,
     iteration_count: int,
+    adaptive: bool,
+    target_ci_width: float,
+    confidence: float,
+    max_iterations: int,
+    time_budget: int,
     thread_count: int,
+    threads: list[int],
+    efficiency_threshold: float,
+    placement: str,
+    subtract_baseline: bool,
     lttng_binary_path: str,
+    warm_session: bool,
+    cold_restart_interval: int,
+    ebpf_cache_dir: str,
+    ebpf_cache_size: str,
+    no_ebpf_cache: bool,
+    telemetry_interval: int,
+    latency_sample_period: int,
+    warmup: float,
+    cooldown: float,
+    loss_tolerance: float,
+    no_perf_counters: bool,
+    profile: bool,
+    profile_frequency: int,
+    no_preflight: bool,
+    max_noise_score: float,
+    results_dir: str,
+    results_format: str,
 ) -> None:
     """
     bench can run a number of benchmarks presented as part of my talk given at
@@ -507,60 +1746,817 @@ def cli(
 
     Use --help on any of the commands for more information on their role and options.
     """
+    from humanfriendly import parse_size
+
+    from lc22bench.stats import adaptive_stopping_rule
+
     logging.basicConfig(level=logging.DEBUG if debug else logging.INFO)
+    # Unwind the tracers' teardown when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
     ctx.ensure_object(dict)
     ctx.obj["workload_path"] = workload
     ctx.obj["duration_s"] = duration
-    ctx.obj["thread_count"] = thread_count
+    ctx.obj["thread_counts"] = threads or [thread_count]
+    ctx.obj["efficiency_threshold"] = efficiency_threshold
+    ctx.obj["subtract_baseline"] = subtract_baseline
     ctx.obj["iteration_count"] = iteration_count
+    ctx.obj["stopping_rule"] = (
+        adaptive_stopping_rule(
+            target_ci_width,
+            iteration_count,
+            max(iteration_count, max_iterations),
+            time_budget,
+            confidence,
+        )
+        if adaptive
+        else None
+    )
     ctx.obj["lttng_binary_path"] = lttng_binary_path
+    ctx.obj["warm_session"] = warm_session
+    ctx.obj["cold_restart_interval"] = cold_restart_interval
+    ctx.obj["ebpf_cache"] = ebpf_object_cache(
+        ebpf_cache_dir, parse_size(ebpf_cache_size, binary=True)
+    )
+    ctx.obj["use_ebpf_cache"] = not no_ebpf_cache
+    ctx.obj["workload_options"] = {
+        "telemetry-interval-ms": telemetry_interval,
+        "placement": placement,
+        "latency-sample-period": latency_sample_period,
+    }
+    ctx.obj["warmup_ns"] = int(warmup * 1e9)
+    ctx.obj["cooldown_ns"] = int(cooldown * 1e9)
+    ctx.obj["loss_tolerance"] = loss_tolerance
+    ctx.obj["use_perf_counters"] = not no_perf_counters
+    ctx.obj["profile_frequency"] = profile_frequency if profile else None
+    ctx.obj["preflight"] = not no_preflight
+    ctx.obj["max_noise_score"] = max_noise_score
+    try:
+        ctx.obj["results_store"] = results_store(results_dir, results_format)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="'--results-format'")
+
+
+def _open_perf_counters(ctx: click.Context) -> Optional[perf_counters]:
+    if not ctx.obj["use_perf_counters"]:
+        return None
+
+    # The workload inherits this process' CPU affinity
+    try:
+        return perf_counters(sorted(os.sched_getaffinity(0)))
+    except OSError as e:
+        logger.warning("Performance counters are unavailable: " + str(e))
+        return None
+
+
+def _open_profiler(ctx: click.Context) -> Optional["stack_profiler"]:
+    if ctx.obj["profile_frequency"] is None:
+        return None
+
+    from lc22bench.profiler import stack_profiler
+
+    return stack_profiler(ctx.obj["profile_frequency"])
+
+
+def _run_preflight(ctx: click.Context) -> dict:
+    from lc22bench.preflight import check_noise, environment_fingerprint, noise_score
+
+    # The workload inherits this process' CPU affinity
+    findings = check_noise(sorted(os.sched_getaffinity(0)))
+    for finding in findings:
+        if finding.noisy:
+            logger.warning(
+                "Noise source ({check}): {detail}".format(
+                    check=finding.check, detail=finding.detail
+                )
+            )
+
+    return {
+        "noise_score": noise_score(findings),
+        "fingerprint": environment_fingerprint(
+            ctx.obj["workload_path"], ctx.obj["lttng_binary_path"]
+        ),
+        "findings": [finding.to_dict() for finding in findings],
+    }
+
+
+def _run_iterations(
+    ctx: click.Context,
+    results: tracing_benchmark_results,
+    make_benchmark: Callable[[], benchmark],
+    workload_options: Optional[dict] = None,
+    loss_tolerance: Optional[float] = None,
+) -> None:
+    if not ctx.obj["workload_path"]:
+        raise click.UsageError("Missing option '-w' / '--workload'.")
+
+    preflight = None
+    if ctx.obj["preflight"]:
+        preflight = _run_preflight(ctx)
+        results.noise_score = preflight["noise_score"]
+        if preflight["noise_score"] > ctx.obj["max_noise_score"]:
+            raise click.ClickException(
+                "The noise score of the host ({score:.2f}) exceeds --max-noise-score ({max:.2f})".format(
+                    score=preflight["noise_score"], max=ctx.obj["max_noise_score"]
+                )
+            )
+
+    warm_session = ctx.obj["warm_session"]
+    cold_restart_interval = ctx.obj["cold_restart_interval"]
+    store = ctx.obj["results_store"]
+    stopping_rule = ctx.obj["stopping_rule"]
+    workload_options = {**ctx.obj["workload_options"], **(workload_options or {})}
+    if loss_tolerance is None:
+        loss_tolerance = ctx.obj["loss_tolerance"]
+    current_benchmark = None
+
+    iteration_limit = (
+        stopping_rule.max_iterations if stopping_rule else ctx.obj["iteration_count"]
+    )
+    run_start_time = time()
+    run_writer = store.open_run(results.run_id)
+    counters = _open_perf_counters(ctx)
+    profiler = _open_profiler(ctx)
+    # Closes the performance counters and the profiler once the run is over
+    instruments = contextlib.ExitStack()
+    for instrument in (counters, profiler):
+        if instrument is not None:
+            instruments.enter_context(instrument)
+    # Holds the current tracer, so that it is torn down even if an iteration fails
+    tracer = contextlib.ExitStack()
+    with run_writer, instruments, tracer, click.progressbar(
+        range(iteration_limit)
+    ) as bar_wrapper:
+        for i in bar_wrapper:
+            if current_benchmark is None:
+                cold_start = True
+                setup_start = perf_counter()
+                current_benchmark = tracer.enter_context(make_benchmark())
+                setup_time_s = perf_counter() - setup_start
+                results.add_setup_time(setup_time_s)
+            else:
+                cold_start = False
+                setup_time_s = None
+                current_benchmark.reset()
+
+            start_time = time()
+            current_benchmark.run(workload_options, counters, profiler)
+            end_time = time()
+
+            results.add_per_event_time(current_benchmark.result)
+            if current_benchmark.latency_histogram is not None:
+                results.add_latency_histogram(
+                    current_benchmark.latency_histogram,
+                    current_benchmark.latency_unit,
+                )
+            if current_benchmark.profile is not None:
+                results.add_profile(current_benchmark.profile)
+            if current_benchmark.counters is not None:
+                results.add_counters_per_event(
+                    per_event(
+                        current_benchmark.counters,
+                        int(current_benchmark.telemetry.per_thread_event_counts.sum()),
+                    )
+                )
+            try:
+                steady_state_ns_per_event = (
+                    current_benchmark.telemetry.steady_state_ns_per_event(
+                        ctx.obj["warmup_ns"], ctx.obj["cooldown_ns"]
+                    )
+                )
+                results.add_steady_state_per_event_time(steady_state_ns_per_event)
+            except ValueError as e:
+                logger.warning("No steady-state time per event: " + str(e))
+                steady_state_ns_per_event = None
+
+            if stopping_rule is not None:
+                results.stop_reason = stopping_rule.stop_reason(
+                    results.times_per_event, time() - run_start_time
+                )
+
+            record = results.iteration_record(
+                ctx,
+                i,
+                cold_start,
+                current_benchmark,
+                steady_state_ns_per_event,
+                start_time,
+                end_time,
+            )
+            store.append_telemetry(run_writer, i, current_benchmark.telemetry)
+            record["setup_time_s"] = setup_time_s
+            if preflight is not None:
+                record["noise_score"] = preflight["noise_score"]
+                record["preflight"] = preflight
+            event_accounting = current_benchmark.event_accounting
+            results.add_event_accounting(event_accounting)
+
+            # Tear the tracer down after its last iteration so that the
+            # teardown time is saved along with that iteration
+            if (
+                results.stop_reason
+                or i == iteration_limit - 1
+                or not warm_session
+                or (cold_restart_interval > 0 and (i + 1) % cold_restart_interval == 0)
+            ):
+                teardown_start = perf_counter()
+                tracer.close()
+                current_benchmark = None
+                record["teardown_time_s"] = perf_counter() - teardown_start
+                results.add_teardown_time(record["teardown_time_s"])
+
+            store.append(run_writer, record)
+
+            if event_accounting["unaccounted_events"]:
+                logger.warning(
+                    "Iteration {i}: {unaccounted} events are neither recorded nor reported as discarded".format(
+                        i=i, unaccounted=event_accounting["unaccounted_events"]
+                    )
+                )
+
+            loss_ratio = event_accounting["loss_ratio"]
+            if (
+                loss_ratio is None
+                and event_accounting["lost_packets"]
+                and loss_tolerance < 1
+            ):
+                # Events were lost, but the tracer can't tell how many
+                raise click.ClickException(
+                    "Iteration {i}: {lost_packets} packets were overwritten or lost".format(
+                        i=i, lost_packets=event_accounting["lost_packets"]
+                    )
+                )
+            if loss_ratio is not None and abs(loss_ratio) > loss_tolerance:
+                raise click.ClickException(
+                    "Iteration {i}: {recorded} events recorded out of {emitted} emitted ({loss_ratio:.3%} lost)".format(
+                        i=i,
+                        recorded=event_accounting["recorded_events"],
+                        emitted=event_accounting["emitted_events"],
+                        loss_ratio=loss_ratio,
+                    )
+                )
+
+            if results.stop_reason:
+                break
+
+    if results.stop_reason is None:
+        results.stop_reason = "completed {count} iterations".format(
+            count=len(results.times_per_event)
+        )
+
+    if results.profile:
+        from lc22bench.folded import write_folded
+
+        results.profile_path = os.path.join(store.path, results.run_id + ".folded")
+        write_folded(results.profile_path, results.profile)
+
+
+_batch_sizes_option = click.option(
+    "--batch-sizes",
+    default="",
+    callback=_parse_positive_int_list,
+    help="Comma-separated numbers of events emitted by each write of the kernel workload (10000 if unset); with several, also fit the per-write and per-event costs",
+    metavar="BATCH_SIZES",
+)
+
+_output_dir_option = click.option(
+    "--output-dir",
+    type=click.Path(exists=True, file_okay=False),
+    help="Stream the trace to a directory created in OUTPUT_DIR (on a tmpfs or a disk) instead of keeping it in a snapshot session's buffers; reports the consumer daemon's CPU time and RSS and the trace's throughput",
+    metavar="OUTPUT_DIR",
+)
+_read_timer_option = click.option(
+    "--read-timer",
+    type=int,
+    help="Interval (in microseconds) at which the consumer daemon checks for sub-buffers to consume (LTTng's default if unset: 200000 for the kernel, 0, i.e. on wake-up by the application, for userspace)",
+    metavar="INTERVAL_US",
+)
+
+
+def _ringbuffer_output(
+    name: str,
+    parameters: dict,
+    output_dir: Optional[str],
+    output_type: str,
+    read_timer: Optional[int],
+) -> tuple[str, dict]:
+    # Parameters of the ring buffer scenarios that aren't snapshot defaults
+    if output_dir is None:
+        if output_type != "mmap":
+            raise click.BadParameter(
+                "snapshot sessions only support mmap output, pass --output-dir to stream the trace",
+                param_hint="'--output-type'",
+            )
+    else:
+        name += ", streamed to {output_dir} ({output_type})".format(
+            output_dir=output_dir, output_type=output_type
+        )
+        parameters = {
+            **parameters,
+            "output_dir": output_dir,
+            "output_type": output_type,
+        }
+    if read_timer is not None:
+        name += ", read timer {read_timer} us".format(read_timer=read_timer)
+        parameters = {**parameters, "read_timer_interval_us": read_timer}
+    return name, parameters
+
+
+# Baseline of each tracer scenario: the same workload, without tracing
+BASELINE_SCENARIOS = {
+    "ebpf-keyed-map": "baseline-kernel",
+    "ebpf-map": "baseline-kernel",
+    "ebpf-perfbuf": "baseline-kernel",
+    "ebpf-ringbuf": "baseline-kernel",
+    "lttng-kernel-map": "baseline-kernel",
+    "lttng-kernel-ringbuffer": "baseline-kernel",
+    "lttng-ust-map": "baseline-ust",
+    "lttng-ust-ringbuffer": "baseline-ust",
+}
+BASELINE_NAMES = {
+    "baseline-kernel": "Kernel tracepoint without probe",
+    "baseline-ust": "UST tracepoint not enabled",
+    "baseline-empty": "Empty workload loop",
+}
+
+
+def make_baseline_benchmark(
+    ctx: click.Context, baseline: str, thread_count: int
+) -> benchmark:
+    benchmark_class = {
+        "baseline-kernel": kernel_benchmark,
+        "baseline-ust": userspace_benchmark,
+        "baseline-empty": empty_loop_benchmark,
+    }[baseline]
+    return benchmark_class(
+        ctx.obj["workload_path"], thread_count, ctx.obj["duration_s"]
+    )
+
+
+def _run_scenario(
+    ctx: click.Context,
+    name: str,
+    scenario: str,
+    parameters: dict,
+    make_benchmark: Callable[[int], benchmark],
+    batch_sizes: Optional[list[int]] = None,
+) -> dict[tuple[int, Optional[int]], list[float]]:
+    """
+    Run a scenario once for every thread count and batch size swept, then
+    summarize the sweeps. `make_benchmark` is passed the thread count.
+    Returns the times per event of every (thread count, batch size).
+    """
+    thread_counts = ctx.obj["thread_counts"]
+    batch_sizes = batch_sizes or []
+    baseline = (
+        BASELINE_SCENARIOS.get(scenario) if ctx.obj["subtract_baseline"] else None
+    )
+    sweep = {}
+    for thread_count in thread_counts:
+        for batch_size in batch_sizes or [None]:
+            labels = []
+            point_parameters = {}
+            workload_options = {}
+            if len(thread_counts) > 1:
+                labels.append("{count} threads".format(count=thread_count))
+            if batch_size is not None:
+                labels.append("batch size {batch_size}".format(batch_size=batch_size))
+                point_parameters = {"batch_size": batch_size}
+                workload_options = {"batch-size": batch_size}
+            suffix = " (" + ", ".join(labels) + ")" if labels else ""
+
+            # The baseline runs with the same thread count, batch size and
+            # global options as the scenario
+            baseline_results = None
+            if baseline is not None:
+                baseline_results = tracing_benchmark_results(
+                    BASELINE_NAMES[baseline] + suffix, baseline, point_parameters
+                )
+                _run_iterations(
+                    ctx,
+                    baseline_results,
+                    lambda: make_baseline_benchmark(ctx, baseline, thread_count),
+                    workload_options,
+                )
+                baseline_results.summarize()
+
+            results = tracing_benchmark_results(
+                name + suffix, scenario, {**parameters, **point_parameters}
+            )
+            _run_iterations(
+                ctx, results, lambda: make_benchmark(thread_count), workload_options
+            )
+            results.summarize()
+            if baseline_results is not None:
+                results.summarize_net(baseline_results)
+            sweep[thread_count, batch_size] = results.times_per_event
+
+    if len(batch_sizes) > 1:
+        for thread_count in thread_counts:
+            _summarize_batch_size_sweep(
+                name
+                + (
+                    " ({count} threads)".format(count=thread_count)
+                    if len(thread_counts) > 1
+                    else ""
+                ),
+                [
+                    (batch_size, sweep[thread_count, batch_size])
+                    for batch_size in batch_sizes
+                ],
+            )
+
+    if len(thread_counts) > 1:
+        for batch_size in batch_sizes or [None]:
+            _summarize_scalability(
+                name
+                + (
+                    " (batch size {batch_size})".format(batch_size=batch_size)
+                    if batch_size is not None
+                    else ""
+                ),
+                [
+                    (thread_count, sweep[thread_count, batch_size])
+                    for thread_count in thread_counts
+                ],
+                ctx.obj["efficiency_threshold"],
+            )
+
+    return sweep
+
+
+def _summarize_scalability(
+    name: str, sweep: list[tuple[int, list[float]]], efficiency_threshold: float
+):
+    """
+    Every thread of the workload emits events back to back, so that its time
+    per event is the inverse of its throughput. Parallel efficiency is the
+    throughput per thread relative to that of the smallest thread count: it
+    stays close to 1 as long as the tracer's per-thread (or per-CPU) state
+    keeps threads from contending.
+    """
+    import pandas
+
+    header = name + " - " + "Scalability"
+    print(header)
+    print("".join("-" for i in range(len(header))))
+
+    sweep = sorted(sweep)
+    base_thread_count, base_points = sweep[0]
+    base_median = pandas.Series(base_points).median()
+    table = []
+    contention_thread_count = None
+    for thread_count, points in sweep:
+        median = pandas.Series(points).median()
+        efficiency = base_median / median
+        if efficiency < efficiency_threshold and contention_thread_count is None:
+            contention_thread_count = thread_count
+        table.append(
+            [
+                thread_count,
+                median,
+                thread_count * 1e9 / median,
+                efficiency,
+                "#" * round(40 * min(efficiency, 1.0)),
+            ]
+        )
+
+    print(
+        tabulate(
+            table,
+            headers=[
+                "Threads",
+                "Median (ns/event)",
+                "Events/s",
+                "Efficiency",
+                "",
+            ],
+            floatfmt=["", ".3f", ".0f", ".3f", ""],
+        )
+    )
+    if contention_thread_count is not None:
+        print(
+            "Contention: parallel efficiency falls below {threshold:.0%} at {count} threads".format(
+                threshold=efficiency_threshold, count=contention_thread_count
+            )
+        )
+    else:
+        print(
+            "No contention: parallel efficiency stays above {threshold:.0%} up to {count} threads".format(
+                threshold=efficiency_threshold, count=sweep[-1][0]
+            )
+        )
+
+
+def _summarize_batch_size_sweep(name: str, sweep: list[tuple[int, list[float]]]):
+    """
+    Separate the fixed cost of each write to the kernel workload's proc file
+    (system call, copy of the batch size) from the cost of each event, which
+    the time per event reported by the workload amortizes over a batch:
+    ns_per_event = per_event_cost + per_write_cost / batch_size.
+    """
+    import pandas
+
+    from lc22bench.stats import linear_fit
+
+    header = name + " - " + "Batch size sweep"
+    print(header)
+    print("".join("-" for i in range(len(header))))
+    print(
+        tabulate(
+            [
+                [
+                    batch_size,
+                    len(points),
+                    pandas.Series(points).median(),
+                    pandas.Series(points).median() * batch_size,
+                ]
+                for batch_size, points in sweep
+            ],
+            headers=[
+                "Batch size",
+                "Iterations",
+                "Median (ns/event)",
+                "Median (ns/write)",
+            ],
+            floatfmt=".3f",
+        )
+    )
+
+    x = [1.0 / batch_size for batch_size, points in sweep for point in points]
+    y = [point for batch_size, points in sweep for point in points]
+    try:
+        fit = linear_fit(x, y)
+    except ValueError as e:
+        logger.warning("Can't fit the batch size sweep: " + str(e))
+        return
+
+    print(
+        "Per-event cost: {value:.3f} ns, 95% CI [{low:.3f}, {high:.3f}]".format(
+            value=fit["intercept"],
+            low=fit["intercept_ci"][0],
+            high=fit["intercept_ci"][1],
+        )
+    )
+    print(
+        "Per-write cost: {value:.1f} ns, 95% CI [{low:.1f}, {high:.1f}]".format(
+            value=fit["slope"], low=fit["slope_ci"][0], high=fit["slope_ci"][1]
+        )
+    )
+
+
+def _summarize_key_count_sweep(name: str, sweep: list[tuple[int, list[float]]]):
+    # Cost of each key count relative to the smallest one
+    import pandas
+
+    header = name + " - " + "Key count sweep"
+    print(header)
+    print("".join("-" for i in range(len(header))))
+
+    sweep = sorted(sweep)
+    base_median = pandas.Series(sweep[0][1]).median()
+    medians = [pandas.Series(points).median() for _, points in sweep]
+    print(
+        tabulate(
+            [
+                [
+                    key_count,
+                    len(points),
+                    median,
+                    median / base_median,
+                    "#" * round(40 * median / max(medians)),
+                ]
+                for (key_count, points), median in zip(sweep, medians)
+            ],
+            headers=[
+                "Keys",
+                "Iterations",
+                "Median (ns/event)",
+                "Relative cost",
+                "",
+            ],
+            floatfmt=["", "", ".3f", ".3f", ""],
+        )
+    )
 
 
 @cli.command(
     name="ebpf-map",
     short_help="Trace to an eBPF per-CPU array and estimate the per-event overhead",
 )
+@_batch_sizes_option
 @click.pass_context
-def run_ebpf_map_benchmark(ctx: click.Context):
-    results = tracing_benchmark_results("eBPF per-cpu array")
+def run_ebpf_map_benchmark(ctx: click.Context, batch_sizes: list[int]):
+    _run_scenario(
+        ctx,
+        "eBPF per-cpu array",
+        "ebpf-map",
+        {},
+        lambda thread_count: ebpf_map_benchmark(
+            ctx.obj["workload_path"],
+            thread_count,
+            ctx.obj["duration_s"],
+            ctx.obj["ebpf_cache"] if ctx.obj["use_ebpf_cache"] else None,
+        ),
+        batch_sizes,
+    )
 
-    with click.progressbar(range(ctx.obj["iteration_count"])) as bar_wrapper:
-        for i in bar_wrapper:
-            benchmark = ebpf_map_benchmark(
+
+@cli.command(
+    name="ebpf-keyed-map",
+    short_help="Count events per key in an eBPF map and estimate the per-event overhead as the number of keys grows",
+)
+@click.option(
+    "--map-type",
+    type=click.Choice(list(ebpf_keyed_map_benchmark._MAPS)),
+    default="percpu-array",
+    show_default=True,
+    help="Type of the map",
+)
+@click.option(
+    "--key-counts",
+    default="1,16,256,4096,65536",
+    show_default=True,
+    callback=_parse_positive_int_list,
+    help="Comma-separated numbers of distinct keys to sweep, up to {max}".format(
+        max=MAX_KEY_COUNT
+    ),
+    metavar="KEY_COUNTS",
+)
+@click.option(
+    "--key-distribution",
+    type=click.Choice(KEY_DISTRIBUTIONS),
+    default="uniform",
+    show_default=True,
+    help="Distribution of the key of each event",
+)
+@_batch_sizes_option
+@click.pass_context
+def run_ebpf_keyed_map_benchmark(
+    ctx: click.Context,
+    map_type: str,
+    key_counts: list[int],
+    key_distribution: str,
+    batch_sizes: list[int],
+):
+    if any(key_count > MAX_KEY_COUNT for key_count in key_counts):
+        raise click.BadParameter(
+            "at most {max} keys".format(max=MAX_KEY_COUNT), param_hint="--key-counts"
+        )
+
+    name = "eBPF {map_type} map ({key_distribution} keys)".format(
+        map_type=map_type, key_distribution=key_distribution
+    )
+    sweeps = {}
+    for key_count in key_counts:
+        sweep = _run_scenario(
+            ctx,
+            "{name}, {key_count} keys".format(name=name, key_count=key_count),
+            "ebpf-keyed-map",
+            {
+                "map_type": map_type,
+                "key_count": key_count,
+                "key_distribution": key_distribution,
+            },
+            lambda thread_count: ebpf_keyed_map_benchmark(
                 ctx.obj["workload_path"],
-                ctx.obj["thread_count"],
+                thread_count,
                 ctx.obj["duration_s"],
+                map_type,
+                key_count,
+                key_distribution,
+                ctx.obj["ebpf_cache"] if ctx.obj["use_ebpf_cache"] else None,
+            ),
+            batch_sizes,
+        )
+        for point, times_per_event in sweep.items():
+            sweeps.setdefault(point, []).append((key_count, times_per_event))
+
+    if len(key_counts) > 1:
+        for (thread_count, batch_size), sweep in sweeps.items():
+            labels = []
+            if len(ctx.obj["thread_counts"]) > 1:
+                labels.append("{count} threads".format(count=thread_count))
+            if batch_size is not None:
+                labels.append("batch size {batch_size}".format(batch_size=batch_size))
+            _summarize_key_count_sweep(
+                name + (" (" + ", ".join(labels) + ")" if labels else ""), sweep
             )
 
-            benchmark.run()
-            results.add_per_event_time(benchmark.result)
-            del benchmark
 
-    results.summarize()
+@cli.command(
+    name="ebpf-ringbuf",
+    short_help="Stream to an eBPF ring buffer drained during the run and estimate the per-event overhead",
+)
+@click.option(
+    "--subbuf-size",
+    default="4K",
+    show_default=True,
+    help="Size buffers like LTTng sub-buffers of SUBBUF_SIZE bytes",
+    metavar="SUBBUF_SIZE",
+)
+@click.option(
+    "--num-subbuf",
+    default=4,
+    show_default=True,
+    help="Size buffers like SUBBUF_COUNT LTTng sub-buffers per CPU",
+    metavar="SUBBUF_COUNT",
+)
+@_batch_sizes_option
+@click.pass_context
+def run_ebpf_ringbuf_benchmark(
+    ctx: click.Context, subbuf_size: str, num_subbuf: int, batch_sizes: list[int]
+):
+    from humanfriendly import parse_size
+
+    _run_scenario(
+        ctx,
+        "eBPF ring buffer ({num_subbuf} * {subbuf_size} per CPU)".format(
+            num_subbuf=num_subbuf, subbuf_size=subbuf_size
+        ),
+        "ebpf-ringbuf",
+        {
+            "num_subbuf": num_subbuf,
+            "subbuf_size": parse_size(subbuf_size, binary=True),
+        },
+        lambda thread_count: ebpf_ringbuf_benchmark(
+            ctx.obj["workload_path"],
+            thread_count,
+            ctx.obj["duration_s"],
+            num_subbuf,
+            parse_size(subbuf_size, binary=True),
+            ctx.obj["ebpf_cache"] if ctx.obj["use_ebpf_cache"] else None,
+        ),
+        batch_sizes,
+    )
+
+
+@cli.command(
+    name="ebpf-perfbuf",
+    short_help="Stream to eBPF per-CPU perf buffers drained during the run and estimate the per-event overhead",
+)
+@click.option(
+    "--subbuf-size",
+    default="4K",
+    show_default=True,
+    help="Size buffers like LTTng sub-buffers of SUBBUF_SIZE bytes",
+    metavar="SUBBUF_SIZE",
+)
+@click.option(
+    "--num-subbuf",
+    default=4,
+    show_default=True,
+    help="Size buffers like SUBBUF_COUNT LTTng sub-buffers per CPU",
+    metavar="SUBBUF_COUNT",
+)
+@_batch_sizes_option
+@click.pass_context
+def run_ebpf_perfbuf_benchmark(
+    ctx: click.Context, subbuf_size: str, num_subbuf: int, batch_sizes: list[int]
+):
+    from humanfriendly import parse_size
+
+    _run_scenario(
+        ctx,
+        "eBPF perf buffer ({num_subbuf} * {subbuf_size} per CPU)".format(
+            num_subbuf=num_subbuf, subbuf_size=subbuf_size
+        ),
+        "ebpf-perfbuf",
+        {
+            "num_subbuf": num_subbuf,
+            "subbuf_size": parse_size(subbuf_size, binary=True),
+        },
+        lambda thread_count: ebpf_perfbuf_benchmark(
+            ctx.obj["workload_path"],
+            thread_count,
+            ctx.obj["duration_s"],
+            num_subbuf,
+            parse_size(subbuf_size, binary=True),
+            ctx.obj["ebpf_cache"] if ctx.obj["use_ebpf_cache"] else None,
+        ),
+        batch_sizes,
+    )
 
 
 @cli.command(
     name="lttng-kernel-map",
     short_help="Trace to an LTTng-modules per-CPU map and estimate the per-event overhead",
 )
+@_batch_sizes_option
 @click.pass_context
-def run_lttng_kernel_map_benchmark(ctx: click.Context):
-    results = tracing_benchmark_results("LTTng kernel map")
-
-    with click.progressbar(range(ctx.obj["iteration_count"])) as bar_wrapper:
-        for i in bar_wrapper:
-            benchmark = lttng_kernel_map_benchmark(
-                ctx.obj["lttng_binary_path"],
-                ctx.obj["workload_path"],
-                ctx.obj["thread_count"],
-                ctx.obj["duration_s"],
-            )
-
-            benchmark.run()
-            results.add_per_event_time(benchmark.result)
-            del benchmark
-
-    results.summarize()
+def run_lttng_kernel_map_benchmark(ctx: click.Context, batch_sizes: list[int]):
+    _run_scenario(
+        ctx,
+        "LTTng kernel map",
+        "lttng-kernel-map",
+        {},
+        lambda thread_count: lttng_kernel_map_benchmark(
+            ctx.obj["lttng_binary_path"],
+            ctx.obj["workload_path"],
+            thread_count,
+            ctx.obj["duration_s"],
+        ),
+        batch_sizes,
+    )
 
 
 @cli.command(
@@ -581,32 +2577,58 @@ def run_lttng_kernel_map_benchmark(ctx: click.Context):
     help="Use SUBBUF_COUNT sub-buffers per ring buffer",
     metavar="SUBBUF_COUNT",
 )
+@_output_dir_option
+@click.option(
+    "--output-type",
+    type=click.Choice(["mmap", "splice"]),
+    default="mmap",
+    show_default=True,
+    help="How the consumer daemon reads the sub-buffers it streams",
+)
+@_read_timer_option
+@_batch_sizes_option
 @click.pass_context
 def run_lttng_kernel_ringbuffer_benchmark(
-    ctx: click.Context, subbuf_size: str, num_subbuf: int
+    ctx: click.Context,
+    subbuf_size: str,
+    num_subbuf: int,
+    output_dir: Optional[str],
+    output_type: str,
+    read_timer: Optional[int],
+    batch_sizes: list[int],
 ):
-    results = tracing_benchmark_results(
+    from humanfriendly import parse_size
+
+    name, parameters = _ringbuffer_output(
         "LTTng kernel ring buffer ({num_subbuf} * {subbuf_size})".format(
             num_subbuf=num_subbuf, subbuf_size=subbuf_size
-        )
+        ),
+        {
+            "num_subbuf": num_subbuf,
+            "subbuf_size": parse_size(subbuf_size, binary=True),
+        },
+        output_dir,
+        output_type,
+        read_timer,
+    )
+    _run_scenario(
+        ctx,
+        name,
+        "lttng-kernel-ringbuffer",
+        parameters,
+        lambda thread_count: lttng_kernel_ringbuffer_benchmark(
+            ctx.obj["lttng_binary_path"],
+            ctx.obj["workload_path"],
+            thread_count,
+            ctx.obj["duration_s"],
+            num_subbuf,
+            parse_size(subbuf_size, binary=True),
+            output_dir,
+            output_type,
+            read_timer,
+        ),
+        batch_sizes,
     )
-
-    with click.progressbar(range(ctx.obj["iteration_count"])) as bar_wrapper:
-        for i in bar_wrapper:
-            benchmark = lttng_kernel_ringbuffer_benchmark(
-                ctx.obj["lttng_binary_path"],
-                ctx.obj["workload_path"],
-                ctx.obj["thread_count"],
-                ctx.obj["duration_s"],
-                num_subbuf,
-                parse_size(subbuf_size, binary=True),
-            )
-
-            benchmark.run()
-            results.add_per_event_time(benchmark.result)
-            del benchmark
-
-    results.summarize()
 
 
 @cli.command(
@@ -615,21 +2637,18 @@ def run_lttng_kernel_ringbuffer_benchmark(
 )
 @click.pass_context
 def run_lttng_ust_map_benchmark(ctx: click.Context):
-    results = tracing_benchmark_results("LTTng userspace map")
-
-    with click.progressbar(range(ctx.obj["iteration_count"])) as bar_wrapper:
-        for i in bar_wrapper:
-            benchmark = lttng_ust_map_benchmark(
-                ctx.obj["lttng_binary_path"],
-                ctx.obj["workload_path"],
-                ctx.obj["thread_count"],
-                ctx.obj["duration_s"],
-            )
-            benchmark.run()
-            results.add_per_event_time(benchmark.result)
-            del benchmark
-
-    results.summarize()
+    _run_scenario(
+        ctx,
+        "LTTng userspace map",
+        "lttng-ust-map",
+        {},
+        lambda thread_count: lttng_ust_map_benchmark(
+            ctx.obj["lttng_binary_path"],
+            ctx.obj["workload_path"],
+            thread_count,
+            ctx.obj["duration_s"],
+        ),
+    )
 
 
 @cli.command(
@@ -650,29 +2669,838 @@ def run_lttng_ust_map_benchmark(ctx: click.Context):
     help="Use SUBBUF_COUNT sub-buffers per ring buffer",
     metavar="SUBBUF_COUNT",
 )
+@_output_dir_option
+@_read_timer_option
 @click.pass_context
 def run_lttng_ust_ringbuffer_benchmark(
-    ctx: click.Context, subbuf_size: str, num_subbuf: int
+    ctx: click.Context,
+    subbuf_size: str,
+    num_subbuf: int,
+    output_dir: Optional[str],
+    read_timer: Optional[int],
 ):
-    results = tracing_benchmark_results(
+    from humanfriendly import parse_size
+
+    # LTTng-UST consumers only support mmap output
+    name, parameters = _ringbuffer_output(
         "LTTng userspace ring buffer ({num_subbuf} * {subbuf_size})".format(
             num_subbuf=num_subbuf, subbuf_size=subbuf_size
+        ),
+        {
+            "num_subbuf": num_subbuf,
+            "subbuf_size": parse_size(subbuf_size, binary=True),
+        },
+        output_dir,
+        "mmap",
+        read_timer,
+    )
+    _run_scenario(
+        ctx,
+        name,
+        "lttng-ust-ringbuffer",
+        parameters,
+        lambda thread_count: lttng_ust_ringbuffer_benchmark(
+            ctx.obj["lttng_binary_path"],
+            ctx.obj["workload_path"],
+            thread_count,
+            ctx.obj["duration_s"],
+            num_subbuf,
+            parse_size(subbuf_size, binary=True),
+            output_dir,
+            "mmap",
+            read_timer,
+        ),
+    )
+
+
+@cli.command(
+    name="baseline-kernel",
+    short_help="Run the kernel workload with its tracepoint but no probe attached",
+)
+@_batch_sizes_option
+@click.pass_context
+def run_baseline_kernel_benchmark(ctx: click.Context, batch_sizes: list[int]):
+    _run_scenario(
+        ctx,
+        BASELINE_NAMES["baseline-kernel"],
+        "baseline-kernel",
+        {},
+        lambda thread_count: make_baseline_benchmark(
+            ctx, "baseline-kernel", thread_count
+        ),
+        batch_sizes,
+    )
+
+
+@cli.command(
+    name="baseline-ust",
+    short_help="Run the userspace workload with its tracepoint compiled in but not enabled",
+)
+@click.pass_context
+def run_baseline_ust_benchmark(ctx: click.Context):
+    _run_scenario(
+        ctx,
+        BASELINE_NAMES["baseline-ust"],
+        "baseline-ust",
+        {},
+        lambda thread_count: make_baseline_benchmark(ctx, "baseline-ust", thread_count),
+    )
+
+
+@cli.command(
+    name="baseline-empty",
+    short_help="Run the workload loop without any tracepoint",
+)
+@click.pass_context
+def run_baseline_empty_benchmark(ctx: click.Context):
+    _run_scenario(
+        ctx,
+        BASELINE_NAMES["baseline-empty"],
+        "baseline-empty",
+        {},
+        lambda thread_count: make_baseline_benchmark(
+            ctx, "baseline-empty", thread_count
+        ),
+    )
+
+
+def _summarize_buffer_search(
+    name: str, search: "buffer_geometry_search", cpu_count: int
+):
+    from humanfriendly import format_size
+
+    from lc22bench.tuning import buffer_footprint
+
+    header = name + " - " + "Buffer geometry search"
+    print(header)
+    print("".join("-" for i in range(len(header))))
+
+    best = search.best()
+    recommendation = search.recommendation()
+    table = []
+    for geometry, measurement in sorted(
+        search.measurements.items(),
+        key=lambda item: (item[0][0] * item[0][1], item[0]),
+    ):
+        num_subbuf, subbuf_size = geometry
+        table.append(
+            [
+                num_subbuf,
+                format_size(subbuf_size, binary=True),
+                format_size(buffer_footprint(geometry, cpu_count), binary=True),
+                measurement["ns_per_event"],
+                (
+                    measurement["ns_per_event"]
+                    / search.measurements[best]["ns_per_event"]
+                    if best is not None
+                    else None
+                ),
+                measurement["loss_rate"],
+                ", ".join(
+                    mark
+                    for mark, marked in (
+                        ("best", best),
+                        ("recommended", recommendation),
+                    )
+                    if geometry == marked
+                ),
+            ]
+        )
+
+    print(
+        tabulate(
+            table,
+            headers=[
+                "Sub-buffers",
+                "Sub-buffer size",
+                "Memory",
+                "Median (ns/event)",
+                "Relative to best",
+                "Loss rate",
+                "",
+            ],
+            floatfmt=["", "", "", ".3f", ".3f", ".2%", ""],
+        )
+    )
+    print(
+        "Measured {measured} of {count} configurations".format(
+            measured=len(search.measurements), count=search.configuration_count
         )
     )
+    if recommendation is None:
+        print("No configuration discards few enough events")
+    else:
+        print(
+            "Recommended: --num-subbuf {num_subbuf} --subbuf-size {subbuf_size} ({memory} over {cpu_count} CPUs)".format(
+                num_subbuf=recommendation[0],
+                subbuf_size=format_size(recommendation[1], binary=True).replace(
+                    " ", ""
+                ),
+                memory=format_size(
+                    buffer_footprint(recommendation, cpu_count), binary=True
+                ),
+                cpu_count=cpu_count,
+            )
+        )
 
-    with click.progressbar(range(ctx.obj["iteration_count"])) as bar_wrapper:
-        for i in bar_wrapper:
-            benchmark = lttng_ust_ringbuffer_benchmark(
+
+@cli.command(
+    name="tune-buffers",
+    short_help="Search for the smallest LTTng ring buffer within a tolerance of the best time per event",
+)
+@click.argument(
+    "scenario",
+    type=click.Choice(["lttng-kernel-ringbuffer", "lttng-ust-ringbuffer"]),
+)
+@click.option(
+    "--min-subbuf-size",
+    default="4K",
+    show_default=True,
+    help="Smallest sub-buffer size tried, a power of two",
+    metavar="SUBBUF_SIZE",
+)
+@click.option(
+    "--max-subbuf-size",
+    default="8M",
+    show_default=True,
+    help="Largest sub-buffer size tried, a power of two",
+    metavar="SUBBUF_SIZE",
+)
+@click.option(
+    "--min-num-subbuf",
+    default=2,
+    show_default=True,
+    help="Smallest number of sub-buffers per ring buffer tried, a power of two",
+    metavar="SUBBUF_COUNT",
+)
+@click.option(
+    "--max-num-subbuf",
+    default=16,
+    show_default=True,
+    help="Largest number of sub-buffers per ring buffer tried, a power of two",
+    metavar="SUBBUF_COUNT",
+)
+@click.option(
+    "--tolerance",
+    type=float,
+    default=0.05,
+    show_default=True,
+    help="Recommend the smallest ring buffer whose median time per event is within TOLERANCE (relative) of the best one measured",
+    metavar="TOLERANCE",
+)
+@click.option(
+    "--coarse-stride",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Measure every STRIDE-th sub-buffer count and size (in powers of two) before refining the search around the best configurations",
+    metavar="STRIDE",
+)
+@_output_dir_option
+@click.option(
+    "--output-type",
+    type=click.Choice(["mmap", "splice"]),
+    default="mmap",
+    show_default=True,
+    help="How the consumer daemon reads the sub-buffers it streams (splice is only supported by the kernel)",
+)
+@_read_timer_option
+@click.pass_context
+def tune_buffers(
+    ctx: click.Context,
+    scenario: str,
+    min_subbuf_size: str,
+    max_subbuf_size: str,
+    min_num_subbuf: int,
+    max_num_subbuf: int,
+    tolerance: float,
+    coarse_stride: int,
+    output_dir: Optional[str],
+    output_type: str,
+    read_timer: Optional[int],
+):
+    """
+    Search the sub-buffer count and size of a ring buffer scenario for the
+    smallest ring buffer whose median time per event is within TOLERANCE of
+    the best one, among those losing no more than --loss-tolerance of their
+    events. A coarse grid is measured first, then the search is refined
+    around the best and recommended configurations; every configuration is
+    measured once and saved like a run of the scenario.
+    """
+    import pandas
+
+    from humanfriendly import format_size, parse_size
+
+    from lc22bench.tuning import (
+        buffer_geometry_search,
+        possible_cpu_count,
+        powers_of_two,
+    )
+
+    if len(ctx.obj["thread_counts"]) > 1:
+        raise click.UsageError(
+            "tune-buffers runs a single thread count, use --thread-count instead of --threads"
+        )
+    if scenario == "lttng-ust-ringbuffer" and output_type != "mmap":
+        raise click.BadParameter(
+            "LTTng-UST consumers only support mmap output",
+            param_hint="'--output-type'",
+        )
+    try:
+        subbuf_sizes = powers_of_two(
+            parse_size(min_subbuf_size, binary=True),
+            parse_size(max_subbuf_size, binary=True),
+        )
+        subbuf_counts = powers_of_two(min_num_subbuf, max_num_subbuf)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    benchmark_class, label = {
+        "lttng-kernel-ringbuffer": (
+            lttng_kernel_ringbuffer_benchmark,
+            "LTTng kernel ring buffer",
+        ),
+        "lttng-ust-ringbuffer": (
+            lttng_ust_ringbuffer_benchmark,
+            "LTTng userspace ring buffer",
+        ),
+    }[scenario]
+    thread_count = ctx.obj["thread_counts"][0]
+
+    def measure(num_subbuf: int, subbuf_size: int) -> dict:
+        name, parameters = _ringbuffer_output(
+            "{label} ({num_subbuf} * {subbuf_size})".format(
+                label=label,
+                num_subbuf=num_subbuf,
+                subbuf_size=format_size(subbuf_size, binary=True),
+            ),
+            {"num_subbuf": num_subbuf, "subbuf_size": subbuf_size},
+            output_dir,
+            output_type,
+            read_timer,
+        )
+        results = tracing_benchmark_results(name, scenario, parameters)
+        _run_iterations(
+            ctx,
+            results,
+            lambda: benchmark_class(
                 ctx.obj["lttng_binary_path"],
                 ctx.obj["workload_path"],
-                ctx.obj["thread_count"],
+                thread_count,
                 ctx.obj["duration_s"],
                 num_subbuf,
-                parse_size(subbuf_size, binary=True),
-            )
+                subbuf_size,
+                output_dir,
+                output_type,
+                read_timer,
+            ),
+            # Lossy configurations are measured and ruled out rather than
+            # failing the search
+            loss_tolerance=float("inf"),
+        )
+        results.summarize()
+        return {
+            "ns_per_event": pandas.Series(results.times_per_event).median(),
+            "loss_rate": results.loss_rate,
+        }
+
+    search = buffer_geometry_search(
+        measure,
+        subbuf_counts,
+        subbuf_sizes,
+        tolerance,
+        ctx.obj["loss_tolerance"],
+        coarse_stride,
+    )
+    search.run()
+    _summarize_buffer_search(label, search, possible_cpu_count())
+
+
+@cli.group(name="cache", short_help="Inspect or purge the compiled eBPF program cache")
+def ebpf_cache_group():
+    pass
+
+
+@ebpf_cache_group.command(name="list", short_help="List cached eBPF programs")
+@click.pass_context
+def list_ebpf_cache(ctx: click.Context):
+    from humanfriendly import format_size
+
+    cache = ctx.obj["ebpf_cache"]
+    entries = cache.entries()
+
+    table = []
+    for entry in entries:
+        table.append(
+            [
+                entry["key"][:12],
+                ", ".join(entry["functions"]),
+                ", ".join(entry["tables"]),
+                format_size(entry["size"], binary=True),
+                "{:.3f}".format(entry["compile_time_s"] or 0.0),
+                datetime.fromtimestamp(entry["last_used"]).isoformat(
+                    sep=" ", timespec="seconds"
+                ),
+            ]
+        )
+
+    print("Cache directory: " + cache.cache_dir)
+    print(
+        tabulate(
+            table,
+            headers=[
+                "Key",
+                "Functions",
+                "Maps",
+                "Size",
+                "Compile time (s)",
+                "Last used",
+            ],
+        )
+    )
+    print(
+        "{count} entries, {size}".format(
+            count=len(entries),
+            size=format_size(sum(entry["size"] for entry in entries), binary=True),
+        )
+    )
+
+
+@ebpf_cache_group.command(name="purge", short_help="Remove all cached eBPF programs")
+@click.pass_context
+def purge_ebpf_cache(ctx: click.Context):
+    count = ctx.obj["ebpf_cache"].purge()
+    print("Removed {count} cached eBPF programs".format(count=count))
+
+
+@cli.command(
+    name="preflight",
+    short_help="Fingerprint the host and check it for sources of noise",
+)
+@click.pass_context
+def run_preflight(ctx: click.Context):
+    preflight = _run_preflight(ctx)
+    print(tabulate(preflight["fingerprint"].items(), headers=["", "Fingerprint"]))
+    print()
+    print(
+        tabulate(
+            [
+                [
+                    finding["check"],
+                    "noisy" if finding["noisy"] else "ok",
+                    finding["detail"],
+                ]
+                for finding in preflight["findings"]
+            ],
+            headers=["Check", "Status", "Detail"],
+        )
+    )
+    print("Noise score: {score:.2f}".format(score=preflight["noise_score"]))
+    if preflight["noise_score"] > ctx.obj["max_noise_score"]:
+        raise click.ClickException("The host is too noisy to run the benchmarks")
+
+
+@cli.command(
+    name="scan-trace",
+    short_help="Count the events and discarded events of a CTF trace from its packet headers",
+)
+@click.argument("trace_dir", type=click.Path(exists=True, file_okay=False))
+def scan_trace_command(trace_dir: str):
+    """
+    Count the events of every data stream of the LTTng traces found in
+    TRACE_DIR, and the events discarded by the tracer, without decoding the
+    events. Only events whose payload has a fixed size can be counted.
+    """
+    from humanfriendly import format_size
+
+    from lc22bench.ctf import scan_trace
+
+    start = perf_counter()
+    try:
+        trace = scan_trace(trace_dir)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    scan_time_s = perf_counter() - start
+
+    print(
+        tabulate(
+            [
+                [
+                    os.path.relpath(stream["path"], trace_dir),
+                    stream["cpu_id"],
+                    stream["packets"],
+                    stream["events"],
+                    stream["events_discarded"],
+                    format_size(stream["bytes"], binary=True),
+                ]
+                for stream in trace["streams"]
+            ],
+            headers=["Stream", "CPU", "Packets", "Events", "Discarded", "Size"],
+        )
+    )
+    print()
+    print(
+        tabulate(
+            [
+                [cpu, totals["events"], totals["events_discarded"]]
+                for cpu, totals in trace["cpus"].items()
+            ],
+            headers=["CPU", "Events", "Discarded"],
+        )
+    )
+    print(
+        "{events} events, {discarded} discarded, {size} scanned in {time:.3f} s".format(
+            events=trace["events"],
+            discarded=trace["events_discarded"],
+            size=format_size(trace["bytes"], binary=True),
+            time=scan_time_s,
+        )
+    )
+
+
+@cli.command(
+    name="matrix",
+    short_help="Run a matrix of scenarios concurrently on disjoint CPU sets",
+)
+@click.argument("matrix_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--cpus-per-slot",
+    default=0,
+    show_default=True,
+    help="Split each NUMA node in slots of CPU_COUNT CPUs (0 to use one slot per NUMA node)",
+    metavar="CPU_COUNT",
+)
+@click.option(
+    "--output-dir",
+    default=lambda: "matrix-" + datetime.now().strftime("%Y%m%d-%H%M%S"),
+    help="Directory in which the output of every scenario and the placement index are saved",
+    metavar="OUTPUT_DIR",
+)
+@click.pass_context
+def run_matrix(
+    ctx: click.Context, matrix_file: str, cpus_per_slot: int, output_dir: str
+):
+    """
+    Run every scenario listed in MATRIX_FILE (JSON, or TOML with Python 3.11+).
+
+    Top-level keys are options applied to all scenarios. Each [[scenario]]
+    entry names a bench command and its options; list values are swept. For
+    instance:
+
+    \b
+        duration = 10
+        iteration-count = 100
+        [[scenario]]
+        name = "lttng-ust-ringbuffer"
+        subbuf-size = ["4K", "8M"]
+        num-subbuf = 4
+
+    Scenarios are placed on disjoint CPU slots (NUMA nodes by default) and
+    run concurrently unless they share host-wide state, in which case they are
+    serialized. The placement of every scenario is recorded in
+    OUTPUT_DIR/placements.jsonl.
+    """
+    if not ctx.obj["workload_path"]:
+        raise click.UsageError("Missing option '-w' / '--workload'.")
+
+    try:
+        jobs = expand_matrix(load_matrix(matrix_file))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    slots = cpu_slots(cpus_per_slot)
+    if not slots:
+        raise click.ClickException("No CPU slot available to run the matrix")
+
+    base_command = [
+        sys.executable,
+        "-m",
+        "lc22bench",
+        "--workload",
+        ctx.obj["workload_path"],
+        "--lttng-binary-path",
+        ctx.obj["lttng_binary_path"],
+    ]
+    global_options = {param.name.replace("_", "-") for param in cli.params}
+    runner = matrix_runner(slots, base_command, global_options, output_dir)
+
+    print(
+        "Running {job_count} scenarios on {slots}".format(
+            job_count=len(jobs), slots=", ".join(slot.label for slot in slots)
+        )
+    )
+    records = runner.run(jobs)
+
+    table = [
+        [
+            record["job"],
+            record["placement"],
+            "{:.1f}".format(record["end_time"] - record["start_time"]),
+            record["returncode"],
+        ]
+        for record in sorted(records, key=lambda record: record["job"])
+    ]
+    print(tabulate(table, headers=["Scenario", "Placement", "Time (s)", "Exit code"]))
+
+    if any(record["returncode"] != 0 for record in records):
+        sys.exit(1)
 
-            benchmark.run()
-            results.add_per_event_time(benchmark.result)
-            del benchmark
 
-    results.summarize()
+@cli.group(name="results", short_help="Query the saved results of previous runs")
+def results_group():
+    pass
+
+
+def _load_results(ctx: click.Context, scenario: Optional[str]) -> "pandas.DataFrame":
+    try:
+        records = ctx.obj["results_store"].load()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    if scenario:
+        records = records[records["scenario"] == scenario]
+    return records
+
+
+@results_group.command(name="list", short_help="List saved runs")
+@click.option("--scenario", help="Only list runs of SCENARIO", metavar="SCENARIO")
+@click.pass_context
+def list_results(ctx: click.Context, scenario: Optional[str]):
+    records = _load_results(ctx, scenario)
+    runs = records.groupby("run_id", sort=True).agg(
+        scenario=("scenario", "first"),
+        parameters=("parameters", "first"),
+        host=("host_id", "first"),
+        placement=("placement", "first"),
+        iterations=("iteration", "count"),
+        median=("ns_per_event", "median"),
+    )
+    print(
+        tabulate(
+            runs.reset_index().values.tolist(),
+            headers=[
+                "Run",
+                "Scenario",
+                "Parameters",
+                "Host",
+                "Placement",
+                "Iterations",
+                "Median (ns/event)",
+            ],
+        )
+    )
+
+
+@results_group.command(
+    name="summary", short_help="Summarize the time per event of every scenario"
+)
+@click.option("--scenario", help="Only summarize SCENARIO", metavar="SCENARIO")
+@click.option("--host", help="Only summarize runs of host HOST_ID", metavar="HOST_ID")
+@click.pass_context
+def summarize_results(ctx: click.Context, scenario: Optional[str], host: Optional[str]):
+    records = _load_results(ctx, scenario)
+    if host:
+        records = records[records["host_id"] == host]
+
+    summary = records.groupby(["scenario", "parameters", "thread_count"])[
+        "ns_per_event"
+    ].describe()
+    print(tabulate(summary, headers="keys", floatfmt=".3f"))
+
+
+@cli.command(
+    name="compare",
+    short_help="Compare two result sets and flag the scenarios that regressed",
+)
+@click.argument("baseline", type=click.Path(exists=True, file_okay=False))
+@click.argument("candidate", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--metric",
+    type=click.Choice(["ns_per_event", "steady_state_ns_per_event"]),
+    default="ns_per_event",
+    show_default=True,
+    help="Time per event to compare",
+)
+@click.option(
+    "--alpha",
+    default=0.05,
+    show_default=True,
+    help="Significance level of the comparison (the confidence interval is at 1 - ALPHA)",
+    metavar="ALPHA",
+)
+@click.option(
+    "--threshold",
+    default=0.05,
+    show_default=True,
+    help="Exit with an error if a significant regression of the median exceeds THRESHOLD (relative to the baseline)",
+    metavar="THRESHOLD",
+)
+def compare_results(
+    baseline: str, candidate: str, metric: str, alpha: float, threshold: float
+):
+    """
+    Compare the time per event of every scenario found in both the BASELINE
+    and CANDIDATE results directories.
+
+    Scenarios are matched on their name, parameters and thread count. For
+    each of them, the relative change of the median, its bootstrap confidence
+    interval and the Mann-Whitney U test p-value are reported. A change is
+    significant when p < ALPHA and the confidence interval excludes zero.
+    """
+    from lc22bench.stats import compare_samples
+
+    keys = ["scenario", "parameters", "thread_count"]
+    try:
+        baseline_records = results_store(baseline).load()
+        candidate_records = results_store(candidate).load()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    baseline_points = {
+        key: points.dropna().to_numpy(dtype=float)
+        for key, points in baseline_records.groupby(keys)[metric]
+    }
+    candidate_points = {
+        key: points.dropna().to_numpy(dtype=float)
+        for key, points in candidate_records.groupby(keys)[metric]
+    }
+
+    table = []
+    failed = False
+    for key in sorted(baseline_points.keys() | candidate_points.keys()):
+        scenario, parameters, thread_count = key
+        row = [scenario, parameters, thread_count]
+        a = baseline_points.get(key, [])
+        b = candidate_points.get(key, [])
+        if len(a) < 2 or len(b) < 2:
+            table.append(row + [len(a), len(b)] + [None] * 5 + ["not comparable"])
+            continue
+
+        comparison = compare_samples(a, b, confidence=1.0 - alpha)
+        significant = comparison["p_value"] < alpha and (
+            comparison["ci_low"] > 0 or comparison["ci_high"] < 0
+        )
+        if not significant:
+            status = "unchanged"
+        elif comparison["relative_delta"] < 0:
+            status = "improvement"
+        elif comparison["relative_delta"] > threshold:
+            status = "REGRESSION"
+            failed = True
+        else:
+            status = "regression"
+
+        table.append(
+            row
+            + [
+                len(a),
+                len(b),
+                comparison["baseline_median"],
+                comparison["candidate_median"],
+                "{:+.2%}".format(comparison["relative_delta"]),
+                "[{:+.2%}, {:+.2%}]".format(
+                    comparison["ci_low"], comparison["ci_high"]
+                ),
+                comparison["p_value"],
+                status,
+            ]
+        )
+
+    print(
+        tabulate(
+            table,
+            headers=[
+                "Scenario",
+                "Parameters",
+                "Threads",
+                "Baseline points",
+                "Candidate points",
+                "Baseline median",
+                "Candidate median",
+                "Delta",
+                "{:.0%} CI".format(1.0 - alpha),
+                "p-value",
+                "Status",
+            ],
+            floatfmt=".4g",
+        )
+    )
+
+    if failed:
+        logger.error(
+            "At least one scenario regressed by more than {:.1%}".format(threshold)
+        )
+        sys.exit(1)
+
+
+@cli.command(
+    name="profile-diff",
+    short_help="Compare the on-CPU profiles of two scenarios, function by function",
+)
+@click.argument("baseline", type=click.Path(exists=True, dir_okay=False))
+@click.argument("candidate", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--top",
+    type=click.IntRange(min=1),
+    default=20,
+    show_default=True,
+    help="Show the COUNT functions whose share of the samples changed the most",
+    metavar="COUNT",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Also write the stacks of both profiles to OUTPUT in the input format of flamegraph.pl's differential flame graphs",
+    metavar="OUTPUT",
+)
+def profile_diff(baseline: str, candidate: str, top: int, output: Optional[str]):
+    """
+    Compare the folded stacks saved by --profile for two scenarios, BASELINE
+    and CANDIDATE: the share of the samples in which each function is the
+    leaf (self) and is on the stack (inclusive), the functions whose self
+    share changed the most first.
+    """
+    from lc22bench.folded import diff_functions, read_folded, write_differential_folded
+
+    baseline_stacks = read_folded(baseline)
+    candidate_stacks = read_folded(candidate)
+    if not baseline_stacks or not candidate_stacks:
+        raise click.ClickException("Both profiles must have samples")
+
+    table = []
+    for frame, baseline_self, candidate_self, *inclusive in diff_functions(
+        baseline_stacks, candidate_stacks, top
+    ):
+        table.append(
+            [
+                frame,
+                baseline_self,
+                candidate_self,
+                "{:+.2%}".format(candidate_self - baseline_self),
+                *inclusive,
+            ]
+        )
+
+    print(
+        tabulate(
+            table,
+            headers=[
+                "Function",
+                "Baseline self",
+                "Candidate self",
+                "Delta",
+                "Baseline inclusive",
+                "Candidate inclusive",
+            ],
+            floatfmt=["", ".2%", ".2%", "", ".2%", ".2%"],
+        )
+    )
+    print(
+        "{baseline} baseline samples, {candidate} candidate samples".format(
+            baseline=sum(baseline_stacks.values()),
+            candidate=sum(candidate_stacks.values()),
+        )
+    )
+
+    if output is not None:
+        write_differential_folded(output, baseline_stacks, candidate_stacks)
@@ -0,0 +1,477 @@
+import mmap
+import os
+import re
+import struct
+
+from typing import Optional
+
+import numpy
+
+# Packet header and context of the data streams written by LTTng (kernel and
+# userspace) on 64-bit hosts: native byte order, byte-aligned fields.
+CTF_MAGIC = 0xC1FC1FC1
+PACKET_HEADER = numpy.dtype(
+    [
+        ("magic", "=u4"),
+        ("uuid", "u1", (16,)),
+        ("stream_id", "=u4"),
+        ("stream_instance_id", "=u8"),
+        ("timestamp_begin", "=u8"),
+        ("timestamp_end", "=u8"),
+        ("content_size", "=u8"),
+        ("packet_size", "=u8"),
+        ("packet_seq_num", "=u8"),
+        ("events_discarded", "=u8"),
+        ("cpu_id", "=u4"),
+    ]
+)
+
+# Event headers: the id of compact events, then their timestamp; extended
+# events are followed by a u32 id and u64 timestamp.
+# (id size, id mask, extended id, compact header size, extended header size)
+EVENT_HEADERS = {
+    "compact": (1, 0x1F, 31, 4, 13),
+    "large": (2, 0xFFFF, 65535, 6, 14),
+}
+
+# Metadata packets: magic, uuid, checksum, then content and packet sizes
+_METADATA_MAGIC = 0x75D11D57
+_METADATA_HEADER = struct.Struct("=I16sIII5B")
+
+# Packets whose events are counted together, which bounds the memory used
+_PACKETS_PER_CHUNK = 4096
+
+
+def read_metadata(path: str) -> str:
+    """Text of a metadata stream, packetized (as written by LTTng) or not."""
+    with open(path, "rb") as metadata_file:
+        data = metadata_file.read()
+
+    if len(data) < 4 or struct.unpack_from("=I", data)[0] != _METADATA_MAGIC:
+        return data.decode("utf-8")
+
+    text = []
+    offset = 0
+    while offset + _METADATA_HEADER.size <= len(data):
+        _, _, _, content_size, packet_size, *_ = _METADATA_HEADER.unpack_from(
+            data, offset
+        )
+        text.append(data[offset + _METADATA_HEADER.size : offset + content_size // 8])
+        offset += packet_size // 8
+    return b"".join(text).decode("utf-8")
+
+
+def _fields_size(fields: str) -> Optional[int]:
+    # Size of a structure of fixed-size, byte-aligned fields, None otherwise
+    if re.search(r"\b(string|variant|sequence)\b|\[\s*_", fields):
+        return None
+    if any(int(align) > 8 for align in re.findall(r"align\s*=\s*(\d+)", fields)):
+        return None
+
+    bits = 0
+    for kind, attributes, length in re.findall(
+        r"(integer|floating_point)\s*\{([^}]*)\}\s*(?:\{[^}]*\}\s*)?\w+(?:\[(\d+)\])?;",
+        fields,
+    ):
+        if kind == "integer":
+            size = int(re.search(r"size\s*=\s*(\d+)", attributes).group(1))
+        else:
+            size = sum(
+                int(digits)
+                for digits in re.findall(r"(?:exp|mant)_dig\s*=\s*(\d+)", attributes)
+            )
+        bits += size * int(length or 1)
+    return bits // 8 if bits % 8 == 0 else None
+
+
+def _struct_body(text: str, start: int) -> str:
+    # Body of the structure whose opening brace follows `start`
+    begin = text.index("{", start)
+    depth = 0
+    for end in range(begin, len(text)):
+        if text[end] == "{":
+            depth += 1
+        elif text[end] == "}":
+            depth -= 1
+            if depth == 0:
+                return text[begin + 1 : end]
+    raise ValueError("Unbalanced braces in metadata")
+
+
+class stream_layout:
+    """
+    Event header type of a stream class and the size of the events it
+    contains (header excluded), for the events whose payload and contexts
+    have a fixed size: counting such events doesn't require decoding them.
+    """
+
+    def __init__(self, event_header: str, event_sizes: dict[int, int]):
+        if event_header not in EVENT_HEADERS:
+            raise ValueError("Unknown event header: " + event_header)
+        self.event_header = event_header
+        self.event_sizes = event_sizes
+
+    @staticmethod
+    def parse(metadata: str) -> dict[int, "stream_layout"]:
+        """Layout of every stream class described by a metadata text."""
+        streams = {}
+        for match in re.finditer(r"^stream\s*\{", metadata, re.MULTILINE):
+            body = _struct_body(metadata, match.start())
+            stream_id = re.search(r"^\s*id\s*=\s*(\d+);", body, re.MULTILINE)
+            header = re.search(
+                r"event\.header\s*:=\s*struct\s+event_header_(\w+)", body
+            )
+            context = re.search(r"event\.context\s*:=\s*struct\s*\{", body)
+            streams[int(stream_id.group(1)) if stream_id else 0] = (
+                header.group(1) if header else "compact",
+                _fields_size(_struct_body(body, context.start())) if context else 0,
+            )
+
+        event_sizes = {stream_id: {} for stream_id in streams}
+        for match in re.finditer(r"^event\s*\{", metadata, re.MULTILINE):
+            body = _struct_body(metadata, match.start())
+            event_id = re.search(r"^\s*id\s*=\s*(\d+);", body, re.MULTILINE)
+            stream_id = re.search(r"^\s*stream_id\s*=\s*(\d+);", body, re.MULTILINE)
+            stream_id = int(stream_id.group(1)) if stream_id else 0
+            fields = re.search(r"fields\s*:=\s*struct\s*\{", body)
+            size = _fields_size(_struct_body(body, fields.start())) if fields else 0
+            context_size = streams.get(stream_id, ("compact", 0))[1]
+            if size is not None and context_size is not None and event_id:
+                event_sizes.setdefault(stream_id, {})[int(event_id.group(1))] = (
+                    size + context_size
+                )
+
+        return {
+            stream_id: stream_layout(
+                streams.get(stream_id, ("compact", 0))[0], event_sizes[stream_id]
+            )
+            for stream_id in event_sizes
+        }
+
+    def event_size(self, event_id: int) -> int:
+        try:
+            return self.event_sizes[event_id]
+        except KeyError:
+            raise ValueError(
+                "Event {id} doesn't have a fixed size, it can't be counted".format(
+                    id=event_id
+                )
+            ) from None
+
+
+def packet_headers(data) -> numpy.ndarray:
+    """Header and context of every packet of a data stream."""
+    if len(data) < PACKET_HEADER.itemsize:
+        return numpy.zeros(0, dtype=PACKET_HEADER)
+
+    # Packets of a stream usually have the size of its sub-buffers, which
+    # allows viewing all their headers at once
+    first = numpy.frombuffer(data, dtype=PACKET_HEADER, count=1)[0]
+    packet_size = int(first["packet_size"]) // 8
+    if packet_size >= PACKET_HEADER.itemsize and len(data) % packet_size == 0:
+        headers = numpy.ndarray(
+            (len(data) // packet_size,),
+            dtype=PACKET_HEADER,
+            buffer=data,
+            strides=(packet_size,),
+        )
+        if (headers["packet_size"] == packet_size * 8).all():
+            return headers
+
+    headers = []
+    offset = 0
+    while offset + PACKET_HEADER.itemsize <= len(data):
+        header = numpy.frombuffer(
+            data, dtype=PACKET_HEADER, count=1, offset=offset
+        ).copy()
+        packet_size = int(header["packet_size"][0]) // 8
+        if packet_size < PACKET_HEADER.itemsize:
+            raise ValueError("Invalid packet size at offset {}".format(offset))
+        if offset + packet_size > len(data):
+            # Packet still being written
+            break
+        headers.append(header)
+        offset += packet_size
+    return numpy.concatenate(headers) if headers else numpy.zeros(0, PACKET_HEADER)
+
+
+def _walk_events(data, begin: int, end: int, layout: stream_layout) -> int:
+    # Count the events of [begin, end) one by one
+    id_size, id_mask, extended_id, compact_size, extended_size = EVENT_HEADERS[
+        layout.event_header
+    ]
+    id_format = "=B" if id_size == 1 else "=H"
+    events = 0
+    offset = begin
+    while offset < end:
+        (event_id,) = struct.unpack_from(id_format, data, offset)
+        event_id &= id_mask
+        if event_id == extended_id:
+            (event_id,) = struct.unpack_from("=I", data, offset + id_size)
+            offset += extended_size
+        else:
+            offset += compact_size
+        offset += layout.event_size(event_id)
+        events += 1
+
+    if offset != end:
+        raise ValueError("Event at offset {} overruns its packet".format(offset))
+    return events
+
+
+def _count_regular_events(
+    packets: numpy.ndarray,
+    content_sizes: numpy.ndarray,
+    layout: stream_layout,
+    event_id: int,
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Count the events of packets (rows of `packets`) made only of compact
+    events of id `event_id`, checking the id found at every multiple of the
+    event's size. Returns the event counts and whether each packet is
+    regular; the others must be walked.
+    """
+    id_size, id_mask, _, compact_size, _ = EVENT_HEADERS[layout.event_header]
+    stride = compact_size + layout.event_size(event_id)
+    start = PACKET_HEADER.itemsize
+    lengths = content_sizes - start
+    counts = lengths // stride
+
+    ids = packets[:, start::stride].astype(numpy.uint16)
+    if id_size == 2:
+        high = packets[:, start + 1 :: stride]
+        ids = ids[:, : high.shape[1]] | high.astype(numpy.uint16) << 8
+    in_packet = numpy.arange(ids.shape[1]) < counts[:, None]
+    mismatches = ((ids & id_mask) != event_id) & in_packet
+    regular = (lengths % stride == 0) & ~mismatches.any(axis=1)
+    return counts, regular
+
+
+def count_events(data, headers: numpy.ndarray, layout: stream_layout) -> numpy.ndarray:
+    """Number of events in each packet of a data stream."""
+    events = numpy.zeros(len(headers), dtype=numpy.int64)
+    content_sizes = (headers["content_size"] // 8).astype(numpy.int64)
+    packet_sizes = (headers["packet_size"] // 8).astype(numpy.int64)
+    offsets = numpy.concatenate(([0], numpy.cumsum(packet_sizes)[:-1]))
+    to_walk = content_sizes > PACKET_HEADER.itemsize
+
+    non_empty = numpy.flatnonzero(to_walk)
+    if len(non_empty) and (packet_sizes == packet_sizes[0]).all():
+        # Events are assumed to be of the same kind as the first one, then
+        # checked; all the packets are viewed as the rows of a matrix
+        id_size, id_mask, extended_id, _, _ = EVENT_HEADERS[layout.event_header]
+        first = offsets[non_empty[0]] + PACKET_HEADER.itemsize
+        event_id = int.from_bytes(data[first : first + id_size], "little") & id_mask
+        if event_id != extended_id and event_id in layout.event_sizes:
+            packets = numpy.frombuffer(
+                data, dtype=numpy.uint8, count=len(headers) * int(packet_sizes[0])
+            ).reshape(len(headers), int(packet_sizes[0]))
+            for chunk in range(0, len(headers), _PACKETS_PER_CHUNK):
+                rows = slice(chunk, chunk + _PACKETS_PER_CHUNK)
+                counts, regular = _count_regular_events(
+                    packets[rows], content_sizes[rows], layout, event_id
+                )
+                events[rows] = numpy.where(regular, counts, 0)
+                to_walk[rows] &= ~regular
+
+    for index in numpy.flatnonzero(to_walk):
+        begin = int(offsets[index]) + PACKET_HEADER.itemsize
+        events[index] = _walk_events(
+            data, begin, int(offsets[index] + content_sizes[index]), layout
+        )
+    return events
+
+
+def scan_stream(path: str, layouts: dict[int, stream_layout]) -> dict:
+    """
+    Totals of a data stream file: packets, events, discarded events (the
+    count of the last packet, which is cumulative) and bytes, without
+    decoding the events' payload.
+    """
+    with open(path, "rb") as stream_file:
+        size = os.fstat(stream_file.fileno()).st_size
+        if size == 0:
+            return {
+                "path": path,
+                "stream_id": None,
+                "cpu_id": None,
+                "packets": 0,
+                "events": 0,
+                "events_discarded": 0,
+                "timestamp_begin": None,
+                "timestamp_end": None,
+                "bytes": 0,
+            }
+
+        with mmap.mmap(stream_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            headers = packet_headers(data)
+            if (headers["magic"] != CTF_MAGIC).any():
+                raise ValueError(path + " isn't a CTF data stream")
+            stream_id = int(headers["stream_id"][0])
+            events = count_events(data, headers, layouts[stream_id])
+            totals = {
+                "path": path,
+                "stream_id": stream_id,
+                "cpu_id": int(headers["cpu_id"][0]),
+                "packets": len(headers),
+                "events": int(events.sum()),
+                "events_discarded": int(headers["events_discarded"][-1]),
+                "timestamp_begin": int(headers["timestamp_begin"][0]),
+                "timestamp_end": int(headers["timestamp_end"][-1]),
+                "bytes": size,
+            }
+            # Release the views of the mapping before closing it
+            del headers, events
+            return totals
+
+
+def scan_trace(trace_dir: str) -> dict:
+    """
+    Totals of every data stream of the CTF traces found in `trace_dir`, and
+    their events and discarded events per CPU.
+    """
+    streams = []
+    for dir_path, dir_names, file_names in os.walk(trace_dir):
+        dir_names.sort()
+        if "metadata" not in file_names:
+            continue
+
+        layouts = stream_layout.parse(read_metadata(os.path.join(dir_path, "metadata")))
+        for file_name in sorted(file_names):
+            if file_name != "metadata" and not file_name.startswith("."):
+                streams.append(scan_stream(os.path.join(dir_path, file_name), layouts))
+
+    cpus = {}
+    for stream in streams:
+        if stream["cpu_id"] is None:
+            continue
+        totals = cpus.setdefault(stream["cpu_id"], {"events": 0, "events_discarded": 0})
+        totals["events"] += stream["events"]
+        totals["events_discarded"] += stream["events_discarded"]
+
+    return {
+        "streams": streams,
+        "cpus": dict(sorted(cpus.items())),
+        "events": sum(stream["events"] for stream in streams),
+        "events_discarded": sum(stream["events_discarded"] for stream in streams),
+        "bytes": sum(stream["bytes"] for stream in streams),
+    }
+
+
+_SYNTHETIC_METADATA = """/* CTF 1.8 */
+
+trace {{
+	major = 1;
+	minor = 8;
+	byte_order = le;
+}};
+
+stream {{
+	id = 0;
+	event.header := struct event_header_{event_header};
+}};
+
+event {{
+	name = "lc2022:benchmark_event";
+	id = 0;
+	stream_id = 0;
+	fields := struct {{
+		integer {{ size = 8; align = 8; signed = 0; encoding = none; base = 16; }} _payload[{payload_size}];
+	}};
+}};
+
+event {{
+	name = "lc2022:other_event";
+	id = 1;
+	stream_id = 0;
+	fields := struct {{
+		integer {{ size = 32; align = 8; signed = 0; encoding = none; base = 10; }} _value;
+	}};
+}};
+"""
+
+
+def synthetic_stream(
+    event_counts: list[int],
+    packet_size: int,
+    payload_size: int = 8,
+    event_header: str = "compact",
+    cpu_id: int = 0,
+    events_discarded: Optional[list[int]] = None,
+    irregular_every: int = 0,
+) -> bytes:
+    """
+    Data stream of packets of `packet_size` bytes holding `event_counts`
+    events of id 0 and `payload_size` bytes. Every `irregular_every`-th
+    event is an extended event, followed by an event of id 1 (4 bytes), as
+    found when timestamps wrap or several events are enabled.
+    `events_discarded` holds the cumulative discarded events of each packet.
+    """
+    id_size, _, extended_id, compact_size, _ = EVENT_HEADERS[event_header]
+    id_format = "=B" if id_size == 1 else "=H"
+    packets = []
+    event_index = 0
+    for index, event_count in enumerate(event_counts):
+        events = bytearray()
+        for _ in range(event_count):
+            event_index += 1
+            if irregular_every and event_index % irregular_every == 0:
+                events += struct.pack(id_format, extended_id)
+                events += struct.pack("=IQ", 0, event_index)
+                events += bytes(payload_size)
+                events += struct.pack(id_format, 1)
+                events += bytes(compact_size - id_size) + struct.pack("=I", 1)
+            else:
+                events += struct.pack(id_format, 0)
+                events += bytes(compact_size - id_size) + bytes(payload_size)
+
+        content_size = PACKET_HEADER.itemsize + len(events)
+        if content_size > packet_size:
+            raise ValueError("Events don't fit in a packet")
+
+        header = numpy.zeros(1, dtype=PACKET_HEADER)
+        header["magic"] = CTF_MAGIC
+        header["stream_id"] = 0
+        header["timestamp_begin"] = index * 1000
+        header["timestamp_end"] = index * 1000 + 999
+        header["content_size"] = content_size * 8
+        header["packet_size"] = packet_size * 8
+        header["packet_seq_num"] = index
+        header["events_discarded"] = events_discarded[index] if events_discarded else 0
+        header["cpu_id"] = cpu_id
+        packets.append(
+            header.tobytes() + bytes(events) + bytes(packet_size - content_size)
+        )
+    return b"".join(packets)
+
+
+def write_synthetic_trace(
+    trace_dir: str,
+    cpu_count: int,
+    event_counts: list[int],
+    packet_size: int,
+    payload_size: int = 8,
+    event_header: str = "compact",
+    irregular_every: int = 0,
+) -> None:
+    """Trace of one stream per CPU, each made of `event_counts` packets."""
+    os.makedirs(trace_dir, exist_ok=True)
+    with open(os.path.join(trace_dir, "metadata"), "w") as metadata_file:
+        metadata_file.write(
+            _SYNTHETIC_METADATA.format(
+                event_header=event_header, payload_size=payload_size
+            )
+        )
+
+    for cpu in range(cpu_count):
+        with open(os.path.join(trace_dir, "channel0_{}".format(cpu)), "wb") as stream:
+            stream.write(
+                synthetic_stream(
+                    event_counts,
+                    packet_size,
+                    payload_size,
+                    event_header,
+                    cpu,
+                    irregular_every=irregular_every,
+                )
+            )
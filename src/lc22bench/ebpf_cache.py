@@ -0,0 +1,228 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+from typing import TYPE_CHECKING, Optional
+
+# bcc loads libbcc and LLVM: it is only imported to compile or load programs,
+# not to list or purge the cache
+if TYPE_CHECKING:
+    from lc22bench.ebpf_program import cached_bpf_program
+
+logger = logging.getLogger(__name__)
+
+
+def default_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "lc22bench", "ebpf")
+
+
+def _kernel_headers_fingerprint() -> str:
+    # bcc builds against the running kernel's headers; fold in whichever of
+    # them it would pick up so that a header update invalidates the cache.
+    release = os.uname().release
+    candidates = [
+        "/lib/modules/{release}/build/include/generated/autoconf.h".format(
+            release=release
+        ),
+        "/lib/modules/{release}/source/Makefile".format(release=release),
+        "/sys/kernel/kheaders.tar.xz",
+    ]
+
+    fingerprint = []
+    for path in candidates:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        fingerprint.append(
+            "{path}:{size}:{mtime}".format(
+                path=path, size=stat.st_size, mtime=stat.st_mtime_ns
+            )
+        )
+
+    return ";".join(fingerprint)
+
+
+class ebpf_object_cache:
+    """
+    On-disk cache of eBPF programs compiled by bcc.
+
+    Entries are keyed on the program text, the compilation flags, the
+    running kernel and its headers, and the bcc version. Cached programs are
+    loaded directly into the kernel without going through clang/LLVM.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int):
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    def key(self, text: str, cflags: list[str]) -> str:
+        from bcc import __version__ as bcc_version
+
+        uname = os.uname()
+        digest = hashlib.sha256()
+        for component in [
+            text,
+            "\0".join(cflags),
+            uname.release,
+            uname.version,
+            uname.machine,
+            _kernel_headers_fingerprint(),
+            bcc_version,
+        ]:
+            digest.update(component.encode())
+            digest.update(b"\0")
+
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key + ".json")
+
+    def load(
+        self, text: str, prog_type: int, cflags: Optional[list[str]] = None
+    ) -> "cached_bpf_program":
+        from lc22bench.ebpf_program import cached_bpf_program
+
+        cflags = cflags or []
+        key = self.key(text, cflags)
+        path = self._entry_path(key)
+
+        try:
+            with open(path) as entry_file:
+                spec = json.load(entry_file)
+            # Track use for the eviction policy
+            os.utime(path)
+            program = cached_bpf_program(spec)
+            logger.debug(
+                "Loaded cached eBPF object {key} in {load_time:.3f} s".format(
+                    key=key[:12], load_time=program.load_time_s
+                )
+            )
+            return program
+        except (OSError, ValueError, KeyError):
+            logger.debug("eBPF object cache miss for {key}".format(key=key[:12]))
+
+        compile_begin = time.perf_counter()
+        spec = self._compile(text, prog_type, cflags)
+        compile_time_s = time.perf_counter() - compile_begin
+        spec["compile_time_s"] = compile_time_s
+
+        self._store(path, spec)
+        program = cached_bpf_program(spec, compile_time_s)
+        logger.debug(
+            "Compiled eBPF object {key} in {compile_time:.3f} s, loaded in {load_time:.3f} s".format(
+                key=key[:12],
+                compile_time=compile_time_s,
+                load_time=program.load_time_s,
+            )
+        )
+        return program
+
+    @staticmethod
+    def _compile(text: str, prog_type: int, cflags: list[str]) -> dict:
+        from bcc import BPF
+        from bcc.libbcc import lib
+
+        program = BPF(text=text, cflags=cflags)
+        module = program.module
+
+        try:
+            tables = []
+            for i in range(lib.bpf_num_tables(module)):
+                name = lib.bpf_table_name(module, i)
+                map_id = lib.bpf_table_id(module, name)
+                tables.append(
+                    {
+                        "name": name.decode(),
+                        "fd": lib.bpf_table_fd(module, name),
+                        "type": lib.bpf_table_type_id(module, map_id),
+                        "key_size": lib.bpf_table_key_size(module, name),
+                        "leaf_size": lib.bpf_table_leaf_size(module, name),
+                        "max_entries": lib.bpf_table_max_entries_id(module, map_id),
+                        "flags": lib.bpf_table_flags_id(module, map_id),
+                        "key_desc": lib.bpf_table_key_desc(module, name).decode(),
+                        "leaf_desc": lib.bpf_table_leaf_desc(module, name).decode(),
+                    }
+                )
+
+            functions = []
+            for i in range(lib.bpf_num_functions(module)):
+                name = lib.bpf_function_name(module, i)
+                functions.append(
+                    {
+                        "name": name.decode(),
+                        "prog_type": prog_type,
+                        "insns": program.dump_func(name).hex(),
+                    }
+                )
+
+            return {
+                "license": lib.bpf_module_license(module).decode(),
+                "kern_version": lib.bpf_module_kern_version(module),
+                "tables": tables,
+                "functions": functions,
+            }
+        finally:
+            program.cleanup()
+
+    def _store(self, path: str, spec: dict) -> None:
+        os.makedirs(self._cache_dir, exist_ok=True)
+        tmp_path = "{path}.{pid}.tmp".format(path=path, pid=os.getpid())
+        with open(tmp_path, "w") as entry_file:
+            json.dump(spec, entry_file)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def entries(self) -> list[dict]:
+        entries = []
+        try:
+            names = os.listdir(self._cache_dir)
+        except FileNotFoundError:
+            return entries
+
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+
+            path = os.path.join(self._cache_dir, name)
+            try:
+                stat = os.stat(path)
+                with open(path) as entry_file:
+                    spec = json.load(entry_file)
+            except (OSError, ValueError):
+                continue
+
+            entries.append(
+                {
+                    "key": name[: -len(".json")],
+                    "path": path,
+                    "size": stat.st_size,
+                    "last_used": stat.st_mtime,
+                    "compile_time_s": spec.get("compile_time_s"),
+                    "functions": [function["name"] for function in spec["functions"]],
+                    "tables": [table["name"] for table in spec["tables"]],
+                }
+            )
+
+        return sorted(entries, key=lambda entry: entry["last_used"], reverse=True)
+
+    def _evict(self) -> None:
+        total_size = 0
+        for entry in self.entries():
+            total_size += entry["size"]
+            if total_size > self._max_size:
+                logger.debug("Evicting eBPF object {key}".format(key=entry["key"][:12]))
+                os.unlink(entry["path"])
+
+    def purge(self) -> int:
+        entries = self.entries()
+        for entry in entries:
+            os.unlink(entry["path"])
+        return len(entries)
@@ -0,0 +1,242 @@
+import ctypes as ct
+import json
+import os
+import struct
+import time
+
+from bcc import BPF
+from bcc.libbcc import lib
+from bcc.table import (
+    BPF_MAP_TYPE_ARRAY,
+    BPF_MAP_TYPE_PERCPU_ARRAY,
+    BPF_MAP_TYPE_PERCPU_HASH,
+    BPF_MAP_TYPE_LRU_PERCPU_HASH,
+    TableArrayMixin,
+)
+from bcc.utils import get_possible_cpus
+
+# struct bpf_insn layout and the pseudo source registers that bcc uses to
+# relocate map references (see linux/bpf.h)
+_BPF_INSN = struct.Struct("<BBhi")
+_BPF_LD_IMM64 = 0x18
+_BPF_PSEUDO_MAP_FD = 1
+_BPF_PSEUDO_MAP_VALUE = 2
+
+_PERCPU_MAP_TYPES = (
+    BPF_MAP_TYPE_PERCPU_ARRAY,
+    BPF_MAP_TYPE_PERCPU_HASH,
+    BPF_MAP_TYPE_LRU_PERCPU_HASH,
+)
+
+
+class cached_bpf_table(TableArrayMixin):
+    def __init__(self, name: str, spec: dict, map_fd: int):
+        self._name = name
+        self.map_fd = map_fd
+        self.ttype = spec["type"]
+        self.max_entries = spec["max_entries"]
+        self.Key = BPF._decode_table_type(json.loads(spec["key_desc"]))
+        self.sLeaf = BPF._decode_table_type(json.loads(spec["leaf_desc"]))
+        self.Leaf = self.sLeaf
+
+        if self.ttype in _PERCPU_MAP_TYPES:
+            # Per-CPU values are laid out in 8-byte aligned slots, one per
+            # possible CPU.
+            self.total_cpu = len(get_possible_cpus())
+            if ct.sizeof(self.sLeaf) % 8 == 0:
+                self.Leaf = self.sLeaf * self.total_cpu
+            elif ct.sizeof(self.sLeaf) <= 8:
+                self.Leaf = ct.c_uint64 * self.total_cpu
+            else:
+                raise IndexError("Leaf must be aligned to 8 bytes")
+
+    def _normalize_key(self, key):
+        if isinstance(key, int):
+            return self.Key(key)
+        return key
+
+    def __getitem__(self, key):
+        leaf = self.Leaf()
+        res = lib.bpf_lookup_elem(
+            self.map_fd, ct.byref(self._normalize_key(key)), ct.byref(leaf)
+        )
+        if res < 0:
+            raise KeyError
+        return leaf
+
+    def __setitem__(self, key, leaf):
+        res = lib.bpf_update_elem(
+            self.map_fd, ct.byref(self._normalize_key(key)), ct.byref(leaf), 0
+        )
+        if res < 0:
+            raise Exception(
+                "Could not update table {name}: {error}".format(
+                    name=self._name, error=os.strerror(ct.get_errno())
+                )
+            )
+
+    def items_update_batch(self, ct_keys, ct_values) -> None:
+        count = ct.c_uint32(len(ct_keys))
+        if (
+            lib.bpf_update_batch(
+                self.map_fd, ct.byref(ct_keys), ct.byref(ct_values), ct.byref(count)
+            )
+            == 0
+        ):
+            return
+
+        # BPF_MAP_UPDATE_BATCH requires Linux 5.6, update key by key otherwise
+        for i in range(len(ct_keys)):
+            self[self.Key.from_buffer_copy(ct_keys, i * ct.sizeof(self.Key))] = (
+                self.Leaf.from_buffer_copy(ct_values, i * ct.sizeof(self.Leaf))
+            )
+
+    def __iter__(self):
+        key = self.Key()
+        next_key = self.Key()
+        res = lib.bpf_get_first_key(self.map_fd, ct.byref(next_key), ct.sizeof(key))
+        while res >= 0:
+            key = next_key
+            yield key
+            next_key = self.Key()
+            res = lib.bpf_get_next_key(self.map_fd, ct.byref(key), ct.byref(next_key))
+
+    def clear(self) -> None:
+        if self.ttype in (BPF_MAP_TYPE_ARRAY, BPF_MAP_TYPE_PERCPU_ARRAY):
+            # Array entries can't be deleted, zero them out instead
+            zero = self.Leaf()
+            for i in range(self.max_entries):
+                self[i] = zero
+        else:
+            for key in list(self):
+                lib.bpf_delete_elem(self.map_fd, ct.byref(key))
+
+    def close(self) -> None:
+        if self.map_fd >= 0:
+            os.close(self.map_fd)
+            self.map_fd = -1
+
+
+class cached_bpf_program:
+    """
+    Compiled eBPF program loaded from an `ebpf_object_cache` entry.
+
+    Exposes the subset of the `bcc.BPF` interface used by the benchmarks.
+    """
+
+    def __init__(self, spec: dict, compile_time_s: float = None):
+        load_begin = time.perf_counter()
+        self._tables = {}
+        self._prog_fds = {}
+        self._tracepoint_fds = {}
+
+        relocations = {}
+        try:
+            for table_spec in spec["tables"]:
+                map_fd = lib.bcc_create_map(
+                    table_spec["type"],
+                    table_spec["name"].encode(),
+                    table_spec["key_size"],
+                    table_spec["leaf_size"],
+                    table_spec["max_entries"],
+                    table_spec["flags"],
+                )
+                if map_fd < 0:
+                    raise Exception(
+                        "Failed to create BPF map {name}: {error}".format(
+                            name=table_spec["name"],
+                            error=os.strerror(ct.get_errno()),
+                        )
+                    )
+
+                self._tables[table_spec["name"]] = cached_bpf_table(
+                    table_spec["name"], table_spec, map_fd
+                )
+                relocations[table_spec["fd"]] = map_fd
+
+            for function_spec in spec["functions"]:
+                insns = self._relocate(
+                    bytes.fromhex(function_spec["insns"]), relocations
+                )
+                prog_fd = lib.bcc_prog_load(
+                    function_spec["prog_type"],
+                    function_spec["name"].encode(),
+                    insns,
+                    len(insns),
+                    spec["license"].encode(),
+                    spec["kern_version"],
+                    0,
+                    None,
+                    0,
+                )
+                if prog_fd < 0:
+                    raise Exception(
+                        "Failed to load BPF program {name}: {error}".format(
+                            name=function_spec["name"],
+                            error=os.strerror(ct.get_errno()),
+                        )
+                    )
+
+                self._prog_fds[function_spec["name"]] = prog_fd
+        except Exception:
+            self.cleanup()
+            raise
+
+        self.compile_time_s = compile_time_s
+        self.load_time_s = time.perf_counter() - load_begin
+
+    @staticmethod
+    def _relocate(insns: bytes, relocations: dict) -> bytes:
+        patched = bytearray(insns)
+        for offset in range(0, len(patched), _BPF_INSN.size):
+            code, regs, off, imm = _BPF_INSN.unpack_from(patched, offset)
+            src_reg = regs >> 4
+            if code != _BPF_LD_IMM64 or src_reg not in (
+                _BPF_PSEUDO_MAP_FD,
+                _BPF_PSEUDO_MAP_VALUE,
+            ):
+                continue
+
+            if imm not in relocations:
+                raise Exception("Cached BPF program references an unknown map")
+
+            _BPF_INSN.pack_into(patched, offset, code, regs, off, relocations[imm])
+
+        return bytes(patched)
+
+    def __getitem__(self, name):
+        if isinstance(name, bytes):
+            name = name.decode()
+        return self._tables[name]
+
+    def attach_tracepoint(self, tp: str, fn_name: str):
+        tp_category, tp_name = tp.split(":")
+        fd = lib.bpf_attach_tracepoint(
+            self._prog_fds[fn_name], tp_category.encode(), tp_name.encode()
+        )
+        if fd < 0:
+            raise Exception(
+                "Failed to attach BPF program {fn_name} to tracepoint {tp}".format(
+                    fn_name=fn_name, tp=tp
+                )
+            )
+        self._tracepoint_fds[tp] = fd
+        return self
+
+    def detach_tracepoint(self, tp: str) -> None:
+        if tp not in self._tracepoint_fds:
+            raise Exception("Tracepoint {tp} is not attached".format(tp=tp))
+
+        lib.bpf_close_perf_event_fd(self._tracepoint_fds.pop(tp))
+        tp_category, tp_name = tp.split(":")
+        lib.bpf_detach_tracepoint(tp_category.encode(), tp_name.encode())
+
+    def cleanup(self) -> None:
+        for tp in list(self._tracepoint_fds):
+            self.detach_tracepoint(tp)
+        for fd in self._prog_fds.values():
+            os.close(fd)
+        self._prog_fds = {}
+        for table in self._tables.values():
+            table.close()
+        self._tables = {}
@@ -0,0 +1,235 @@
+import ctypes as ct
+import mmap
+import os
+import select
+import struct
+import threading
+import time
+
+from bcc import PerfSWConfig, PerfType
+from bcc.libbcc import lib
+from bcc.perf import Perf
+from bcc.utils import get_online_cpus
+
+from lc22bench.stream_records import (
+    PERF_DATA_HEAD_OFFSET,
+    PERF_DATA_TAIL_OFFSET,
+    scan_perf_records,
+    scan_ringbuf_records,
+)
+
+# Size of the samples streamed by the eBPF programs: the event's timestamp
+# and the first 8 bytes of the tracepoint's payload.
+SAMPLE_SIZE = 16
+
+# Interval at which the consumer drains the buffers when it isn't woken up
+_POLL_TIMEOUT_MS = 10
+
+_U64 = struct.Struct("=Q")
+
+
+class _stream_consumer:
+    """
+    Drain the samples streamed by an eBPF program on a thread of its own,
+    counting them in batches rather than handling them one by one.
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self.lost = 0
+        self.busy_ns = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def _poll_fds(self) -> list[int]:
+        raise NotImplementedError
+
+    def _drain(self) -> None:
+        raise NotImplementedError
+
+    def _unmap(self) -> None:
+        raise NotImplementedError
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def _consume(self) -> None:
+        poller = select.poll()
+        for fd in self._poll_fds:
+            poller.register(fd, select.POLLIN)
+
+        while not self._stop.is_set():
+            poller.poll(_POLL_TIMEOUT_MS)
+            self.drain()
+
+    def drain(self) -> None:
+        with self._lock:
+            begin = time.perf_counter_ns()
+            self._drain()
+            self.busy_ns += time.perf_counter_ns() - begin
+
+    def counts(self) -> dict:
+        # Samples are committed once the workload's writes return
+        self.drain()
+        return {
+            "recorded": self.samples,
+            "discarded_events": self.lost,
+            "consumer_busy_ns": self.busy_ns,
+        }
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._unmap()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ringbuf_consumer(_stream_consumer):
+    """
+    Consumer of a BPF ring buffer (BPF_MAP_TYPE_RINGBUF), mapped in this
+    process. Samples the program fails to reserve aren't seen by the
+    consumer: the program has to count them.
+    """
+
+    def __init__(self, map_fd: int, page_count: int):
+        _stream_consumer.__init__(self)
+        self._map_fd = map_fd
+        self._size = page_count * mmap.PAGESIZE
+        self._consumer_page = mmap.mmap(
+            map_fd, mmap.PAGESIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE
+        )
+        # The producer page, followed by the data pages, mapped twice in a
+        # row so that records wrapping around are contiguous
+        self._producer = mmap.mmap(
+            map_fd,
+            mmap.PAGESIZE + 2 * self._size,
+            mmap.MAP_SHARED,
+            mmap.PROT_READ,
+            offset=mmap.PAGESIZE,
+        )
+
+    @property
+    def _poll_fds(self) -> list[int]:
+        return [self._map_fd]
+
+    def _drain(self) -> None:
+        (consumer_pos,) = _U64.unpack_from(self._consumer_page, 0)
+        (producer_pos,) = _U64.unpack_from(self._producer, 0)
+        if producer_pos == consumer_pos:
+            return
+
+        start = mmap.PAGESIZE + (consumer_pos & (self._size - 1))
+        samples, consumed = scan_ringbuf_records(
+            self._producer[start : start + producer_pos - consumer_pos], SAMPLE_SIZE
+        )
+        _U64.pack_into(self._consumer_page, 0, consumer_pos + consumed)
+        self.samples += samples
+
+    def _unmap(self) -> None:
+        self._consumer_page.close()
+        self._producer.close()
+
+
+class perf_buffer_consumer(_stream_consumer):
+    """
+    Consumer of the per-CPU perf buffers of a BPF_MAP_TYPE_PERF_EVENT_ARRAY,
+    which it opens on every online CPU and installs in the array.
+    """
+
+    def __init__(self, map_fd: int, page_count: int):
+        _stream_consumer.__init__(self)
+        self._data_size = page_count * mmap.PAGESIZE
+        self._fds = []
+        self._buffers = []
+
+        try:
+            for cpu in get_online_cpus():
+                self._open(map_fd, cpu)
+        except OSError:
+            self._unmap()
+            raise
+
+    def _open(self, map_fd: int, cpu: int) -> None:
+        attr = Perf.perf_event_attr()
+        attr.type = PerfType.SOFTWARE
+        attr.config = PerfSWConfig.BPF_OUTPUT
+        attr.sample_type = Perf.PERF_SAMPLE_RAW
+        attr.sample_period = 1
+        # Wake the consumer up once half of the buffer is filled, rather
+        # than for every sample
+        attr.watermark = 1
+        attr.wakeup_watermark = self._data_size // 2
+
+        fd = Perf.syscall(
+            Perf.NR_PERF_EVENT_OPEN,
+            ct.byref(attr),
+            -1,
+            cpu,
+            -1,
+            Perf.PERF_FLAG_FD_CLOEXEC,
+        )
+        if fd < 0:
+            errno_ = ct.get_errno()
+            raise OSError(errno_, os.strerror(errno_))
+        self._fds.append(fd)
+
+        self._buffers.append(
+            mmap.mmap(
+                fd,
+                mmap.PAGESIZE + self._data_size,
+                mmap.MAP_SHARED,
+                mmap.PROT_READ | mmap.PROT_WRITE,
+            )
+        )
+
+        key = ct.c_int(cpu)
+        value = ct.c_int(fd)
+        if (
+            lib.bpf_update_elem(map_fd, ct.byref(key), ct.byref(value), 0) < 0
+            or Perf.ioctl(fd, Perf.PERF_EVENT_IOC_ENABLE, 0) < 0
+        ):
+            errno_ = ct.get_errno()
+            raise OSError(errno_, os.strerror(errno_))
+
+    @property
+    def _poll_fds(self) -> list[int]:
+        return self._fds
+
+    def _drain(self) -> None:
+        for buffer in self._buffers:
+            (head,) = _U64.unpack_from(buffer, PERF_DATA_HEAD_OFFSET)
+            (tail,) = _U64.unpack_from(buffer, PERF_DATA_TAIL_OFFSET)
+            if head == tail:
+                continue
+
+            # Unlike BPF ring buffers, the data pages are mapped once
+            start = tail % self._data_size
+            end = start + head - tail
+            data = buffer[
+                mmap.PAGESIZE + start : mmap.PAGESIZE + min(end, self._data_size)
+            ]
+            if end > self._data_size:
+                data += buffer[mmap.PAGESIZE : mmap.PAGESIZE + end - self._data_size]
+
+            samples, lost, consumed = scan_perf_records(data, SAMPLE_SIZE)
+            _U64.pack_into(buffer, PERF_DATA_TAIL_OFFSET, tail + consumed)
+            self.samples += samples
+            self.lost += lost
+
+    def _unmap(self) -> None:
+        for buffer in self._buffers:
+            buffer.close()
+        self._buffers = []
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
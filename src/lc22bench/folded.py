@@ -0,0 +1,93 @@
+from typing import Optional
+
+# Folded stacks, as consumed by flamegraph.pl and speedscope: one line per
+# distinct stack, its frames from the root to the leaf separated by
+# semicolons, then its sample count. Kernel frames are suffixed with "_[k]".
+KERNEL_FRAME_SUFFIX = "_[k]"
+
+
+def merge_folded(folded: dict[str, int], other: dict[str, int]) -> dict[str, int]:
+    merged = dict(folded)
+    for stack, count in other.items():
+        merged[stack] = merged.get(stack, 0) + count
+    return merged
+
+
+def write_folded(path: str, folded: dict[str, int]) -> None:
+    with open(path, "w") as folded_file:
+        for stack, count in sorted(folded.items()):
+            folded_file.write("{stack} {count}\n".format(stack=stack, count=count))
+
+
+def read_folded(path: str) -> dict[str, int]:
+    folded = {}
+    with open(path) as folded_file:
+        for line in folded_file:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                folded[stack] = folded.get(stack, 0) + int(count)
+    return folded
+
+
+def function_shares(folded: dict[str, int]) -> dict[str, tuple[float, float]]:
+    """
+    Share of the samples in which each function is the leaf (self) and in
+    which it is on the stack (inclusive), counting recursive calls once.
+    """
+    total = sum(folded.values())
+    self_counts = {}
+    inclusive_counts = {}
+    for stack, count in folded.items():
+        frames = stack.split(";")
+        self_counts[frames[-1]] = self_counts.get(frames[-1], 0) + count
+        for frame in set(frames):
+            inclusive_counts[frame] = inclusive_counts.get(frame, 0) + count
+
+    return {
+        frame: (self_counts.get(frame, 0) / total, inclusive / total)
+        for frame, inclusive in inclusive_counts.items()
+    }
+
+
+def diff_functions(
+    baseline: dict[str, int], candidate: dict[str, int], top: Optional[int] = None
+) -> list[tuple[str, float, float, float, float]]:
+    """
+    Functions whose self share of the samples changed the most between two
+    profiles: (function, baseline self, candidate self, baseline inclusive,
+    candidate inclusive), the largest absolute self difference first.
+    """
+    baseline_shares = function_shares(baseline)
+    candidate_shares = function_shares(candidate)
+    rows = []
+    for frame in set(baseline_shares) | set(candidate_shares):
+        baseline_self, baseline_inclusive = baseline_shares.get(frame, (0.0, 0.0))
+        candidate_self, candidate_inclusive = candidate_shares.get(frame, (0.0, 0.0))
+        rows.append(
+            (
+                frame,
+                baseline_self,
+                candidate_self,
+                baseline_inclusive,
+                candidate_inclusive,
+            )
+        )
+
+    rows.sort(key=lambda row: (-abs(row[2] - row[1]), row[0]))
+    return rows[:top] if top is not None else rows
+
+
+def write_differential_folded(
+    path: str, baseline: dict[str, int], candidate: dict[str, int]
+) -> None:
+    # "STACK BASELINE_COUNT CANDIDATE_COUNT", the input of flamegraph.pl's
+    # differential flame graphs (as produced by difffolded.pl)
+    with open(path, "w") as folded_file:
+        for stack in sorted(set(baseline) | set(candidate)):
+            folded_file.write(
+                "{stack} {baseline} {candidate}\n".format(
+                    stack=stack,
+                    baseline=baseline.get(stack, 0),
+                    candidate=candidate.get(stack, 0),
+                )
+            )
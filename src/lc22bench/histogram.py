@@ -0,0 +1,150 @@
+from typing import Optional
+
+import numpy
+
+# Quantiles reported for the latency of the sampled events
+LATENCY_QUANTILES = {"p50": 0.5, "p99": 0.99, "p999": 0.999}
+
+
+def bucket_bounds(
+    indices: numpy.ndarray, sub_bucket_bits: int
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Lower (inclusive) and upper (exclusive) bounds of the buckets of the
+    workload's log-linear histograms: values below 2^sub_bucket_bits have a
+    bucket of their own, then every power of two range is split into
+    2^sub_bucket_bits buckets of equal width.
+    """
+    indices = numpy.asarray(indices, dtype=numpy.uint64)
+    sub_bucket_count = numpy.uint64(1 << sub_bucket_bits)
+    shift = numpy.where(
+        indices < sub_bucket_count, 0, indices // sub_bucket_count - 1
+    ).astype(numpy.uint64)
+    mantissa = numpy.where(
+        indices < sub_bucket_count,
+        indices,
+        sub_bucket_count + indices % sub_bucket_count,
+    ).astype(numpy.uint64)
+    return mantissa << shift, (mantissa + numpy.uint64(1)) << shift
+
+
+class latency_histogram:
+    """
+    Latencies of the events sampled by the workload, in ticks of its cycle
+    counter: the count of every non-empty bucket and the largest value.
+    """
+
+    def __init__(
+        self,
+        sub_bucket_bits: int,
+        ticks_per_ns: float,
+        counts: Optional[dict[int, int]] = None,
+        max_ticks: int = 0,
+    ):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.ticks_per_ns = ticks_per_ns
+        self.counts = dict(counts or {})
+        self.max_ticks = max_ticks
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.counts.values())
+
+    def merge(self, other: "latency_histogram") -> "latency_histogram":
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError("Can't merge histograms of different resolutions")
+
+        counts = dict(self.counts)
+        for index, count in other.counts.items():
+            counts[index] = counts.get(index, 0) + count
+
+        # The counter's rate is constant: calibrations only differ by their
+        # error, which is averaged
+        total = self.sample_count + other.sample_count
+        ticks_per_ns = (
+            (
+                self.ticks_per_ns * self.sample_count
+                + other.ticks_per_ns * other.sample_count
+            )
+            / total
+            if total
+            else self.ticks_per_ns
+        )
+        return latency_histogram(
+            self.sub_bucket_bits,
+            ticks_per_ns,
+            counts,
+            max(self.max_ticks, other.max_ticks),
+        )
+
+    def quantiles_ns(self, quantiles: dict[str, float]) -> dict[str, Optional[float]]:
+        """
+        Latency below which each quantile of the samples falls, in ns: the
+        upper bound of its bucket, capped by the largest value.
+        """
+        if not self.counts:
+            return {name: None for name in quantiles}
+
+        indices = numpy.array(sorted(self.counts), dtype=numpy.uint64)
+        cumulative = numpy.cumsum([self.counts[index] for index in indices.tolist()])
+        _, upper_bounds = bucket_bounds(indices, self.sub_bucket_bits)
+        values = {}
+        for name, quantile in quantiles.items():
+            position = int(numpy.searchsorted(cumulative, quantile * cumulative[-1]))
+            ticks = min(int(upper_bounds[position]) - 1, self.max_ticks)
+            values[name] = ticks / self.ticks_per_ns
+        return values
+
+    @property
+    def max_ns(self) -> float:
+        return self.max_ticks / self.ticks_per_ns
+
+    def to_dict(self) -> dict:
+        return {
+            "sub_bucket_bits": self.sub_bucket_bits,
+            "ticks_per_ns": self.ticks_per_ns,
+            "max_ticks": self.max_ticks,
+            # JSON object keys are strings
+            "counts": {str(index): count for index, count in self.counts.items()},
+        }
+
+    @staticmethod
+    def from_dict(value: dict) -> "latency_histogram":
+        return latency_histogram(
+            value["sub_bucket_bits"],
+            value["ticks_per_ns"],
+            {int(index): count for index, count in value["counts"].items()},
+            value["max_ticks"],
+        )
+
+
+def parse_workload_latency(lines: list[str]) -> Optional[latency_histogram]:
+    """
+    Merge the per-thread histograms printed by the workload:
+        latency clock: TICKS_PER_NS ticks per ns, BITS sub-bucket bits
+        latency histogram: max MAX_TICKS BUCKET:COUNT,...
+    Returns None if the workload didn't sample latencies.
+    """
+    histogram = None
+    for line in lines:
+        if line.startswith("latency clock:"):
+            fields = line.split(":", 1)[1].split()
+            ticks_per_ns, sub_bucket_bits = float(fields[0]), int(fields[4])
+        elif line.startswith("latency histogram:"):
+            fields = line.split(":", 1)[1].split()
+            counts = {}
+            if len(fields) > 2:
+                for bucket in fields[2].split(","):
+                    index, count = bucket.split(":")
+                    counts[int(index)] = int(count)
+
+            thread_histogram = latency_histogram(
+                sub_bucket_bits, ticks_per_ns, counts, int(fields[1])
+            )
+            histogram = (
+                thread_histogram
+                if histogram is None
+                else histogram.merge(thread_histogram)
+            )
+
+    return histogram
@@ -0,0 +1,55 @@
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import numpy
+
+KEY_DISTRIBUTIONS = ["uniform", "zipfian", "sequential"]
+
+# Length of the key sequences replayed by the keyed map scenarios, a power of
+# two; it bounds the number of distinct keys.
+KEY_SEQUENCE_LENGTH = 1 << 16
+MAX_KEY_COUNT = KEY_SEQUENCE_LENGTH
+
+# Exponent of the zipfian distribution, as in YCSB
+ZIPFIAN_EXPONENT = 0.99
+
+
+def key_sequence(
+    key_count: int,
+    distribution: str,
+    length: int = KEY_SEQUENCE_LENGTH,
+    rng: Optional["numpy.random.Generator"] = None,
+) -> "numpy.ndarray":
+    """
+    Sequence of `length` keys among `key_count` distinct keys, 0 to
+    key_count - 1, following `distribution`:
+      - uniform: every key appears equally often, in random order,
+      - zipfian: the i-th most frequent key is drawn with a probability
+        proportional to 1 / i^ZIPFIAN_EXPONENT; the ranks are shuffled so that
+        hot keys aren't adjacent,
+      - sequential: keys in increasing order, wrapping around.
+    """
+    import numpy
+
+    if not 1 <= key_count <= MAX_KEY_COUNT:
+        raise ValueError(
+            "Key count must be between 1 and {max}".format(max=MAX_KEY_COUNT)
+        )
+
+    # Seeded so that runs replay the same sequence
+    rng = rng or numpy.random.default_rng(0)
+    if distribution == "uniform":
+        # Every key as often as the others (up to one occurrence), in random
+        # order: drawing keys independently would miss a third of them when
+        # there are as many keys as events in the sequence
+        keys = rng.permutation(numpy.resize(numpy.arange(key_count), length))
+    elif distribution == "zipfian":
+        weights = 1.0 / numpy.arange(1, key_count + 1) ** ZIPFIAN_EXPONENT
+        ranks = rng.choice(key_count, size=length, p=weights / weights.sum())
+        keys = rng.permutation(key_count)[ranks]
+    elif distribution == "sequential":
+        keys = numpy.arange(length) % key_count
+    else:
+        raise ValueError("Unknown key distribution: " + distribution)
+
+    return keys.astype(numpy.uint32)
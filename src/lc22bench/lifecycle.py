@@ -0,0 +1,89 @@
+import logging
+import os
+import select
+import signal
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# Time given to a process to exit after SIGTERM, then SIGKILL
+TERMINATE_TIMEOUT_S = 10.0
+
+
+def _wait_pidfd(pidfd: int, timeout_s: float) -> bool:
+    # A pidfd becomes readable once its process has exited
+    poller = select.poll()
+    poller.register(pidfd, select.POLLIN)
+    return bool(poller.poll(timeout_s * 1000))
+
+
+def terminate_process(pid: int, timeout_s: float = TERMINATE_TIMEOUT_S) -> None:
+    """
+    Terminate a process, which need not be a child of this one, and wait for
+    it to exit. It is killed if it is still running after `timeout_s`.
+    """
+    try:
+        pidfd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return
+
+    try:
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                signal.pidfd_send_signal(pidfd, sig)
+            except ProcessLookupError:
+                return
+
+            if _wait_pidfd(pidfd, timeout_s):
+                return
+
+            logger.warning(
+                "Process {pid} still running {timeout_s} s after {signal}".format(
+                    pid=pid, timeout_s=timeout_s, signal=sig.name
+                )
+            )
+
+        raise TimeoutError("Failed to kill process {pid}".format(pid=pid))
+    finally:
+        os.close(pidfd)
+
+
+def loaded_modules() -> dict[str, int]:
+    """Reference count of every loaded kernel module."""
+    modules = {}
+    try:
+        with open("/proc/modules") as proc_modules:
+            for line in proc_modules:
+                name, _, refcount = line.split(" ")[:3]
+                modules[name] = int(refcount)
+    except FileNotFoundError:
+        pass
+    return modules
+
+
+def module_name(name: str) -> str:
+    # modprobe accepts either; the kernel reports module names with '_'
+    return name.replace("-", "_")
+
+
+def unload_modules(names: set[str]) -> None:
+    """
+    Unload kernel modules, dependents first: modules are unloaded once no
+    other module uses them.
+    """
+    remaining = {module_name(name) for name in names}
+    while remaining:
+        modules = loaded_modules()
+        remaining &= modules.keys()
+        unused = sorted(name for name in remaining if modules[name] == 0)
+        if not unused:
+            break
+
+        for name in unused:
+            subprocess.run(["rmmod", name], check=False)
+            remaining.discard(name)
+
+    if remaining:
+        logger.warning(
+            "Kernel modules still in use, not unloaded: " + ", ".join(sorted(remaining))
+        )
@@ -0,0 +1,136 @@
+import xml.etree.ElementTree as ElementTree
+
+from typing import Optional
+
+# Defaults applied by `lttng enable-channel`
+_READ_TIMER_INTERVAL_US = {"KERNEL": 200000, "UST": 0}
+
+
+def _add(parent: ElementTree.Element, tag: str, text=None) -> ElementTree.Element:
+    element = ElementTree.SubElement(parent, tag)
+    if text is not None:
+        element.text = str(text).lower() if isinstance(text, bool) else str(text)
+    return element
+
+
+def _session_description(
+    session_name: str,
+    domain: str,
+    channel_name: str,
+    subbuf_size: int,
+    num_subbuf: int,
+    events: list[str],
+    overwrite: bool,
+    output_type: str,
+    read_timer_interval_us: Optional[int],
+    output_path: Optional[str],
+) -> str:
+    sessions = ElementTree.Element("sessions")
+    session = _add(sessions, "session")
+    _add(session, "name", session_name)
+
+    domain_element = _add(_add(session, "domains"), "domain")
+    _add(domain_element, "type", domain)
+    _add(domain_element, "buffer_type", "GLOBAL" if domain == "KERNEL" else "PER_UID")
+
+    channel = _add(_add(domain_element, "channels"), "channel")
+    _add(channel, "name", channel_name)
+    _add(channel, "enabled", True)
+    _add(channel, "overwrite_mode", "OVERWRITE" if overwrite else "DISCARD")
+    _add(channel, "subbuffer_size", subbuf_size)
+    _add(channel, "subbuffer_count", num_subbuf)
+    _add(channel, "switch_timer_interval", 0)
+    _add(
+        channel,
+        "read_timer_interval",
+        (
+            _READ_TIMER_INTERVAL_US[domain]
+            if read_timer_interval_us is None
+            else read_timer_interval_us
+        ),
+    )
+    _add(channel, "output_type", output_type)
+    _add(channel, "tracefile_size", 0)
+    _add(channel, "tracefile_count", 0)
+    _add(channel, "live_timer_interval", 0)
+
+    events_element = _add(channel, "events")
+    for name in events:
+        event = _add(events_element, "event")
+        _add(event, "name", name)
+        _add(event, "enabled", True)
+        _add(event, "type", "TRACEPOINT")
+
+    _add(session, "started", True)
+    _add(_add(session, "attributes"), "snapshot_mode", output_path is None)
+    if output_path is not None:
+        consumer_output = _add(_add(session, "output"), "consumer_output")
+        _add(consumer_output, "enabled", True)
+        _add(_add(consumer_output, "destination"), "path", output_path)
+
+    return ElementTree.tostring(sessions, encoding="unicode", xml_declaration=True)
+
+
+def snapshot_session_description(
+    session_name: str,
+    domain: str,
+    channel_name: str,
+    subbuf_size: int,
+    num_subbuf: int,
+    events: list[str],
+    read_timer_interval_us: Optional[int] = None,
+) -> str:
+    """
+    Session configuration, in the format of `lttng save`, of a started
+    snapshot session with a single channel. `domain` is "KERNEL" or "UST"
+    (per-UID buffers).
+
+    Loading it with `lttng load` is equivalent to `lttng create --snapshot`,
+    `lttng enable-channel`, `lttng enable-event` and `lttng start`.
+    """
+    # Snapshot sessions require overwrite mode and mmap output
+    return _session_description(
+        session_name,
+        domain,
+        channel_name,
+        subbuf_size,
+        num_subbuf,
+        events,
+        True,
+        "MMAP",
+        read_timer_interval_us,
+        None,
+    )
+
+
+def streaming_session_description(
+    session_name: str,
+    domain: str,
+    channel_name: str,
+    subbuf_size: int,
+    num_subbuf: int,
+    events: list[str],
+    output_path: str,
+    output_type: str = "MMAP",
+    read_timer_interval_us: Optional[int] = None,
+) -> str:
+    """
+    Session configuration of a started session with a single channel in
+    discard mode, whose consumer daemon writes the trace to `output_path`.
+    `output_type` is "MMAP" or, for the kernel domain only, "SPLICE".
+
+    Loading it is equivalent to `lttng create --output`, `lttng
+    enable-channel --discard`, `lttng enable-event` and `lttng start`.
+    """
+    return _session_description(
+        session_name,
+        domain,
+        channel_name,
+        subbuf_size,
+        num_subbuf,
+        events,
+        False,
+        output_type,
+        read_timer_interval_us,
+        output_path,
+    )
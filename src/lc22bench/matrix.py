@@ -0,0 +1,311 @@
+import itertools
+import json
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Host-wide resources used by each scenario. Scenarios that share a resource
+# can't be isolated from one another and are never run concurrently:
+#   - all LTTng scenarios run their own lttng-sessiond, and only one can run
+#     as root (it takes the global run directory); they also unload the LTTng
+#     modules it loaded on teardown,
+#   - kernel scenarios share the lttng-bench module, whose tracepoint fires
+#     for every process writing to /proc/lttng-bench-event,
+#   - the UST baseline would be traced by the session of a concurrent LTTng
+#     scenario.
+SCENARIO_RESOURCES = {
+    "baseline-empty": set(),
+    "baseline-kernel": {"lttng-bench"},
+    "baseline-ust": {"lttng-sessiond"},
+    "ebpf-keyed-map": {"lttng-bench"},
+    "ebpf-map": {"lttng-bench"},
+    "ebpf-perfbuf": {"lttng-bench"},
+    "ebpf-ringbuf": {"lttng-bench"},
+    "lttng-kernel-map": {"lttng-sessiond", "lttng-bench"},
+    "lttng-kernel-ringbuffer": {"lttng-sessiond", "lttng-bench"},
+    "lttng-ust-map": {"lttng-sessiond"},
+    "lttng-ust-ringbuffer": {"lttng-sessiond"},
+}
+
+
+# Thread placement policies of the workload, which also accepts a CPU list
+PLACEMENT_POLICIES = ["ordered", "compact", "spread", "core"]
+
+
+def scenario_resources(scenario: str) -> set[str]:
+    # Unknown scenarios are assumed to conflict with everything
+    return SCENARIO_RESOURCES.get(scenario, {"*"})
+
+
+def parse_cpu_list(cpu_list: str) -> list[int]:
+    cpus = []
+    for cpu_range in cpu_list.strip().split(","):
+        if not cpu_range:
+            continue
+        if "-" in cpu_range:
+            first, last = cpu_range.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(cpu_range))
+    return cpus
+
+
+def format_cpu_list(cpus: list[int]) -> str:
+    ranges = []
+    for _, group in itertools.groupby(
+        enumerate(sorted(cpus)), lambda item: item[1] - item[0]
+    ):
+        group = [cpu for _, cpu in group]
+        if len(group) == 1:
+            ranges.append(str(group[0]))
+        else:
+            ranges.append("{first}-{last}".format(first=group[0], last=group[-1]))
+    return ",".join(ranges)
+
+
+class cpu_slot:
+    def __init__(self, name: str, cpus: list[int]):
+        self.name = name
+        self.cpus = cpus
+
+    @property
+    def label(self) -> str:
+        return "{name}:{cpus}".format(name=self.name, cpus=format_cpu_list(self.cpus))
+
+
+def numa_nodes(sysfs_path: str = "/sys/devices/system/node") -> dict[int, list[int]]:
+    nodes = {}
+    try:
+        entries = os.listdir(sysfs_path)
+    except FileNotFoundError:
+        return nodes
+
+    for entry in entries:
+        if not entry.startswith("node") or not entry[len("node") :].isdigit():
+            continue
+        with open(os.path.join(sysfs_path, entry, "cpulist")) as cpulist:
+            nodes[int(entry[len("node") :])] = parse_cpu_list(cpulist.read())
+
+    return nodes
+
+
+def cpu_slots(cpus_per_slot: int = 0) -> list[cpu_slot]:
+    """
+    Partition the CPUs this process may run on into disjoint slots.
+
+    Slots follow NUMA nodes unless `cpus_per_slot` is set, in which case the
+    CPUs of each node are split in chunks of that size.
+    """
+    allowed_cpus = os.sched_getaffinity(0)
+    nodes = numa_nodes() or {0: sorted(allowed_cpus)}
+
+    slots = []
+    for node_id, node_cpus in sorted(nodes.items()):
+        node_cpus = [cpu for cpu in node_cpus if cpu in allowed_cpus]
+        if not node_cpus:
+            continue
+
+        chunk_size = cpus_per_slot or len(node_cpus)
+        for chunk_index, first in enumerate(range(0, len(node_cpus), chunk_size)):
+            chunk = node_cpus[first : first + chunk_size]
+            if len(chunk) < chunk_size:
+                # Leftover CPUs would make a smaller, non-comparable slot
+                break
+
+            name = "node{node_id}".format(node_id=node_id)
+            if cpus_per_slot:
+                name += ".{chunk_index}".format(chunk_index=chunk_index)
+            slots.append(cpu_slot(name, chunk))
+
+    return slots
+
+
+def load_matrix(path: str) -> dict:
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("TOML matrix files require Python 3.11 or later")
+
+        with open(path, "rb") as matrix_file:
+            return tomllib.load(matrix_file)
+
+    with open(path) as matrix_file:
+        return json.load(matrix_file)
+
+
+class matrix_job:
+    def __init__(self, job_id: str, scenario: str, parameters: dict):
+        self.job_id = job_id
+        self.scenario = scenario
+        self.parameters = parameters
+
+    @property
+    def resources(self) -> set[str]:
+        return scenario_resources(self.scenario)
+
+
+def expand_matrix(matrix: dict) -> list[matrix_job]:
+    """
+    Expand every scenario of a matrix into jobs, one per combination of its
+    swept (list-valued) parameters.
+
+    Top-level keys other than `scenario` are defaults shared by all scenarios.
+    """
+    defaults = {key: value for key, value in matrix.items() if key != "scenario"}
+    jobs = []
+
+    for scenario in matrix.get("scenario", []):
+        scenario = dict(scenario)
+        name = scenario.pop("name")
+        parameters = {**defaults, **scenario}
+
+        swept = [key for key, value in parameters.items() if isinstance(value, list)]
+        for values in itertools.product(*(parameters[key] for key in swept)):
+            job_parameters = {**parameters, **dict(zip(swept, values))}
+            job_id = "{index:03d}-{name}".format(index=len(jobs), name=name)
+            jobs.append(matrix_job(job_id, name, job_parameters))
+
+    return jobs
+
+
+def _format_options(parameters: dict) -> list[str]:
+    args = []
+    for key, value in parameters.items():
+        if value is False or value is None:
+            continue
+
+        args.append("--" + key)
+        if value is not True:
+            args.append(str(value))
+    return args
+
+
+class matrix_runner:
+    """
+    Run matrix jobs concurrently on disjoint CPU slots.
+
+    A job starts as soon as a slot is free and none of the host-wide resources
+    it needs is held by a running job. Jobs are otherwise started in order.
+    """
+
+    def __init__(
+        self,
+        slots: list[cpu_slot],
+        base_command: list[str],
+        global_options: set[str],
+        output_dir: str,
+    ):
+        self._slots = slots
+        self._base_command = base_command
+        self._global_options = global_options
+        self._output_dir = output_dir
+
+    def command(self, job: matrix_job, slot: cpu_slot) -> list[str]:
+        parameters = dict(job.parameters)
+        # Use every CPU of the slot unless the matrix says otherwise
+        parameters.setdefault("thread-count", len(slot.cpus))
+
+        global_parameters = {
+            key: value
+            for key, value in parameters.items()
+            if key in self._global_options
+        }
+        scenario_parameters = {
+            key: value
+            for key, value in parameters.items()
+            if key not in self._global_options
+        }
+
+        return (
+            self._base_command
+            + _format_options(global_parameters)
+            + [job.scenario]
+            + _format_options(scenario_parameters)
+        )
+
+    def _start(self, job: matrix_job, slot: cpu_slot, done: queue.Queue) -> dict:
+        command = self.command(job, slot)
+        log_path = os.path.join(self._output_dir, job.job_id + ".log")
+        record = {
+            "job": job.job_id,
+            "scenario": job.scenario,
+            "parameters": job.parameters,
+            "placement": slot.label,
+            "cpus": slot.cpus,
+            "command": command,
+            "log": log_path,
+            "start_time": time.time(),
+        }
+
+        logger.info(
+            "Starting {job} on {placement}".format(job=job.job_id, placement=slot.label)
+        )
+        log_file = open(log_path, "w")
+        env = dict(os.environ, LC22BENCH_PLACEMENT=slot.label)
+        process = subprocess.Popen(
+            command,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            env=env,
+            preexec_fn=lambda: os.sched_setaffinity(0, slot.cpus),
+        )
+
+        def wait():
+            process.wait()
+            log_file.close()
+            done.put((job, slot, record, process.returncode))
+
+        threading.Thread(target=wait, daemon=True).start()
+        return record
+
+    def run(self, jobs: list[matrix_job]) -> list[dict]:
+        os.makedirs(self._output_dir, exist_ok=True)
+        pending = list(jobs)
+        free_slots = list(self._slots)
+        held_resources = set()
+        running = 0
+        done = queue.Queue()
+        records = []
+
+        with open(os.path.join(self._output_dir, "placements.jsonl"), "a") as index:
+            while pending or running:
+                for job in list(pending):
+                    if not free_slots:
+                        break
+                    if "*" in held_resources or (
+                        running
+                        and ("*" in job.resources or job.resources & held_resources)
+                    ):
+                        continue
+
+                    pending.remove(job)
+                    held_resources |= job.resources
+                    running += 1
+                    self._start(job, free_slots.pop(0), done)
+
+                job, slot, record, returncode = done.get()
+                running -= 1
+                held_resources -= job.resources
+                free_slots.append(slot)
+                free_slots.sort(key=lambda slot: self._slots.index(slot))
+
+                record["end_time"] = time.time()
+                record["returncode"] = returncode
+                if returncode != 0:
+                    logger.error(
+                        "{job} failed with exit code {returncode}, see {log}".format(
+                            job=job.job_id, returncode=returncode, log=record["log"]
+                        )
+                    )
+
+                index.write(json.dumps(record) + "\n")
+                index.flush()
+                records.append(record)
+
+        return records
@@ -0,0 +1,254 @@
+import ctypes as ct
+import errno
+import logging
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+# perf_event_open(2) definitions (see linux/perf_event.h). They are defined
+# here rather than taken from bcc so that counting events doesn't load
+# libbcc, which userspace scenarios don't otherwise need.
+_PERF_TYPE_HARDWARE = 0
+_PERF_TYPE_SOFTWARE = 1
+_PERF_COUNT_HW_CPU_CYCLES = 0
+_PERF_COUNT_HW_INSTRUCTIONS = 1
+_PERF_COUNT_HW_CACHE_MISSES = 3
+_PERF_COUNT_SW_TASK_CLOCK = 1
+_PERF_COUNT_SW_PAGE_FAULTS = 2
+_PERF_COUNT_SW_CONTEXT_SWITCHES = 3
+_PERF_COUNT_SW_CPU_MIGRATIONS = 4
+_PERF_FORMAT_TOTAL_TIME_ENABLED = 1 << 0
+_PERF_FORMAT_TOTAL_TIME_RUNNING = 1 << 1
+_PERF_FORMAT_GROUP = 1 << 3
+_PERF_FLAG_FD_CLOEXEC = 1 << 3
+_PERF_EVENT_IOC_ENABLE = 0x2400
+_PERF_EVENT_IOC_DISABLE = 0x2401
+_PERF_EVENT_IOC_RESET = 0x2403
+_PERF_IOC_FLAG_GROUP = 1
+# Syscall numbers differ per architecture; counters are unavailable on others
+_NR_PERF_EVENT_OPEN = {
+    "x86_64": 298,
+    "i686": 336,
+    "aarch64": 241,
+    "armv7l": 364,
+    "riscv64": 241,
+    "ppc64le": 319,
+    "s390x": 331,
+}.get(os.uname().machine)
+
+_libc = ct.CDLL(None, use_errno=True)
+
+
+class _perf_event_attr(ct.Structure):
+    # PERF_ATTR_SIZE_VER0 layout; the kernel zero-extends older versions
+    _fields_ = [
+        ("type", ct.c_uint32),
+        ("size", ct.c_uint32),
+        ("config", ct.c_uint64),
+        ("sample_period", ct.c_uint64),
+        ("sample_type", ct.c_uint64),
+        ("read_format", ct.c_uint64),
+        # disabled is bit 0 of the flags
+        ("flags", ct.c_uint64),
+        ("wakeup_events", ct.c_uint32),
+        ("bp_type", ct.c_uint32),
+        ("config1", ct.c_uint64),
+    ]
+
+
+# Counter groups opened on every CPU. The counters of a group are scheduled
+# together, which keeps ratios such as instructions/cycles consistent when
+# the PMU has to multiplex them. The first counter of a group is its leader.
+HARDWARE_COUNTERS = [
+    ("cycles", _PERF_TYPE_HARDWARE, _PERF_COUNT_HW_CPU_CYCLES),
+    ("instructions", _PERF_TYPE_HARDWARE, _PERF_COUNT_HW_INSTRUCTIONS),
+    ("cache_misses", _PERF_TYPE_HARDWARE, _PERF_COUNT_HW_CACHE_MISSES),
+]
+SOFTWARE_COUNTERS = [
+    ("task_clock_ns", _PERF_TYPE_SOFTWARE, _PERF_COUNT_SW_TASK_CLOCK),
+    ("context_switches", _PERF_TYPE_SOFTWARE, _PERF_COUNT_SW_CONTEXT_SWITCHES),
+    ("cpu_migrations", _PERF_TYPE_SOFTWARE, _PERF_COUNT_SW_CPU_MIGRATIONS),
+    ("page_faults", _PERF_TYPE_SOFTWARE, _PERF_COUNT_SW_PAGE_FAULTS),
+]
+COUNTER_NAMES = [name for name, _, _ in HARDWARE_COUNTERS + SOFTWARE_COUNTERS]
+
+_READ_FORMAT = (
+    _PERF_FORMAT_GROUP
+    | _PERF_FORMAT_TOTAL_TIME_ENABLED
+    | _PERF_FORMAT_TOTAL_TIME_RUNNING
+)
+
+# Errors returned when a counter isn't supported, typically hardware counters
+# in virtual machines without a virtualized PMU.
+_UNSUPPORTED_ERRNOS = {errno.ENOENT, errno.ENODEV, errno.EOPNOTSUPP, errno.EINVAL}
+
+
+def _perf_event_open(perf_type: int, config: int, cpu: int, group_fd: int) -> int:
+    if _NR_PERF_EVENT_OPEN is None:
+        raise OSError(
+            errno.ENOSYS,
+            "perf_event_open isn't supported on {machine}".format(
+                machine=os.uname().machine
+            ),
+        )
+
+    attr = _perf_event_attr()
+    attr.type = perf_type
+    attr.size = ct.sizeof(attr)
+    attr.config = config
+    attr.read_format = _READ_FORMAT
+    # Members follow their leader, which is enabled explicitly
+    attr.flags = 1 if group_fd == -1 else 0
+
+    fd = _libc.syscall(
+        _NR_PERF_EVENT_OPEN,
+        ct.byref(attr),
+        -1,
+        cpu,
+        group_fd,
+        _PERF_FLAG_FD_CLOEXEC,
+    )
+    if fd < 0:
+        errno_ = ct.get_errno()
+        raise OSError(errno_, os.strerror(errno_))
+    return fd
+
+
+class _counter_group:
+    def __init__(self, counters: list, cpu: int):
+        self.names = [name for name, _, _ in counters]
+        self.fds = []
+        try:
+            for _, perf_type, config in counters:
+                self.fds.append(
+                    _perf_event_open(
+                        perf_type, config, cpu, self.fds[0] if self.fds else -1
+                    )
+                )
+        except OSError:
+            self.close()
+            raise
+
+        # nr, time_enabled, time_running, then one value per counter
+        self._read_format = struct.Struct("={count}Q".format(count=3 + len(counters)))
+
+    def _ioctl(self, request: int) -> None:
+        if _libc.ioctl(self.fds[0], request, _PERF_IOC_FLAG_GROUP) < 0:
+            errno_ = ct.get_errno()
+            raise OSError(errno_, os.strerror(errno_))
+
+    def enable(self) -> None:
+        self._ioctl(_PERF_EVENT_IOC_RESET)
+        self._ioctl(_PERF_EVENT_IOC_ENABLE)
+
+    def disable(self) -> None:
+        self._ioctl(_PERF_EVENT_IOC_DISABLE)
+
+    def read(self) -> tuple[dict, float]:
+        # Values are scaled up if the group was multiplexed, along with the
+        # fraction of the time the group was actually counting
+        _, enabled, running, *values = self._read_format.unpack(
+            os.read(self.fds[0], self._read_format.size)
+        )
+        if running == 0:
+            return {name: 0 for name in self.names}, 0.0
+
+        scale = enabled / running
+        return {
+            name: round(value * scale) for name, value in zip(self.names, values)
+        }, running / enabled
+
+    def close(self) -> None:
+        for fd in reversed(self.fds):
+            os.close(fd)
+        self.fds = []
+
+
+class perf_counters:
+    """
+    Per-CPU counter groups counting everything that runs on a set of CPUs.
+
+    Counting per CPU rather than per task also accounts for the work a tracer
+    does on behalf of the workload (kernel probes, consumer daemons, ...).
+    Hardware counters are skipped when the CPU exposes no PMU, which is
+    common in virtual machines; software counters always work.
+    """
+
+    def __init__(self, cpus: list[int]):
+        self._groups = []
+        hardware = True
+
+        try:
+            for cpu in cpus:
+                if hardware:
+                    try:
+                        self._groups.append(_counter_group(HARDWARE_COUNTERS, cpu))
+                    except OSError as e:
+                        if e.errno not in _UNSUPPORTED_ERRNOS:
+                            raise
+                        logger.info(
+                            "Hardware performance counters are unavailable: " + str(e)
+                        )
+                        hardware = False
+
+                self._groups.append(_counter_group(SOFTWARE_COUNTERS, cpu))
+        except OSError:
+            self.close()
+            raise
+
+    @property
+    def names(self) -> list[str]:
+        return [name for name in COUNTER_NAMES if self._has(name)]
+
+    def _has(self, name: str) -> bool:
+        return any(name in group.names for group in self._groups)
+
+    def start(self) -> None:
+        for group in self._groups:
+            group.enable()
+
+    def stop(self) -> dict:
+        """
+        Stop counting and return the total of every counter across CPUs,
+        along with the minimal fraction of time hardware counters were
+        running (below 1 when they were multiplexed).
+        """
+        for group in self._groups:
+            group.disable()
+
+        totals = {name: 0 for name in self.names}
+        hardware_coverage = 1.0
+        for group in self._groups:
+            values, coverage = group.read()
+            for name, value in values.items():
+                totals[name] += value
+            if group.names[0] == HARDWARE_COUNTERS[0][0]:
+                hardware_coverage = min(hardware_coverage, coverage)
+
+        if self._has(HARDWARE_COUNTERS[0][0]):
+            totals["hardware_coverage"] = hardware_coverage
+        return totals
+
+    def close(self) -> None:
+        for group in self._groups:
+            group.close()
+        self._groups = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def per_event(counters: dict, event_count: int) -> dict:
+    """Counter values divided by `event_count`, None for unavailable counters."""
+    return {
+        name: (
+            counters[name] / event_count
+            if name in counters and event_count > 0
+            else None
+        )
+        for name in COUNTER_NAMES
+    }
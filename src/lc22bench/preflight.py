@@ -0,0 +1,289 @@
+import hashlib
+import importlib.util
+import os
+import re
+import subprocess
+
+from typing import Optional
+
+from lc22bench.matrix import format_cpu_list, numa_nodes, parse_cpu_list
+from lc22bench.results import host_fingerprint
+
+# Weight of each noise source in the noise score, roughly by how much it
+# changes the time per event of the scenarios
+NOISE_WEIGHTS = {
+    "governor": 0.25,
+    "turbo": 0.15,
+    "isolation": 0.1,
+    "irq_affinity": 0.15,
+    "busy_processes": 0.25,
+    "thp": 0.1,
+}
+
+# Share of a CPU above which a process competes with the workload
+_BUSY_PROCESS_CPU_PERCENT = 5.0
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as sysfs_file:
+            return sysfs_file.read().strip()
+    except OSError:
+        return None
+
+
+def _command_output(args: list[str]) -> Optional[str]:
+    try:
+        return subprocess.run(
+            args, check=True, capture_output=True, text=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _bcc_version() -> Optional[str]:
+    # Read from the package rather than imported, which would load libbcc
+    spec = importlib.util.find_spec("bcc")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    version = _read(os.path.join(spec.submodule_search_locations[0], "version.py"))
+    match = re.search(r"__version__\s*=\s*['\"]([^'\"]+)", version or "")
+    return match.group(1) if match else None
+
+
+def _lttng_modules_version() -> Optional[str]:
+    return _read("/sys/module/lttng_tracer/version") or _command_output(
+        ["modinfo", "--field", "version", "lttng-tracer"]
+    )
+
+
+def file_sha256(path: str) -> Optional[str]:
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as binary:
+            for chunk in iter(lambda: binary.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def smt_siblings(cpu_sysfs_path: str = "/sys/devices/system/cpu") -> int:
+    # Hardware threads per core, 1 when SMT is unavailable or disabled
+    if _read(os.path.join(cpu_sysfs_path, "smt", "active")) == "0":
+        return 1
+    siblings = _read(
+        os.path.join(cpu_sysfs_path, "cpu0", "topology", "thread_siblings_list")
+    )
+    return len(parse_cpu_list(siblings)) if siblings else 1
+
+
+def environment_fingerprint(workload_path: Optional[str], lttng_path: str) -> dict:
+    """
+    What the results depend on besides the host's identity: its topology,
+    the versions of the tracers and the workload binary.
+    """
+    host = host_fingerprint()
+    lttng_version = _command_output(
+        [os.path.join(lttng_path, "lttng") if lttng_path else "lttng", "--version"]
+    )
+    return {
+        "cpu_model": host["cpu_model"],
+        "cpu_count": host["cpu_count"],
+        "smt_siblings": smt_siblings(),
+        "numa_nodes": {
+            str(node): format_cpu_list(cpus)
+            for node, cpus in sorted(numa_nodes().items())
+        },
+        "kernel": host["kernel"],
+        "lttng_tools_version": lttng_version.splitlines()[0] if lttng_version else None,
+        "lttng_modules_version": _lttng_modules_version(),
+        "bcc_version": _bcc_version(),
+        "workload_sha256": file_sha256(workload_path) if workload_path else None,
+    }
+
+
+class noise_finding:
+    """Outcome of a noise check: `noisy` when it found a source of variance."""
+
+    def __init__(self, check: str, noisy: bool, detail: str):
+        self.check = check
+        self.noisy = noisy
+        self.detail = detail
+
+    def to_dict(self) -> dict:
+        return {"check": self.check, "noisy": self.noisy, "detail": self.detail}
+
+
+def check_governor(cpus: list[int], cpu_sysfs_path: str) -> noise_finding:
+    governors = {}
+    for cpu in cpus:
+        governor = _read(
+            os.path.join(
+                cpu_sysfs_path, "cpu{}".format(cpu), "cpufreq", "scaling_governor"
+            )
+        )
+        if governor is not None:
+            governors.setdefault(governor, []).append(cpu)
+
+    if not governors:
+        return noise_finding("governor", False, "no cpufreq driver")
+    others = {
+        governor: cpus
+        for governor, cpus in governors.items()
+        if governor != "performance"
+    }
+    return noise_finding(
+        "governor",
+        bool(others),
+        ", ".join(
+            "{governor} on CPUs {cpus}".format(
+                governor=governor, cpus=format_cpu_list(cpus)
+            )
+            for governor, cpus in sorted(governors.items())
+        ),
+    )
+
+
+def check_turbo(cpu_sysfs_path: str) -> noise_finding:
+    no_turbo = _read(os.path.join(cpu_sysfs_path, "intel_pstate", "no_turbo"))
+    boost = _read(os.path.join(cpu_sysfs_path, "cpufreq", "boost"))
+    if no_turbo is not None:
+        return noise_finding(
+            "turbo",
+            no_turbo == "0",
+            "turbo {}".format("enabled" if no_turbo == "0" else "disabled"),
+        )
+    if boost is not None:
+        return noise_finding(
+            "turbo",
+            boost == "1",
+            "boost {}".format("enabled" if boost == "1" else "disabled"),
+        )
+    return noise_finding("turbo", False, "no frequency boost control")
+
+
+def check_isolation(cpus: list[int], cpu_sysfs_path: str) -> noise_finding:
+    isolated = set(
+        parse_cpu_list(_read(os.path.join(cpu_sysfs_path, "isolated")) or "")
+    )
+    nohz_full = set(
+        parse_cpu_list(_read(os.path.join(cpu_sysfs_path, "nohz_full")) or "")
+    )
+    shared = sorted(set(cpus) - isolated)
+    ticking = sorted(set(cpus) - nohz_full)
+    return noise_finding(
+        "isolation",
+        bool(shared),
+        "CPUs not in isolcpus: {shared}; CPUs not in nohz_full: {ticking}".format(
+            shared=format_cpu_list(shared) or "none",
+            ticking=format_cpu_list(ticking) or "none",
+        ),
+    )
+
+
+def check_irq_affinity(cpus: list[int], procfs_path: str) -> noise_finding:
+    irq_path = os.path.join(procfs_path, "irq")
+    try:
+        irqs = [entry for entry in os.listdir(irq_path) if entry.isdigit()]
+    except OSError:
+        return noise_finding("irq_affinity", False, "IRQ affinities unavailable")
+
+    routed = []
+    for irq in sorted(irqs, key=int):
+        # The CPUs actually targeted, where the interrupt controller reports them
+        affinity = _read(
+            os.path.join(irq_path, irq, "effective_affinity_list")
+        ) or _read(os.path.join(irq_path, irq, "smp_affinity_list"))
+        if affinity and set(parse_cpu_list(affinity)) & set(cpus):
+            routed.append(irq)
+
+    return noise_finding(
+        "irq_affinity",
+        bool(routed),
+        "{count} IRQs routed to the benchmark CPUs".format(count=len(routed)),
+    )
+
+
+def check_busy_processes(cpus: list[int], sample_time_s: float) -> noise_finding:
+    import psutil
+
+    # Processes that may run on the benchmark CPUs, sampled over sample_time_s
+    processes = []
+    for process in psutil.process_iter(["pid", "name", "cpu_affinity"]):
+        if process.pid == os.getpid():
+            continue
+        affinity = process.info["cpu_affinity"]
+        if affinity is not None and not set(affinity) & set(cpus):
+            continue
+        try:
+            process.cpu_percent(None)
+        except psutil.Error:
+            continue
+        processes.append(process)
+
+    busy_cpus = psutil.cpu_percent(interval=sample_time_s, percpu=True)
+    busy = []
+    for process in processes:
+        try:
+            cpu_percent = process.cpu_percent(None)
+        except psutil.Error:
+            continue
+        if cpu_percent > _BUSY_PROCESS_CPU_PERCENT:
+            busy.append(
+                "{name} ({pid}): {cpu_percent:.0f}%".format(
+                    name=process.info["name"], pid=process.pid, cpu_percent=cpu_percent
+                )
+            )
+
+    load = sum(busy_cpus[cpu] for cpu in cpus if cpu < len(busy_cpus)) / len(cpus)
+    return noise_finding(
+        "busy_processes",
+        bool(busy),
+        "benchmark CPUs {load:.0f}% busy; {busy}".format(
+            load=load, busy=", ".join(busy) or "no busy process"
+        ),
+    )
+
+
+def check_thp(sysfs_path: str) -> noise_finding:
+    enabled = _read(
+        os.path.join(sysfs_path, "kernel", "mm", "transparent_hugepage", "enabled")
+    )
+    if enabled is None:
+        return noise_finding("thp", False, "transparent hugepages unavailable")
+
+    # The active setting is the bracketed one, e.g. "always [madvise] never"
+    match = re.search(r"\[(\w+)\]", enabled)
+    mode = match.group(1) if match else enabled
+    return noise_finding("thp", mode == "always", "transparent hugepages: " + mode)
+
+
+def check_noise(
+    cpus: list[int],
+    sample_time_s: float = 0.5,
+    sysfs_path: str = "/sys",
+    procfs_path: str = "/proc",
+) -> list[noise_finding]:
+    """Look for the sources of variance of the runs on `cpus`."""
+    cpu_sysfs_path = os.path.join(sysfs_path, "devices", "system", "cpu")
+    findings = [
+        check_governor(cpus, cpu_sysfs_path),
+        check_turbo(cpu_sysfs_path),
+        check_isolation(cpus, cpu_sysfs_path),
+        check_irq_affinity(cpus, procfs_path),
+        check_thp(sysfs_path),
+    ]
+    if sample_time_s > 0:
+        findings.append(check_busy_processes(cpus, sample_time_s))
+    return findings
+
+
+def noise_score(findings: list[noise_finding]) -> float:
+    """
+    Share of the weight of the checks run that found a source of variance:
+    0 for a quiet configuration, 1 when every check failed.
+    """
+    total = sum(NOISE_WEIGHTS[finding.check] for finding in findings)
+    noisy = sum(NOISE_WEIGHTS[finding.check] for finding in findings if finding.noisy)
+    return noisy / total if total else 0.0
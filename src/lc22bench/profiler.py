@@ -0,0 +1,151 @@
+import threading
+
+from typing import Optional
+
+from bcc import BPF, PerfSWConfig, PerfType, SymbolCache
+
+from lc22bench.folded import KERNEL_FRAME_SUFFIX
+
+# Distinct stacks kept by the kernel per iteration; samples of stacks beyond
+# it are counted as missing
+STACK_STORAGE_SIZE = 16384
+
+# Delay after the workload's start at which its memory map is read to
+# resolve user frames, by when the dynamic loader has mapped its libraries
+_SYMBOL_LOAD_DELAY_S = 0.1
+
+_PROFILE_PROGRAM = """
+#include <uapi/linux/ptrace.h>
+#include <uapi/linux/bpf_perf_event.h>
+
+struct stack_key_t {
+    int user_stack_id;
+    int kernel_stack_id;
+};
+
+BPF_ARRAY(target, u32, 1);
+BPF_HASH(counts, struct stack_key_t, u64, STACK_STORAGE_SIZE);
+BPF_STACK_TRACE(stack_traces, STACK_STORAGE_SIZE);
+
+int on_sample(struct bpf_perf_event_data *ctx) {
+    int zero = 0;
+    u32 *target_tgid = target.lookup(&zero);
+    u32 tgid = bpf_get_current_pid_tgid() >> 32;
+
+    if (!target_tgid || *target_tgid == 0 || tgid != *target_tgid)
+        return 0;
+
+    struct stack_key_t key = {};
+    key.user_stack_id = stack_traces.get_stackid(&ctx->regs, BPF_F_USER_STACK);
+    key.kernel_stack_id = stack_traces.get_stackid(&ctx->regs, 0);
+    counts.increment(key);
+    return 0;
+}
+"""
+
+
+class stack_profiler:
+    """
+    Sample the user and kernel stacks of the workload `frequency` times per
+    second on every CPU it runs on. Samples are counted per distinct stack in
+    the kernel, and only the counts are read at the end of an iteration, as
+    folded stacks.
+    """
+
+    def __init__(self, frequency: int):
+        self._program = BPF(
+            text=_PROFILE_PROGRAM,
+            cflags=["-DSTACK_STORAGE_SIZE={}".format(STACK_STORAGE_SIZE)],
+        )
+        try:
+            self._program.attach_perf_event(
+                ev_type=PerfType.SOFTWARE,
+                ev_config=PerfSWConfig.CPU_CLOCK,
+                fn_name="on_sample",
+                sample_freq=frequency,
+            )
+        except Exception:
+            self._program.cleanup()
+            raise
+        self._symbols = None
+        self._symbol_loader = None
+
+    def _set_target(self, pid: int) -> None:
+        target = self._program["target"]
+        target[target.Key(0)] = target.Leaf(pid)
+
+    def _load_symbols(self, pid: int) -> None:
+        self._symbols = SymbolCache(pid)
+
+    def follow(self, pid: int) -> None:
+        # Start sampling the workload once it is spawned
+        self._symbols = None
+        self._program["counts"].clear()
+        self._set_target(pid)
+        self._symbol_loader = threading.Timer(
+            _SYMBOL_LOAD_DELAY_S, self._load_symbols, [pid]
+        )
+        self._symbol_loader.start()
+
+    def _user_frame(self, address: int) -> str:
+        if self._symbols is None:
+            return "0x{:x}".format(address)
+        name, _, module = self._symbols.resolve(address, True)
+        if name is not None:
+            return name.decode("utf-8", "replace")
+        if module is not None:
+            return "[{}]".format(module.decode("utf-8", "replace").rsplit("/", 1)[-1])
+        return "[unknown]"
+
+    def _frames(self, stack_id: int, resolve) -> Optional[list[str]]:
+        # Root first, None if the stack couldn't be walked or stored
+        if stack_id < 0:
+            return None
+        return [
+            resolve(address) for address in self._program["stack_traces"].walk(stack_id)
+        ][::-1]
+
+    def stop(self) -> dict[str, int]:
+        """Stop sampling and return the sample count of every folded stack."""
+        self._set_target(0)
+        # Frames are left unresolved if the workload exited before its memory
+        # map was read
+        self._symbol_loader.cancel()
+        self._symbol_loader.join()
+
+        stack_traces = self._program["stack_traces"]
+        folded = {}
+        stack_ids = set()
+        for key, count in self._program["counts"].items():
+            user_frames = self._frames(key.user_stack_id, self._user_frame)
+            kernel_frames = self._frames(
+                key.kernel_stack_id,
+                lambda address: BPF.ksym(address).decode("utf-8", "replace")
+                + KERNEL_FRAME_SUFFIX,
+            )
+            frames = (user_frames or ["[missing user stack]"]) + (kernel_frames or [])
+            stack = ";".join(frames)
+            folded[stack] = folded.get(stack, 0) + count.value
+            stack_ids.update(
+                stack_id
+                for stack_id in (key.user_stack_id, key.kernel_stack_id)
+                if stack_id >= 0
+            )
+
+        # Stack trace maps aren't cleared along with the counts: remove the
+        # stacks of this iteration, which wouldn't recur with a new memory map
+        for stack_id in stack_ids:
+            del stack_traces[stack_traces.Key(stack_id)]
+        self._program["counts"].clear()
+        return folded
+
+    def close(self) -> None:
+        if self._symbol_loader is not None:
+            self._symbol_loader.cancel()
+        self._program.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,416 @@
+import hashlib
+import importlib.util
+import json
+import os
+import platform
+import socket
+import time
+
+from typing import TYPE_CHECKING
+
+# pandas and pyarrow are only imported to read or write results
+if TYPE_CHECKING:
+    import pandas
+
+    from lc22bench.telemetry import workload_telemetry
+
+# Columns of an iteration record. Values of "json" columns are stored as
+# JSON-encoded strings so that the schema remains stable across scenarios.
+# The time series of the workload's telemetry, sampled every
+# telemetry_interval_ns, are kept out of the records in a file per run (see
+# results_store.load_telemetry). recorded_events is None when the
+# tracer can't tell how many events it recorded, unaccounted_events the
+# emitted events it neither recorded nor reported as discarded (when it
+# reports both). consumer_events_per_s is the
+# throughput of the consumer of streaming scenarios while it drains its
+# buffers, and consumer_cpu_s the time it spent doing so (the CPU time of
+# LTTng's consumer daemon). bytes_written and written_mb_per_s are set when
+# the trace is streamed to disk. perf_counters holds the totals of
+# the performance counters over the workload's CPUs, and the *_per_event
+# columns those totals divided by the number of events emitted (None for
+# counters that are unavailable). setup_time_s and teardown_time_s are only
+# set for the iterations that set the tracer up or tore it down. thread_cpus
+# holds the CPU on which each workload thread was placed by placement_policy.
+# The latency_* columns are set when the workload timed every
+# latency_sample_period-th event; latency_histogram holds the merged
+# histogram of its threads (see lc22bench.histogram). latency_unit tells what
+# was timed: an "event", or a "write" of batch_size events for the kernel
+# scenarios, whose latencies aren't comparable with those of the others.
+# preflight holds the fingerprint of the environment and the outcome of the
+# noise checks run before the scenario, summarized by noise_score (see
+# lc22bench.preflight).
+RECORD_FIELDS = {
+    "run_id": "string",
+    "scenario": "string",
+    "name": "string",
+    "parameters": "json",
+    "iteration": "int",
+    "cold_start": "bool",
+    "thread_count": "int",
+    "duration_s": "float",
+    "ns_per_event": "float",
+    "steady_state_ns_per_event": "float",
+    "per_thread_event_counts": "int_list",
+    "telemetry_interval_ns": "int",
+    "emitted_events": "int",
+    "recorded_events": "int",
+    "discarded_events": "int",
+    "lost_packets": "int",
+    "unaccounted_events": "int",
+    "loss_ratio": "float",
+    "recorded_events_per_s": "float",
+    "consumer_events_per_s": "float",
+    "consumer_cpu_s": "float",
+    "consumer_rss_bytes": "int",
+    "bytes_written": "int",
+    "written_mb_per_s": "float",
+    "perf_counters": "json",
+    "cycles_per_event": "float",
+    "instructions_per_event": "float",
+    "cache_misses_per_event": "float",
+    "task_clock_ns_per_event": "float",
+    "context_switches_per_event": "float",
+    "cpu_migrations_per_event": "float",
+    "page_faults_per_event": "float",
+    "start_time": "float",
+    "end_time": "float",
+    "setup_time_s": "float",
+    "teardown_time_s": "float",
+    "host_id": "string",
+    "host": "json",
+    "placement": "string",
+    "placement_policy": "string",
+    "thread_cpus": "int_list",
+    "latency_sample_period": "int",
+    "latency_p50_ns": "float",
+    "latency_p99_ns": "float",
+    "latency_p999_ns": "float",
+    "latency_max_ns": "float",
+    "latency_unit": "string",
+    "latency_histogram": "json",
+    "noise_score": "float",
+    "preflight": "json",
+}
+
+
+def _import_pyarrow():
+    # pyarrow is optional; None when it isn't installed
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _arrow_schema():
+    pyarrow = _import_pyarrow()
+    types = {
+        "string": pyarrow.string(),
+        "json": pyarrow.string(),
+        "int": pyarrow.int64(),
+        "bool": pyarrow.bool_(),
+        "float": pyarrow.float64(),
+        "int_list": pyarrow.list_(pyarrow.int64()),
+        "float_list": pyarrow.list_(pyarrow.float64()),
+    }
+    return pyarrow.schema([(name, types[kind]) for name, kind in RECORD_FIELDS.items()])
+
+
+def _cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+_host_fingerprint = None
+
+
+def host_fingerprint() -> dict:
+    global _host_fingerprint
+
+    if _host_fingerprint is None:
+        uname = os.uname()
+        host = {
+            "hostname": socket.gethostname(),
+            "kernel": uname.release,
+            "kernel_version": uname.version,
+            "machine": uname.machine,
+            "cpu_model": _cpu_model(),
+            "cpu_count": os.cpu_count(),
+        }
+        host["id"] = hashlib.sha256(
+            json.dumps(host, sort_keys=True).encode()
+        ).hexdigest()[:16]
+        _host_fingerprint = host
+
+    return _host_fingerprint
+
+
+def current_placement() -> str:
+    # Set by `bench matrix` for the scenarios it places
+    placement = os.environ.get("LC22BENCH_PLACEMENT")
+    if placement:
+        return placement
+
+    from lc22bench.matrix import format_cpu_list
+
+    return "cpus:" + format_cpu_list(sorted(os.sched_getaffinity(0)))
+
+
+def make_run_id(scenario: str) -> str:
+    return "{time}-{scenario}-{pid}".format(
+        time=time.strftime("%Y%m%dT%H%M%S"), scenario=scenario, pid=os.getpid()
+    )
+
+
+def encode_parameters(parameters: dict) -> str:
+    # Canonical encoding, used to match scenarios across result sets
+    return json.dumps(parameters, sort_keys=True)
+
+
+# Suffix of the telemetry files of the runs: one JSON line per iteration
+TELEMETRY_SUFFIX = ".telemetry.jsonl"
+
+
+class _run_writer:
+    def __init__(self, telemetry_path: str):
+        self._telemetry_path = telemetry_path
+        self._telemetry_file = None
+
+    def append_telemetry(self, series: dict) -> None:
+        if self._telemetry_file is None:
+            self._telemetry_file = open(self._telemetry_path, "a")
+        self._telemetry_file.write(json.dumps(series) + "\n")
+        self._telemetry_file.flush()
+
+    def _close_telemetry(self) -> None:
+        if self._telemetry_file is not None:
+            self._telemetry_file.close()
+            self._telemetry_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _arrow_writer(_run_writer):
+    def __init__(self, path: str, telemetry_path: str):
+        _run_writer.__init__(self, telemetry_path)
+        self._path = path
+        self._stream_path = path + "s"
+        self._file = open(self._stream_path, "wb")
+        self._pyarrow = _import_pyarrow()
+        self._schema = _arrow_schema()
+        self._writer = self._pyarrow.ipc.new_stream(self._file, self._schema)
+        self._batches = []
+
+    def append(self, record: dict) -> None:
+        batch = self._pyarrow.RecordBatch.from_pylist([record], schema=self._schema)
+        self._writer.write_batch(batch)
+        self._file.flush()
+        self._batches.append(batch)
+
+    def close(self) -> None:
+        self._close_telemetry()
+        self._writer.close()
+        self._file.close()
+
+        # Compact the completed run's stream into a single-batch Arrow file;
+        # interrupted runs are left as streams.
+        pyarrow = self._pyarrow
+        table = pyarrow.Table.from_batches(self._batches, schema=self._schema)
+        with pyarrow.OSFile(self._path, "wb") as sink:
+            with pyarrow.ipc.new_file(sink, self._schema) as writer:
+                writer.write_table(table.combine_chunks())
+        os.unlink(self._stream_path)
+
+
+class _jsonl_writer(_run_writer):
+    def __init__(self, path: str, telemetry_path: str):
+        _run_writer.__init__(self, telemetry_path)
+        self._file = open(path, "a")
+
+    def append(self, record: dict) -> None:
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._close_telemetry()
+        self._file.close()
+
+
+class results_store:
+    """
+    Append-only store of iteration records.
+
+    Every run (one scenario invocation) is written to its own file, one
+    record at a time, so that an interrupted run keeps its completed
+    iterations. Runs are stored as Arrow IPC streams, compacted to Arrow
+    files once complete, when pyarrow is available and as JSON lines
+    otherwise.
+    """
+
+    def __init__(self, path: str, format: str = "auto"):
+        pyarrow_available = importlib.util.find_spec("pyarrow") is not None
+        if format == "auto":
+            format = "arrow" if pyarrow_available else "jsonl"
+        elif format == "arrow" and not pyarrow_available:
+            raise ValueError("The arrow results format requires pyarrow")
+
+        self._path = path
+        self._format = format
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _telemetry_path(self, run_id: str) -> str:
+        return os.path.join(self._path, run_id + TELEMETRY_SUFFIX)
+
+    def open_run(self, run_id: str):
+        os.makedirs(self._path, exist_ok=True)
+        if self._format == "arrow":
+            return _arrow_writer(
+                os.path.join(self._path, run_id + ".arrow"),
+                self._telemetry_path(run_id),
+            )
+        return _jsonl_writer(
+            os.path.join(self._path, run_id + ".jsonl"), self._telemetry_path(run_id)
+        )
+
+    @staticmethod
+    def _normalize(record: dict) -> dict:
+        normalized = {}
+        for name, kind in RECORD_FIELDS.items():
+            value = record.get(name)
+            if kind == "json" and value is not None and not isinstance(value, str):
+                value = json.dumps(value, sort_keys=True)
+            normalized[name] = value
+        return normalized
+
+    def append(self, writer, record: dict) -> None:
+        writer.append(self._normalize(record))
+
+    def append_telemetry(
+        self, writer, iteration: int, telemetry: "workload_telemetry"
+    ) -> None:
+        writer.append_telemetry(
+            {
+                "iteration": iteration,
+                "interval_ns": telemetry.interval_ns,
+                "timestamps_ns": telemetry.timestamps_ns.tolist(),
+                "counts": telemetry.counts.tolist(),
+            }
+        )
+
+    def load_telemetry(self, run_id: str) -> list[dict]:
+        """
+        Telemetry of every iteration of a run: its "iteration", the
+        "interval_ns" between samples, and the "timestamps_ns" and cumulative
+        per-thread event "counts" (samples x threads) of each sample.
+        """
+        series = []
+        try:
+            with open(self._telemetry_path(run_id)) as telemetry_file:
+                for line in telemetry_file:
+                    try:
+                        series.append(json.loads(line))
+                    except ValueError:
+                        # Truncated last line of an interrupted run
+                        break
+        except FileNotFoundError:
+            pass
+        return series
+
+    @staticmethod
+    def _read_arrow_stream(path: str) -> list:
+        pyarrow = _import_pyarrow()
+        batches = []
+        with pyarrow.OSFile(path) as source:
+            try:
+                for batch in pyarrow.ipc.open_stream(source):
+                    batches.append(batch)
+            except pyarrow.ArrowInvalid:
+                # Interrupted run, keep the iterations that were written
+                pass
+        return batches
+
+    @staticmethod
+    def _conform(table, schema):
+        # Runs written with an earlier set of record fields: fields they lack
+        # are null and those that were since removed are dropped
+        pyarrow = _import_pyarrow()
+        return pyarrow.Table.from_arrays(
+            [
+                (
+                    table.column(field.name).cast(field.type)
+                    if field.name in table.column_names
+                    else pyarrow.nulls(table.num_rows, field.type)
+                )
+                for field in schema
+            ],
+            schema=schema,
+        )
+
+    def load(self) -> "pandas.DataFrame":
+        import pandas
+
+        pyarrow = _import_pyarrow()
+        try:
+            names = sorted(os.listdir(self._path))
+        except FileNotFoundError:
+            names = []
+
+        # Gather everything before converting to a single frame: building a
+        # frame per run is what dominates the load time of large stores.
+        tables = []
+        records = []
+        for name in names:
+            path = os.path.join(self._path, name)
+            if name.endswith((".arrow", ".arrows")):
+                if pyarrow is None:
+                    raise ValueError(
+                        "{path} can't be read without pyarrow".format(path=path)
+                    )
+
+                if name.endswith(".arrow"):
+                    with pyarrow.memory_map(path) as source:
+                        tables.append(pyarrow.ipc.open_file(source).read_all())
+                else:
+                    batches = self._read_arrow_stream(path)
+                    if batches:
+                        tables.append(pyarrow.Table.from_batches(batches))
+            elif name.endswith(".jsonl") and not name.endswith(TELEMETRY_SUFFIX):
+                with open(path) as run_file:
+                    for line in run_file:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            # Truncated last line of an interrupted run
+                            break
+
+        frames = []
+        if tables:
+            schema = _arrow_schema()
+            frames.append(
+                pyarrow.concat_tables(
+                    [self._conform(table, schema) for table in tables]
+                ).to_pandas()
+            )
+        if records:
+            frames.append(
+                pandas.DataFrame.from_records(records, columns=list(RECORD_FIELDS))
+            )
+
+        if not frames:
+            return pandas.DataFrame(columns=list(RECORD_FIELDS))
+
+        return pandas.concat(frames, ignore_index=True)
@@ -0,0 +1,246 @@
+import math
+
+from typing import Optional
+
+import numpy
+
+# Upper bound on the number of elements of a resampling matrix, which keeps
+# the memory use of bootstrapping large samples in check.
+_MAX_RESAMPLING_ELEMENTS = 1 << 22
+
+
+def bootstrap(
+    points,
+    statistic=numpy.median,
+    resamples: int = 10000,
+    rng: Optional[numpy.random.Generator] = None,
+) -> numpy.ndarray:
+    """
+    Bootstrap distribution of `statistic`, which must accept an `axis`
+    argument, over `resamples` resamplings (with replacement) of `points`.
+    """
+    points = numpy.asarray(points, dtype=numpy.float64)
+    rng = rng or numpy.random.default_rng()
+
+    chunk_size = max(1, _MAX_RESAMPLING_ELEMENTS // len(points))
+    estimates = []
+    for first in range(0, resamples, chunk_size):
+        count = min(chunk_size, resamples - first)
+        indices = rng.integers(0, len(points), size=(count, len(points)))
+        estimates.append(statistic(points[indices], axis=1))
+
+    return numpy.concatenate(estimates)
+
+
+def bootstrap_ci(
+    points,
+    statistic=numpy.median,
+    confidence: float = 0.95,
+    resamples: int = 10000,
+    rng: Optional[numpy.random.Generator] = None,
+) -> tuple[float, float]:
+    """Percentile bootstrap confidence interval of `statistic`."""
+    estimates = bootstrap(points, statistic, resamples, rng)
+    alpha = (1.0 - confidence) / 2.0
+    low, high = numpy.quantile(estimates, [alpha, 1.0 - alpha])
+    return float(low), float(high)
+
+
+def mad_outliers(points, threshold: float = 3.5) -> numpy.ndarray:
+    """
+    Flag outliers using the modified z-score (Iglewicz and Hoaglin), based on
+    the median absolute deviation. Returns a boolean mask.
+    """
+    points = numpy.asarray(points, dtype=numpy.float64)
+    median = numpy.median(points)
+    mad = numpy.median(numpy.abs(points - median))
+    if mad == 0:
+        return points != median
+
+    return numpy.abs(0.6745 * (points - median) / mad) > threshold
+
+
+def mann_whitney_u(a, b) -> tuple[float, float]:
+    """
+    Mann-Whitney U statistic of `a` and its two-sided p-value, using the
+    normal approximation with tie and continuity corrections.
+    """
+    a = numpy.asarray(a, dtype=numpy.float64)
+    b = numpy.asarray(b, dtype=numpy.float64)
+    n_a, n_b = len(a), len(b)
+    n = n_a + n_b
+
+    # Average ranks (starting at 1) of the pooled samples
+    values, inverse, counts = numpy.unique(
+        numpy.concatenate([a, b]), return_inverse=True, return_counts=True
+    )
+    ranks = (numpy.cumsum(counts) - (counts - 1) / 2.0)[inverse]
+
+    u = ranks[:n_a].sum() - n_a * (n_a + 1) / 2.0
+    mean = n_a * n_b / 2.0
+    tie_correction = ((counts**3 - counts).sum()) / (n * (n - 1)) if n > 1 else 0.0
+    variance = n_a * n_b / 12.0 * ((n + 1) - tie_correction)
+    if variance <= 0:
+        return float(u), 1.0
+
+    z = max(abs(u - mean) - 0.5, 0.0) / math.sqrt(variance)
+    return float(u), math.erfc(z / math.sqrt(2))
+
+
+def median_difference(
+    a,
+    b,
+    confidence: float = 0.95,
+    resamples: int = 10000,
+    rng: Optional[numpy.random.Generator] = None,
+) -> tuple[float, float, float]:
+    """
+    Difference between the medians of `b` and `a`, and its bootstrap
+    confidence interval, which accounts for the uncertainty of both medians.
+    """
+    rng = rng or numpy.random.default_rng()
+    deltas = bootstrap(b, resamples=resamples, rng=rng) - bootstrap(
+        a, resamples=resamples, rng=rng
+    )
+    alpha = (1.0 - confidence) / 2.0
+    low, high = numpy.quantile(deltas, [alpha, 1.0 - alpha])
+    return float(numpy.median(b) - numpy.median(a)), float(low), float(high)
+
+
+def compare_samples(
+    baseline,
+    candidate,
+    confidence: float = 0.95,
+    resamples: int = 10000,
+    rng: Optional[numpy.random.Generator] = None,
+) -> dict:
+    """
+    Compare the medians of two samples: relative delta of the candidate's
+    median, its bootstrap confidence interval and the Mann-Whitney p-value.
+    """
+    baseline_median = float(numpy.median(baseline))
+    delta, low, high = median_difference(
+        baseline, candidate, confidence, resamples, rng
+    )
+    _, p_value = mann_whitney_u(baseline, candidate)
+
+    return {
+        "baseline_median": baseline_median,
+        "candidate_median": float(numpy.median(candidate)),
+        "relative_delta": delta / baseline_median,
+        "ci_low": low / baseline_median,
+        "ci_high": high / baseline_median,
+        "p_value": p_value,
+    }
+
+
+def _least_squares(x: numpy.ndarray, y: numpy.ndarray) -> tuple:
+    # Slopes and intercepts of the fits of every row of `y` on `x`
+    x_mean = x.mean(axis=-1, keepdims=True)
+    y_mean = y.mean(axis=-1, keepdims=True)
+    slope = ((x - x_mean) * (y - y_mean)).sum(axis=-1) / ((x - x_mean) ** 2).sum(
+        axis=-1
+    )
+    return slope, y_mean[..., 0] - slope * x_mean[..., 0]
+
+
+def linear_fit(
+    x,
+    y,
+    confidence: float = 0.95,
+    resamples: int = 10000,
+    rng: Optional[numpy.random.Generator] = None,
+) -> dict:
+    """
+    Least-squares fit of y = intercept + slope * x, with bootstrap confidence
+    intervals of both coefficients. Points are resampled within each distinct
+    value of `x`, so that every resampling spans the same values of `x`.
+    """
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    rng = rng or numpy.random.default_rng()
+    groups = [numpy.flatnonzero(x == value) for value in numpy.unique(x)]
+    if len(groups) < 2:
+        raise ValueError("At least two distinct values of x are needed")
+
+    slope, intercept = _least_squares(x, y)
+
+    chunk_size = max(1, _MAX_RESAMPLING_ELEMENTS // len(x))
+    slopes, intercepts = [], []
+    for first in range(0, resamples, chunk_size):
+        count = min(chunk_size, resamples - first)
+        indices = numpy.concatenate(
+            [
+                group[rng.integers(0, len(group), size=(count, len(group)))]
+                for group in groups
+            ],
+            axis=1,
+        )
+        chunk_slopes, chunk_intercepts = _least_squares(x[indices], y[indices])
+        slopes.append(chunk_slopes)
+        intercepts.append(chunk_intercepts)
+
+    alpha = (1.0 - confidence) / 2.0
+    slope_low, slope_high = numpy.quantile(
+        numpy.concatenate(slopes), [alpha, 1.0 - alpha]
+    )
+    intercept_low, intercept_high = numpy.quantile(
+        numpy.concatenate(intercepts), [alpha, 1.0 - alpha]
+    )
+    return {
+        "slope": float(slope),
+        "slope_ci": (float(slope_low), float(slope_high)),
+        "intercept": float(intercept),
+        "intercept_ci": (float(intercept_low), float(intercept_high)),
+    }
+
+
+class adaptive_stopping_rule:
+    """
+    Decide when enough iterations were run: once the bootstrap confidence
+    interval of the median is narrower than `target_relative_width` (relative
+    to the median), or when the iteration or time budget is exhausted.
+    """
+
+    def __init__(
+        self,
+        target_relative_width: float,
+        min_iterations: int,
+        max_iterations: int,
+        time_budget_s: float = 0.0,
+        confidence: float = 0.95,
+    ):
+        self._target_relative_width = target_relative_width
+        self._min_iterations = min_iterations
+        self._max_iterations = max_iterations
+        self._time_budget_s = time_budget_s
+        self._confidence = confidence
+        self._rng = numpy.random.default_rng()
+
+    @property
+    def max_iterations(self) -> int:
+        return self._max_iterations
+
+    def relative_ci_width(self, points) -> float:
+        low, high = bootstrap_ci(points, confidence=self._confidence, rng=self._rng)
+        return (high - low) / numpy.median(points)
+
+    def stop_reason(self, points, elapsed_s: float) -> Optional[str]:
+        if len(points) >= self._min_iterations and len(points) >= 2:
+            width = self.relative_ci_width(points)
+            if width <= self._target_relative_width:
+                return "{confidence:.0%} CI of the median within {width:.2%} of the median after {count} iterations".format(
+                    confidence=self._confidence, width=width, count=len(points)
+                )
+
+        if len(points) >= self._max_iterations:
+            return "reached the maximum of {count} iterations".format(
+                count=self._max_iterations
+            )
+
+        if self._time_budget_s > 0 and elapsed_s >= self._time_budget_s:
+            return "exhausted the time budget of {budget:.0f} s after {count} iterations".format(
+                budget=self._time_budget_s, count=len(points)
+            )
+
+        return None
@@ -0,0 +1,116 @@
+import mmap
+import struct
+
+import numpy
+
+# Records of BPF ring buffers and perf buffers, counted by the consumers of
+# lc22bench.ebpf_stream; kept apart from them so that they don't need bcc
+_U32 = struct.Struct("=I")
+_U64 = struct.Struct("=Q")
+
+# BPF ring buffer record header: u32 length and flags, u32 page offset
+_RINGBUF_HEADER_SIZE = 8
+_RINGBUF_BUSY_BIT = 1 << 31
+_RINGBUF_DISCARD_BIT = 1 << 30
+
+# struct perf_event_header, and offsets of data_head and data_tail in
+# struct perf_event_mmap_page
+_PERF_HEADER = struct.Struct("=IHH")
+_PERF_RECORD_LOST = 2
+_PERF_RECORD_SAMPLE = 9
+PERF_DATA_HEAD_OFFSET = 1024
+PERF_DATA_TAIL_OFFSET = 1032
+
+
+def _round_up(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+def _next_power_of_two(value: int) -> int:
+    return 1 << max(0, value - 1).bit_length()
+
+
+def ringbuf_page_count(per_cpu_size: int, cpu_count: int) -> int:
+    """
+    Data pages of a BPF ring buffer, shared by `cpu_count` CPUs, holding as
+    much as per-CPU buffers of `per_cpu_size` bytes. It must be a power of two.
+    """
+    return _next_power_of_two(-(-per_cpu_size * cpu_count // mmap.PAGESIZE))
+
+
+def perf_buffer_page_count(per_cpu_size: int) -> int:
+    # Data pages of each per-CPU perf buffer, a power of two
+    return _next_power_of_two(-(-per_cpu_size // mmap.PAGESIZE))
+
+
+def scan_ringbuf_records(data: bytes, sample_size: int) -> tuple[int, int]:
+    """
+    Count the samples at the start of `data`, the unconsumed part of a BPF
+    ring buffer, up to the first record that is still being written. Returns
+    the number of samples and the number of bytes that can be consumed.
+    """
+    stride = _round_up(_RINGBUF_HEADER_SIZE + sample_size, 8)
+    samples = offset = 0
+    while len(data) - offset >= _RINGBUF_HEADER_SIZE:
+        # Committed samples of the expected size are counted in bulk
+        count = (len(data) - offset) // stride
+        lengths = numpy.frombuffer(
+            data, dtype=numpy.uint32, count=count * stride // 4, offset=offset
+        )[:: stride // 4]
+        regular = lengths == sample_size
+        bulk = count if regular.all() else int(regular.argmin())
+        samples += bulk
+        offset += bulk * stride
+        if len(data) - offset < _RINGBUF_HEADER_SIZE:
+            break
+
+        (length,) = _U32.unpack_from(data, offset)
+        if length & _RINGBUF_BUSY_BIT:
+            break
+        if not length & _RINGBUF_DISCARD_BIT:
+            samples += 1
+        offset += _round_up(
+            _RINGBUF_HEADER_SIZE
+            + (length & ~(_RINGBUF_BUSY_BIT | _RINGBUF_DISCARD_BIT)),
+            8,
+        )
+
+    return samples, offset
+
+
+def scan_perf_records(data: bytes, sample_size: int) -> tuple[int, int, int]:
+    """
+    Count the samples and the lost samples reported in `data`, the
+    unconsumed records of a perf buffer. Returns them along with the number
+    of bytes of complete records.
+    """
+    # Header, u32 raw data size and raw data, padded to 8 bytes
+    stride = _PERF_HEADER.size + _round_up(4 + sample_size, 8)
+    samples = lost = offset = 0
+    while len(data) - offset >= _PERF_HEADER.size:
+        count = (len(data) - offset) // stride
+        types = numpy.frombuffer(
+            data, dtype=numpy.uint32, count=count * stride // 4, offset=offset
+        )[:: stride // 4]
+        sizes = numpy.frombuffer(
+            data, dtype=numpy.uint16, count=count * stride // 2, offset=offset
+        )[3 :: stride // 2]
+        regular = (types == _PERF_RECORD_SAMPLE) & (sizes == stride)
+        bulk = count if regular.all() else int(regular.argmin())
+        samples += bulk
+        offset += bulk * stride
+        if len(data) - offset < _PERF_HEADER.size:
+            break
+
+        record_type, _, size = _PERF_HEADER.unpack_from(data, offset)
+        if size < _PERF_HEADER.size or len(data) - offset < size:
+            break
+        if record_type == _PERF_RECORD_LOST:
+            # u64 id, u64 lost
+            (record_lost,) = _U64.unpack_from(data, offset + _PERF_HEADER.size + 8)
+            lost += record_lost
+        elif record_type == _PERF_RECORD_SAMPLE:
+            samples += 1
+        offset += size
+
+    return samples, lost, offset
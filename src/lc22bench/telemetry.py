@@ -0,0 +1,113 @@
+import os
+import struct
+import threading
+
+import numpy
+
+# Must be kept in sync with the telemetry stream format of src/workload.cpp
+_TELEMETRY_HEADER = struct.Struct("=IIII")
+_TELEMETRY_MAGIC = 0x3232434C
+_TELEMETRY_VERSION = 1
+
+
+class workload_telemetry:
+    """
+    Time series of the per-thread event counters sampled by the workload.
+
+    `timestamps_ns` holds the time of each sample relative to the start of
+    the run and `counts` the cumulative event count of each thread
+    (samples x threads).
+    """
+
+    def __init__(
+        self, interval_ns: int, timestamps_ns: numpy.ndarray, counts: numpy.ndarray
+    ):
+        self.interval_ns = interval_ns
+        self.timestamps_ns = timestamps_ns
+        self.counts = counts
+
+    @property
+    def thread_count(self) -> int:
+        return self.counts.shape[1]
+
+    @property
+    def per_thread_event_counts(self) -> numpy.ndarray:
+        return self.counts[-1]
+
+    @classmethod
+    def parse(cls, data: bytes) -> "workload_telemetry":
+        if len(data) < _TELEMETRY_HEADER.size:
+            raise ValueError("Truncated workload telemetry header")
+
+        magic, version, thread_count, interval_us = _TELEMETRY_HEADER.unpack_from(data)
+        if magic != _TELEMETRY_MAGIC or version != _TELEMETRY_VERSION:
+            raise ValueError("Unexpected workload telemetry stream format")
+
+        # Ignore a partially written trailing sample
+        sample_size = (thread_count + 1) * 8
+        sample_count = (len(data) - _TELEMETRY_HEADER.size) // sample_size
+        samples = numpy.frombuffer(
+            data,
+            dtype=numpy.uint64,
+            count=sample_count * (thread_count + 1),
+            offset=_TELEMETRY_HEADER.size,
+        ).reshape(sample_count, thread_count + 1)
+
+        return cls(
+            interval_us * 1000,
+            samples[:, 0].astype(numpy.int64),
+            samples[:, 1:].astype(numpy.int64),
+        )
+
+    def steady_state_ns_per_event(self, warmup_ns: int, cooldown_ns: int) -> float:
+        """
+        Time per event (per thread, as reported by the workload) computed
+        only over the samples taken after `warmup_ns` and before the last
+        `cooldown_ns` of the run.
+        """
+        end_ns = self.timestamps_ns[-1]
+        window = numpy.flatnonzero(
+            (self.timestamps_ns >= warmup_ns)
+            & (self.timestamps_ns <= end_ns - cooldown_ns)
+        )
+        if len(window) < 2:
+            raise ValueError("The steady-state window contains less than two samples")
+
+        first, last = window[0], window[-1]
+        events = (self.counts[last] - self.counts[first]).sum()
+        if events == 0:
+            raise ValueError("No event was produced during the steady-state window")
+
+        elapsed_ns = self.timestamps_ns[last] - self.timestamps_ns[first]
+        return float(elapsed_ns * self.thread_count / events)
+
+
+class telemetry_reader:
+    """
+    Drain a workload's telemetry pipe while it runs.
+
+    The pipe must be drained continuously: the workload blocks once the pipe's
+    buffer is full, which would stall its sampling thread.
+    """
+
+    def __init__(self, fd: int):
+        self._fd = fd
+        self._chunks = []
+        self._thread = threading.Thread(target=self._read, daemon=True)
+
+    def _read(self) -> None:
+        with os.fdopen(self._fd, "rb", buffering=0) as pipe:
+            while True:
+                chunk = pipe.read(1 << 16)
+                if not chunk:
+                    break
+                self._chunks.append(chunk)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def join(self) -> None:
+        self._thread.join()
+
+    def parse(self) -> workload_telemetry:
+        return workload_telemetry.parse(b"".join(self._chunks))
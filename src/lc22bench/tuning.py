@@ -0,0 +1,149 @@
+from typing import Callable, Optional
+
+from lc22bench.matrix import parse_cpu_list
+
+# A ring buffer geometry: (sub-buffer count, sub-buffer size in bytes)
+buffer_geometry = tuple[int, int]
+
+
+def powers_of_two(low: int, high: int) -> list[int]:
+    """Powers of two from `low` to `high`, both included."""
+    if low <= 0 or low & (low - 1) or high & (high - 1) or high < low:
+        raise ValueError(
+            "{low} and {high} must be powers of two, in increasing order".format(
+                low=low, high=high
+            )
+        )
+    values = [low]
+    while values[-1] < high:
+        values.append(values[-1] * 2)
+    return values
+
+
+def possible_cpu_count(cpu_sysfs_path: str = "/sys/devices/system/cpu") -> int:
+    # Both LTTng tracers allocate the buffers of every possible CPU up front
+    try:
+        with open(cpu_sysfs_path + "/possible") as possible:
+            return len(parse_cpu_list(possible.read()))
+    except OSError:
+        return 1
+
+
+def buffer_footprint(geometry: buffer_geometry, cpu_count: int) -> int:
+    """
+    Memory allocated to a channel's ring buffers: a buffer of `num_subbuf` *
+    `subbuf_size` bytes per CPU, in kernel pages for LTTng-modules and in
+    shared memory for LTTng-UST's per-user buffers.
+    """
+    num_subbuf, subbuf_size = geometry
+    return num_subbuf * subbuf_size * cpu_count
+
+
+class buffer_geometry_search:
+    """
+    Search the sub-buffer counts and sizes for the smallest ring buffer whose
+    time per event is within `tolerance` (relative) of the best one measured.
+
+    Configurations losing more than `max_loss_rate` of their events
+    are never recommended. The search measures a coarse grid, every
+    `coarse_stride`-th count and size, then halves the stride and measures
+    the neighbours of the best and recommended configurations until they are
+    surrounded by measured configurations at a stride of 1. Every
+    configuration is measured once, by `measure(num_subbuf, subbuf_size)`
+    which returns its median "ns_per_event" and its "loss_rate".
+    """
+
+    def __init__(
+        self,
+        measure: Callable[[int, int], dict],
+        subbuf_counts: list[int],
+        subbuf_sizes: list[int],
+        tolerance: float,
+        max_loss_rate: float = 0.0,
+        coarse_stride: int = 4,
+    ):
+        self._measure = measure
+        self._subbuf_counts = sorted(subbuf_counts)
+        self._subbuf_sizes = sorted(subbuf_sizes)
+        self._tolerance = tolerance
+        self._max_loss_rate = max_loss_rate
+        self._coarse_stride = max(1, coarse_stride)
+        self.measurements: dict[buffer_geometry, dict] = {}
+
+    @property
+    def configuration_count(self) -> int:
+        return len(self._subbuf_counts) * len(self._subbuf_sizes)
+
+    def _measure_indices(self, count_index: int, size_index: int) -> None:
+        geometry = (self._subbuf_counts[count_index], self._subbuf_sizes[size_index])
+        if geometry not in self.measurements:
+            self.measurements[geometry] = self._measure(*geometry)
+
+    @staticmethod
+    def _grid(length: int, stride: int) -> list[int]:
+        # Every stride-th index, always including both ends of the range
+        return sorted(set(range(0, length, stride)) | {length - 1})
+
+    def best(self) -> Optional[buffer_geometry]:
+        eligible = [
+            geometry
+            for geometry, measurement in self.measurements.items()
+            if measurement["loss_rate"] <= self._max_loss_rate
+        ]
+        if not eligible:
+            return None
+        return min(
+            eligible, key=lambda geometry: self.measurements[geometry]["ns_per_event"]
+        )
+
+    def recommendation(self) -> Optional[buffer_geometry]:
+        best = self.best()
+        if best is None:
+            return None
+
+        threshold = self.measurements[best]["ns_per_event"] * (1 + self._tolerance)
+        return min(
+            (
+                geometry
+                for geometry, measurement in self.measurements.items()
+                if measurement["loss_rate"] <= self._max_loss_rate
+                and measurement["ns_per_event"] <= threshold
+            ),
+            # Of configurations of the same size, the fastest
+            key=lambda geometry: (
+                geometry[0] * geometry[1],
+                self.measurements[geometry]["ns_per_event"],
+            ),
+        )
+
+    def _refine(self, stride: int) -> bool:
+        # Measure the neighbours of the best and recommended configurations,
+        # returns whether any wasn't measured yet
+        measured_count = len(self.measurements)
+        for center in {self.best(), self.recommendation()} - {None}:
+            count_index = self._subbuf_counts.index(center[0])
+            size_index = self._subbuf_sizes.index(center[1])
+            for count_step in (-stride, 0, stride):
+                for size_step in (-stride, 0, stride):
+                    if 0 <= count_index + count_step < len(
+                        self._subbuf_counts
+                    ) and 0 <= size_index + size_step < len(self._subbuf_sizes):
+                        self._measure_indices(
+                            count_index + count_step, size_index + size_step
+                        )
+        return len(self.measurements) > measured_count
+
+    def run(self) -> Optional[buffer_geometry]:
+        stride = self._coarse_stride
+        for count_index in self._grid(len(self._subbuf_counts), stride):
+            for size_index in self._grid(len(self._subbuf_sizes), stride):
+                self._measure_indices(count_index, size_index)
+
+        while stride > 1:
+            stride //= 2
+            self._refine(stride)
+        # Until the recommendation is a local optimum of the finest grid
+        while self._refine(1):
+            pass
+
+        return self.recommendation()
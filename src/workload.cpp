@@ -8,20 +8,34 @@
 #define _LGPL_SOURCE
 
 #include <iostream>
+#include <iomanip>
+#include <algorithm>
 #include <atomic>
+#include <fstream>
+#include <map>
+#include <sstream>
+#include <stdexcept>
 #include <string>
 #include <thread>
+#include <tuple>
 #include <vector>
 #include <cassert>
 #include <memory>
 
+#include <dirent.h>
+
 #include <poll.h>
 #include <fcntl.h>
+#include <getopt.h>
+#include <unistd.h>
 #include <stdio.h>
 #include <sys/types.h>
-#include <dirent.h>
-#include <limits.h>
 #include <pthread.h>
+#include <sched.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#endif
 
 #include "workload_tp.hpp"
 
@@ -30,6 +44,87 @@ std::atomic<unsigned int> stop_threads;
 std::atomic<unsigned int> threads_ready_count;
 std::atomic<unsigned int> threads_go;
 
+/*
+ * Event count published by a workload thread for the telemetry stream.
+ *
+ * Each counter lives on its own cache line so that publishing doesn't cause
+ * false sharing between the workload threads.
+ */
+struct alignas(64) published_counter {
+        std::atomic<uint64_t> value{0};
+};
+
+/*
+ * Telemetry stream format (native byte order):
+ *   header:  u32 magic, u32 version, u32 thread count, u32 sampling interval (us)
+ *   samples: u64 timestamp (ns since the threads were released),
+ *            followed by the u64 event count of each thread
+ */
+const uint32_t telemetry_magic = 0x3232434c;
+const uint32_t telemetry_version = 1;
+
+/*
+ * UST threads publish their event count every `ust_publish_period` events
+ * (a power of two) to keep the cost of publishing out of the measurement.
+ */
+const uint64_t ust_publish_period = 256;
+
+/*
+ * Log-linear (HDR-style) histogram of latencies, in cycle counter ticks.
+ *
+ * Values below 2^latency_sub_bucket_bits have a bucket of their own, then
+ * every power of two range is split into 2^latency_sub_bucket_bits buckets
+ * of equal width, which bounds the relative error of a bucket's values.
+ */
+const unsigned int latency_sub_bucket_bits = 5;
+const unsigned int latency_sub_bucket_count = 1U << latency_sub_bucket_bits;
+const unsigned int latency_bucket_count = (64 - latency_sub_bucket_bits + 1) * latency_sub_bucket_count;
+
+struct alignas(64) latency_histogram {
+        std::vector<uint64_t> counts = std::vector<uint64_t>(latency_bucket_count);
+        uint64_t max = 0;
+};
+
+unsigned int latency_bucket_index(uint64_t value)
+{
+        if (value < latency_sub_bucket_count) {
+                return value;
+        }
+
+        const unsigned int shift = 63 - __builtin_clzll(value) - latency_sub_bucket_bits;
+        return (shift + 1) * latency_sub_bucket_count + (value >> shift) - latency_sub_bucket_count;
+}
+
+void record_latency(latency_histogram &histogram, uint64_t value)
+{
+        histogram.counts[latency_bucket_index(value)]++;
+        histogram.max = std::max(histogram.max, value);
+}
+
+/*
+ * Cheap cycle counter timing the sampled events. Its rate is calibrated
+ * against CLOCK_MONOTONIC over the run.
+ */
+uint64_t read_cycle_counter()
+{
+        uint64_t value;
+
+        /* Keep the compiler from moving the timed code around the read. */
+        std::atomic_signal_fence(std::memory_order_seq_cst);
+#if defined(__x86_64__) || defined(__i386__)
+        value = __rdtsc();
+#elif defined(__aarch64__)
+        asm volatile("mrs %0, cntvct_el0" : "=r"(value));
+#else
+        timespec t;
+
+        clock_gettime(CLOCK_MONOTONIC, &t);
+        value = uint64_t(t.tv_sec) * 1000000000 + t.tv_nsec;
+#endif
+        std::atomic_signal_fence(std::memory_order_seq_cst);
+        return value;
+}
+
 int64_t timespec_delta_ns(const timespec &t1, const timespec &t2)
 {
         timespec delta;
@@ -40,6 +135,16 @@ int64_t timespec_delta_ns(const timespec &t1, const timespec &t2)
                         (int64_t) delta.tv_nsec;
 }
 
+timespec timespec_add_ns(const timespec &t, int64_t ns)
+{
+        timespec result;
+        const int64_t total_ns = int64_t(t.tv_nsec) + ns;
+
+        result.tv_sec = t.tv_sec + total_ns / 1000000000;
+        result.tv_nsec = total_ns % 1000000000;
+        return result;
+}
+
 timespec sample_time()
 {
         timespec t;
@@ -53,94 +158,260 @@ timespec sample_time()
         return t;
 }
 
-/* Extracted from LTTng-ust common/smp.c */
-int _get_max_cpuid_from_sysfs(const char *path)
+/*
+ * Get the list of CPUs on which the process is allowed to run.
+ *
+ * Threads are placed within this set so that the workload can be confined
+ * to a subset of the system's CPUs (e.g. using taskset or a cpuset).
+ */
+std::vector<unsigned int> get_allowed_cpus()
+{
+        cpu_set_t cpu_set;
+        std::vector<unsigned int> cpus;
+
+        CPU_ZERO(&cpu_set);
+        if (sched_getaffinity(0, sizeof(cpu_set), &cpu_set)) {
+                std::cerr << "Failed to get the process' CPU affinity" << std::endl;
+                std::abort();
+        }
+
+        for (unsigned int cpu_id = 0; cpu_id < CPU_SETSIZE; cpu_id++) {
+                if (CPU_ISSET(cpu_id, &cpu_set)) {
+                        cpus.push_back(cpu_id);
+                }
+        }
+
+        return cpus;
+}
+
+/*
+ * Parse a kernel CPU list (e.g. "0-3,8,10-11").
+ *
+ * Throws std::invalid_argument if the list is malformed.
+ */
+std::vector<unsigned int> parse_cpu_list(const std::string &cpu_list)
 {
-        long max_cpuid = -1;
+        std::vector<unsigned int> cpus;
+        std::istringstream stream{ cpu_list };
+        std::string range;
+
+        while (std::getline(stream, range, ',')) {
+                range.erase(range.find_last_not_of(" \n") + 1);
+                if (range.empty()) {
+                        continue;
+                }
+
+                const auto dash = range.find('-');
+                const auto first_str = range.substr(0, dash);
+                const auto last_str = dash != std::string::npos ? range.substr(dash + 1) : first_str;
+                size_t first_end, last_end;
+                unsigned int first, last;
+
+                try {
+                        first = std::stoul(first_str, &first_end);
+                        last = std::stoul(last_str, &last_end);
+                } catch (const std::logic_error &ex) {
+                        throw std::invalid_argument("Invalid CPU list: " + cpu_list);
+                }
 
-        DIR *cpudir;
-        struct dirent *entry;
+                if (first_end != first_str.size() || last_end != last_str.size() || last < first) {
+                        throw std::invalid_argument("Invalid CPU list: " + cpu_list);
+                }
 
-        assert(path);
+                for (auto cpu_id = first; cpu_id <= last; cpu_id++) {
+                        cpus.push_back(cpu_id);
+                }
+        }
 
-        cpudir = opendir(path);
-        if (cpudir == NULL)
-                goto end;
+        return cpus;
+}
 
-        /*
-         * Iterate on all directories named "cpu" followed by an integer.
-         */
-        while ((entry = readdir(cpudir))) {
-                if (entry->d_type == DT_DIR &&
-                        strncmp(entry->d_name, "cpu", 3) == 0) {
-
-                        char *endptr;
-                        long cpu_id;
-
-                        cpu_id = strtol(entry->d_name + 3, &endptr, 10);
-                        if ((cpu_id < LONG_MAX) && (endptr != entry->d_name + 3)
-                                        && (*endptr == '\0')) {
-                                if (cpu_id > max_cpuid)
-                                        max_cpuid = cpu_id;
+std::string read_sysfs_line(const std::string &path)
+{
+        std::ifstream file{ path };
+        std::string line;
+
+        std::getline(file, line);
+        return line;
+}
+
+struct cpu_topology {
+        unsigned int cpu_id;
+        unsigned int node_id;
+        /* Lowest allowed CPU of the physical core, identifying the core. */
+        unsigned int core_id;
+        /* Rank of the CPU among the allowed SMT siblings of its core. */
+        unsigned int sibling_index;
+};
+
+/*
+ * Read the topology of the CPUs on which the process is allowed to run:
+ * their NUMA node and the physical core they belong to.
+ *
+ * Systems without NUMA or SMT information are considered to have a single
+ * node and one CPU per core.
+ */
+std::vector<cpu_topology> read_topology(const std::vector<unsigned int> &allowed_cpus)
+{
+        std::map<unsigned int, unsigned int> cpu_nodes;
+        auto *node_dir = opendir("/sys/devices/system/node");
+        if (node_dir) {
+                while (const auto *entry = readdir(node_dir)) {
+                        const std::string name{ entry->d_name };
+
+                        if (name.rfind("node", 0) != 0 || name.size() == 4 ||
+                                        name.find_first_not_of("0123456789", 4) != std::string::npos) {
+                                continue;
+                        }
+
+                        const auto node_id = std::stoul(name.substr(4));
+                        for (const auto cpu_id : parse_cpu_list(read_sysfs_line(
+                                             "/sys/devices/system/node/" + name + "/cpulist"))) {
+                                cpu_nodes[cpu_id] = node_id;
                         }
                 }
-        }
 
-        if (closedir(cpudir)) {
-                std::cerr << "Failed to close CPU directory" << std::endl;
+                closedir(node_dir);
         }
 
-        /*
-         * If the max CPU id is out of bound, set it to -1 so it results in a
-         * CPU num of 0.
-         */
-        if (max_cpuid < 0 || max_cpuid > INT_MAX)
-                max_cpuid = -1;
+        std::vector<cpu_topology> topology;
+        for (const auto cpu_id : allowed_cpus) {
+                auto siblings = parse_cpu_list(read_sysfs_line("/sys/devices/system/cpu/cpu" +
+                        std::to_string(cpu_id) + "/topology/thread_siblings_list"));
+                siblings.erase(std::remove_if(siblings.begin(), siblings.end(),
+                                       [&allowed_cpus](unsigned int sibling) {
+                                               return std::find(allowed_cpus.begin(),
+                                                              allowed_cpus.end(),
+                                                              sibling) == allowed_cpus.end();
+                                       }),
+                        siblings.end());
+                if (siblings.empty()) {
+                        siblings.push_back(cpu_id);
+                }
 
-end:
-        return max_cpuid;
+                std::sort(siblings.begin(), siblings.end());
+                const auto node = cpu_nodes.find(cpu_id);
+                topology.push_back({ cpu_id, node != cpu_nodes.end() ? node->second : 0,
+                        siblings.front(),
+                        static_cast<unsigned int>(
+                                std::find(siblings.begin(), siblings.end(), cpu_id) -
+                                siblings.begin()) });
+        }
+
+        return topology;
 }
 
 /*
- * Get the highest CPU id from sysfs.
- *
- * Iterate on all the folders in "/sys/devices/system/cpu" that start with
- * "cpu" followed by an integer, keep the highest CPU id encountered during
- * this iteration and add 1 to get a number of CPUs.
+ * Choose the CPU of each thread according to a placement policy:
+ *   ordered: allowed CPUs in increasing order,
+ *   compact: fill every SMT sibling of a core, then the next core of the
+ *            same NUMA node,
+ *   spread:  distribute threads across NUMA nodes, on distinct physical
+ *            cores before using SMT siblings,
+ *   core:    one thread per physical core,
+ *   otherwise, the policy is an explicit CPU list.
  *
- * Returns the highest CPU id, or -1 on error.
- * 
- * Extracted from LTTng-ust common/smp.c
+ * Threads wrap around the chosen CPUs when they outnumber them, except with
+ * the "core" policy. Throws std::invalid_argument if the placement is
+ * impossible.
  */
-int get_max_cpuid_from_sysfs(void)
+std::vector<unsigned int> place_threads(const std::string &policy,
+        const std::vector<cpu_topology> &topology, unsigned int thread_count)
 {
-        return _get_max_cpuid_from_sysfs("/sys/devices/system/cpu");
+        std::vector<cpu_topology> order{ topology };
+
+        if (policy == "ordered") {
+                std::sort(order.begin(), order.end(), [](const auto &a, const auto &b) {
+                        return a.cpu_id < b.cpu_id;
+                });
+        } else if (policy == "compact" || policy == "core") {
+                std::sort(order.begin(), order.end(), [](const auto &a, const auto &b) {
+                        return std::tie(a.node_id, a.core_id, a.sibling_index) <
+                                std::tie(b.node_id, b.core_id, b.sibling_index);
+                });
+
+                if (policy == "core") {
+                        order.erase(std::remove_if(order.begin(), order.end(),
+                                            [](const auto &cpu) { return cpu.sibling_index != 0; }),
+                                order.end());
+                        if (thread_count > order.size()) {
+                                throw std::invalid_argument("Can't place " +
+                                        std::to_string(thread_count) + " threads on " +
+                                        std::to_string(order.size()) + " physical cores");
+                        }
+                }
+        } else if (policy == "spread") {
+                /* Rank CPUs within their node, then interleave the nodes. */
+                std::sort(order.begin(), order.end(), [](const auto &a, const auto &b) {
+                        return std::tie(a.node_id, a.sibling_index, a.core_id) <
+                                std::tie(b.node_id, b.sibling_index, b.core_id);
+                });
+
+                std::map<unsigned int, unsigned int> node_ranks;
+                std::vector<std::pair<unsigned int, cpu_topology>> ranked;
+                for (const auto &cpu : order) {
+                        ranked.emplace_back(node_ranks[cpu.node_id]++, cpu);
+                }
+
+                std::stable_sort(ranked.begin(), ranked.end(),
+                        [](const auto &a, const auto &b) { return a.first < b.first; });
+                order.clear();
+                for (const auto &rank_cpu : ranked) {
+                        order.push_back(rank_cpu.second);
+                }
+        } else {
+                order.clear();
+                for (const auto cpu_id : parse_cpu_list(policy)) {
+                        const auto cpu = std::find_if(topology.begin(), topology.end(),
+                                [cpu_id](const auto &cpu) { return cpu.cpu_id == cpu_id; });
+                        if (cpu == topology.end()) {
+                                throw std::invalid_argument("CPU " + std::to_string(cpu_id) +
+                                        " is not in the process' allowed CPUs");
+                        }
+
+                        order.push_back(*cpu);
+                }
+        }
+
+        if (order.empty()) {
+                throw std::invalid_argument("No CPU to place threads on");
+        }
+
+        std::vector<unsigned int> thread_cpus;
+        for (unsigned int thread_id = 0; thread_id < thread_count; thread_id++) {
+                thread_cpus.push_back(order[thread_id % order.size()].cpu_id);
+        }
+
+        return thread_cpus;
 }
 
 void set_current_thread_affinity(unsigned int cpu_id)
 {
-        const auto max_cpu_id = get_max_cpuid_from_sysfs();
         cpu_set_t cpu_set;
 
-        if (max_cpu_id < 0) {
-                std::cerr << "Failed to get max cpu id from sysfs" << std::endl;
-                std::abort();
-        }
-
         CPU_ZERO(&cpu_set);
-        CPU_SET(cpu_id % (max_cpu_id + 1), &cpu_set);
+        CPU_SET(cpu_id, &cpu_set);
         const auto ret = pthread_setaffinity_np(pthread_self(), sizeof(cpu_set), &cpu_set);
-        if (ret < 0) {
+        if (ret) {
                 std::cerr << "Failed to set affinity of thread to CPU #" << cpu_id << std::endl;
                 std::abort();
         }
 }
 
-void thread_workload_ust(unsigned int thread_id, uint64_t &iteration_count, int64_t &elapsed_time_ns)
+/*
+ * Without `trace`, only the loop remains: the "empty" baseline of the
+ * workload's own cost. With `sample`, every `sample_period`-th event is timed
+ * into `histogram`.
+ */
+template <bool publish, bool trace, bool sample>
+void thread_workload_ust(unsigned int cpu_id, unsigned int sample_period,
+        latency_histogram &histogram, published_counter &published_count,
+        uint64_t &iteration_count, int64_t &elapsed_time_ns)
 {
         uint64_t count = 0;
+        unsigned int sample_countdown = sample_period;
 
-        set_current_thread_affinity(thread_id);
+        set_current_thread_affinity(cpu_id);
 
         threads_ready_count++;
 
@@ -148,22 +419,56 @@ void thread_workload_ust(unsigned int thread_id, uint64_t &iteration_count, int6
 
         const auto time_begin = sample_time();
         while (!stop_threads) {
-                tracepoint(lc2022, benchmark_event, static_cast<unsigned int>(count));
+                bool timed = false;
+                uint64_t event_begin = 0;
+
+                if constexpr (sample) {
+                        if (--sample_countdown == 0) {
+                                sample_countdown = sample_period;
+                                timed = true;
+                                event_begin = read_cycle_counter();
+                        }
+                }
+
+                if constexpr (trace) {
+                        tracepoint(lc2022, benchmark_event, static_cast<unsigned int>(count));
+                }
+
+                if constexpr (sample) {
+                        if (timed) {
+                                record_latency(histogram, read_cycle_counter() - event_begin);
+                        }
+                }
+
                 count++;
+
+                if constexpr (publish) {
+                        if ((count & (ust_publish_period - 1)) == 0) {
+                                published_count.value.store(count, std::memory_order_relaxed);
+                        }
+                }
         }
 
         const auto time_end = sample_time();
         elapsed_time_ns = timespec_delta_ns(time_begin, time_end);
         iteration_count = count;
+        published_count.value.store(count, std::memory_order_relaxed);
 }
 
-void thread_workload_kernel(unsigned int thread_id, int proc_file_fd, uint64_t &iteration_count, int64_t &elapsed_time_ns)
+/*
+ * With `sample`, every `sample_period`-th write, which emits `batch_size`
+ * events, is timed into `histogram`.
+ */
+template <bool publish, bool sample>
+void thread_workload_kernel(unsigned int cpu_id, int proc_file_fd, unsigned int batch_size,
+        unsigned int sample_period, latency_histogram &histogram,
+        published_counter &published_count, uint64_t &iteration_count, int64_t &elapsed_time_ns)
 {
-        const unsigned int batch_size = 10000;
         std::string batch_size_str{ std::to_string(batch_size) };
         uint64_t count = 0;
+        unsigned int sample_countdown = sample_period;
 
-        set_current_thread_affinity(thread_id);
+        set_current_thread_affinity(cpu_id);
 
         threads_ready_count++;
 
@@ -171,34 +476,156 @@ void thread_workload_kernel(unsigned int thread_id, int proc_file_fd, uint64_t &
 
         const auto time_begin = sample_time();
         while (!stop_threads) {
+                bool timed = false;
+                uint64_t write_begin = 0;
+
+                if constexpr (sample) {
+                        if (--sample_countdown == 0) {
+                                sample_countdown = sample_period;
+                                timed = true;
+                                write_begin = read_cycle_counter();
+                        }
+                }
+
                 const auto ret = write(proc_file_fd, batch_size_str.c_str(), batch_size_str.size() + 1);
 
+                if constexpr (sample) {
+                        if (timed) {
+                                record_latency(histogram, read_cycle_counter() - write_begin);
+                        }
+                }
+
                 if (ret < 0) {
                         std::cerr << "Failed to write batch size to proc file" << std::endl;
                         std::abort();
                 }
 
                 count += batch_size;
+
+                if constexpr (publish) {
+                        published_count.value.store(count, std::memory_order_relaxed);
+                }
         }
 
         const auto time_end = sample_time();
         elapsed_time_ns = timespec_delta_ns(time_begin, time_end);
         iteration_count = count;
 }
+
+void write_all(int fd, const void *buf, size_t len)
+{
+        const auto *data = static_cast<const char *>(buf);
+
+        while (len > 0) {
+                const auto ret = write(fd, data, len);
+                if (ret < 0) {
+                        if (errno == EINTR) {
+                                continue;
+                        }
+
+                        std::cerr << "Failed to write to telemetry file descriptor" << std::endl;
+                        std::abort();
+                }
+
+                data += ret;
+                len -= ret;
+        }
 }
 
-int main(int argc, const char **argv)
+void write_telemetry_header(int fd, unsigned int thread_count, unsigned int interval_ms)
+{
+        const uint32_t header[] = { telemetry_magic, telemetry_version, thread_count, interval_ms * 1000 };
+
+        write_all(fd, header, sizeof(header));
+}
+
+void write_telemetry_sample(int fd, const timespec &time_origin,
+        const std::vector<published_counter> &counters, std::vector<uint64_t> &sample)
+{
+        sample[0] = timespec_delta_ns(time_origin, sample_time());
+        for (unsigned int i = 0; i < counters.size(); i++) {
+                sample[i + 1] = counters[i].value.load(std::memory_order_relaxed);
+        }
+
+        write_all(fd, sample.data(), sample.size() * sizeof(uint64_t));
+}
+
+template <bool publish, bool trace>
+decltype(&thread_workload_ust<publish, trace, false>) select_ust_workload(bool sample)
+{
+        return sample ? thread_workload_ust<publish, trace, true> :
+                        thread_workload_ust<publish, trace, false>;
+}
+
+template <bool publish>
+decltype(&thread_workload_kernel<publish, false>) select_kernel_workload(bool sample)
+{
+        return sample ? thread_workload_kernel<publish, true> : thread_workload_kernel<publish, false>;
+}
+}
+
+int main(int argc, char **argv)
 {
         unsigned int thread_count, duration_seconds;
         std::string workload_domain;
+        int telemetry_fd = -1;
+        unsigned int telemetry_interval_ms = 10;
+        /* Events emitted by each write to the kernel workload's proc file. */
+        unsigned int batch_size = 10000;
+        std::string placement_policy{ "ordered" };
+        /* Time every Nth event (or write, for the kernel domain); 0 to never. */
+        unsigned int latency_sample_period = 0;
+        const char *usage = "Usage: workload [--telemetry-fd FD] [--telemetry-interval-ms INTERVAL_MS] "
+                "[--batch-size BATCH_SIZE] [--placement ordered|compact|spread|core|CPU_LIST] "
+                "[--latency-sample-period PERIOD] THREAD_COUNT DURATION_SECONDS WORKLOAD_DOMAIN";
+        const struct option long_options[] = {
+                { "telemetry-fd", required_argument, nullptr, 't' },
+                { "telemetry-interval-ms", required_argument, nullptr, 'i' },
+                { "batch-size", required_argument, nullptr, 'b' },
+                { "placement", required_argument, nullptr, 'p' },
+                { "latency-sample-period", required_argument, nullptr, 'l' },
+                { nullptr, 0, nullptr, 0 },
+        };
 
-        if (argc != 4) {
-                std::cerr << "Usage: workload THREAD_COUNT DURATION_SECONDS WORKLOAD_DOMAIN" << std::endl;
+        assert(stop_threads.is_lock_free());
+        assert(threads_go.is_lock_free());
+
+        // Parse workload options.
+        int opt;
+        while ((opt = getopt_long(argc, argv, "", long_options, nullptr)) != -1) {
+                try {
+                        switch (opt) {
+                        case 't':
+                                telemetry_fd = std::stoi(optarg);
+                                break;
+                        case 'i':
+                                telemetry_interval_ms = std::stoi(optarg);
+                                break;
+                        case 'b':
+                                batch_size = std::stoi(optarg);
+                                break;
+                        case 'p':
+                                placement_policy = optarg;
+                                break;
+                        case 'l':
+                                latency_sample_period = std::stoi(optarg);
+                                break;
+                        default:
+                                std::cerr << usage << std::endl;
+                                return 1;
+                        }
+                } catch (const std::invalid_argument &ex) {
+                        std::cerr << "Invalid value for option " << argv[optind - 1] << ": " << optarg << std::endl;
+                        return 1;
+                }
+        }
+
+        if (argc - optind != 3 || telemetry_interval_ms == 0 || batch_size == 0) {
+                std::cerr << usage << std::endl;
                 return 1;
         }
 
-        assert(stop_threads.is_lock_free());
-        assert(threads_go.is_lock_free());
+        argv += optind - 1;
 
         // Parse workload arguments.
         try {
@@ -216,16 +643,36 @@ int main(int argc, const char **argv)
         }
 
         workload_domain = argv[3];
-        if (workload_domain != "kernel" && workload_domain != "ust") {
+        if (workload_domain != "kernel" && workload_domain != "ust" && workload_domain != "empty") {
                 std::cerr << "Unknown workload domain: " << workload_domain << std::endl;
                 return 1;
         }
 
+        const auto allowed_cpus = get_allowed_cpus();
+        if (allowed_cpus.empty()) {
+                std::cerr << "No CPU available to run the workload" << std::endl;
+                return 1;
+        }
+
+        std::vector<unsigned int> thread_cpus;
+        try {
+                thread_cpus = place_threads(placement_policy, read_topology(allowed_cpus), thread_count);
+        } catch (const std::exception &ex) {
+                std::cerr << "Invalid placement " << placement_policy << ": " << ex.what() << std::endl;
+                return 1;
+        }
+
+        const bool publish = telemetry_fd >= 0;
+        const bool sample = latency_sample_period > 0;
+        std::vector<latency_histogram> thread_latency_histograms(thread_count);
         std::vector<std::thread> threads;
+        std::vector<published_counter> thread_published_counters(thread_count);
         std::vector<std::uint64_t> thread_event_counters(thread_count);
         std::vector<std::int64_t> thread_elapsed_time_ns(thread_count);
         std::vector<int> thread_proc_file_fds;
         for (unsigned int thread_id = 0; thread_id < thread_count; thread_id++) {
+                const auto cpu_id = thread_cpus[thread_id];
+
                 if (workload_domain == "kernel") {
                         auto proc_file_fd = open("/proc/lttng-bench-event", O_WRONLY);
                         if (proc_file_fd < 0) {
@@ -233,13 +680,26 @@ int main(int argc, const char **argv)
                                 return 1;
                         }
 
-                        threads.emplace_back(thread_workload_kernel, thread_id, proc_file_fd,
+                        threads.emplace_back(publish ? select_kernel_workload<true>(sample) :
+                                                       select_kernel_workload<false>(sample),
+                                cpu_id, proc_file_fd, batch_size, latency_sample_period,
+                                std::ref(thread_latency_histograms[thread_id]),
+                                std::ref(thread_published_counters[thread_id]),
                                 std::ref(thread_event_counters[thread_id]),
                                 std::ref(thread_elapsed_time_ns[thread_id]));
 
                         thread_proc_file_fds.push_back(proc_file_fd);
                 } else {
-                        threads.emplace_back(thread_workload_ust, thread_id,
+                        const bool trace = workload_domain == "ust";
+
+                        threads.emplace_back(publish ?
+                                        (trace ? select_ust_workload<true, true>(sample) :
+                                                 select_ust_workload<true, false>(sample)) :
+                                        (trace ? select_ust_workload<false, true>(sample) :
+                                                 select_ust_workload<false, false>(sample)),
+                                cpu_id, latency_sample_period,
+                                std::ref(thread_latency_histograms[thread_id]),
+                                std::ref(thread_published_counters[thread_id]),
                                 std::ref(thread_event_counters[thread_id]),
                                 std::ref(thread_elapsed_time_ns[thread_id]));
                 }
@@ -248,18 +708,52 @@ int main(int argc, const char **argv)
         while (threads_ready_count < thread_count) {}
 
         threads_go = 1;
+        const auto time_go = sample_time();
+        const auto cycles_go = read_cycle_counter();
+        std::vector<uint64_t> telemetry_sample(thread_count + 1);
 
-        if (poll(nullptr, 0, duration_seconds * 1000) < 0) {
-                std::cerr << "Error returned from poll" << std::endl;
-                std::abort();
+        if (!publish) {
+                if (poll(nullptr, 0, duration_seconds * 1000) < 0) {
+                        std::cerr << "Error returned from poll" << std::endl;
+                        std::abort();
+                }
+        } else {
+                /*
+                 * Sample the threads' event counters at a fixed rate until the
+                 * end of the run.
+                 */
+                const auto time_stop = timespec_add_ns(time_go, int64_t(duration_seconds) * 1000000000);
+                const auto interval_ns = int64_t(telemetry_interval_ms) * 1000000;
+
+                write_telemetry_header(telemetry_fd, thread_count, telemetry_interval_ms);
+                write_telemetry_sample(telemetry_fd, time_go, thread_published_counters, telemetry_sample);
+
+                auto next_sample_time = timespec_add_ns(time_go, interval_ns);
+                while (timespec_delta_ns(next_sample_time, time_stop) > 0) {
+                        clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, &next_sample_time, nullptr);
+                        write_telemetry_sample(telemetry_fd, time_go, thread_published_counters, telemetry_sample);
+                        next_sample_time = timespec_add_ns(next_sample_time, interval_ns);
+                }
+
+                clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, &time_stop, nullptr);
         }
 
         stop_threads = 1;
+        const auto ticks_per_ns = double(read_cycle_counter() - cycles_go) /
+                double(timespec_delta_ns(time_go, sample_time()));
 
         for (auto &thread : threads) {
                 thread.join();
         }
 
+        if (publish) {
+                // Final sample, once every thread has published its last count
+                write_telemetry_sample(telemetry_fd, time_go, thread_published_counters, telemetry_sample);
+                if (close(telemetry_fd)) {
+                        std::cerr << "Failed to close telemetry file descriptor" << std::endl;
+                }
+        }
+
         for (const auto fd : thread_proc_file_fds) {
                 if (close(fd)) {
                         std::cerr << "Failed to close proc file" << std::endl;
@@ -283,5 +777,36 @@ int main(int argc, const char **argv)
          *    event_count (events)
          */
         std::cout << ((((static_cast<double>(total_run_time_ns) / static_cast<double>(total_count))))) << " ns per event" << std::endl;
+
+        // CPU on which each thread ran, in thread order
+        std::cout << "thread cpus:";
+        for (unsigned int thread_id = 0; thread_id < thread_count; thread_id++) {
+                std::cout << (thread_id ? "," : " ") << thread_cpus[thread_id];
+        }
+        std::cout << std::endl;
+
+        /*
+         * Latency histogram of each thread, in thread order:
+         *   "latency histogram: max MAX_TICKS BUCKET:COUNT,...",
+         * listing the non-empty buckets.
+         */
+        if (sample) {
+                std::cout << "latency clock: " << std::setprecision(9) << ticks_per_ns << " ticks per ns, "
+                          << latency_sub_bucket_bits << " sub-bucket bits" << std::endl;
+                for (const auto &histogram : thread_latency_histograms) {
+                        bool first = true;
+
+                        std::cout << "latency histogram: max " << histogram.max;
+                        for (unsigned int bucket = 0; bucket < latency_bucket_count; bucket++) {
+                                if (histogram.counts[bucket]) {
+                                        std::cout << (first ? " " : ",") << bucket << ":"
+                                                  << histogram.counts[bucket];
+                                        first = false;
+                                }
+                        }
+
+                        std::cout << std::endl;
+                }
+        }
         return 0;
 }
@@ -1,5 +1,1245 @@
+import pytest
+
 from lc22bench import __version__
 
 
 def test_version():
     assert __version__ == '0.1.0'
+
+
+def test_expand_matrix():
+    from lc22bench.matrix import expand_matrix
+
+    jobs = expand_matrix(
+        {
+            "duration": 10,
+            "scenario": [
+                {"name": "lttng-ust-ringbuffer", "subbuf-size": ["4K", "8M"]},
+                {"name": "ebpf-map", "thread-count": [1, 2]},
+            ],
+        }
+    )
+
+    assert [job.scenario for job in jobs] == [
+        "lttng-ust-ringbuffer",
+        "lttng-ust-ringbuffer",
+        "ebpf-map",
+        "ebpf-map",
+    ]
+    assert jobs[1].parameters == {"duration": 10, "subbuf-size": "8M"}
+    assert jobs[3].parameters == {"duration": 10, "thread-count": 2}
+    assert jobs[0].resources & jobs[2].resources == set()
+
+
+def test_cpu_list():
+    from lc22bench.matrix import format_cpu_list, parse_cpu_list
+
+    assert parse_cpu_list("0-2,5,7-8\n") == [0, 1, 2, 5, 7, 8]
+    assert format_cpu_list([8, 0, 1, 2, 5, 7]) == "0-2,5,7-8"
+
+
+@pytest.mark.parametrize("format", ["arrow", "jsonl"])
+def test_results_store_round_trip(tmp_path, format):
+    import numpy
+    import pandas
+
+    from lc22bench.results import results_store
+    from lc22bench.telemetry import workload_telemetry
+
+    if format == "arrow":
+        pytest.importorskip("pyarrow")
+
+    store = results_store(str(tmp_path), format)
+    for run in range(3):
+        with store.open_run("run-{}".format(run)) as writer:
+            for iteration in range(4):
+                store.append(
+                    writer,
+                    {
+                        "run_id": "run-{}".format(run),
+                        "scenario": "ebpf-map",
+                        "parameters": {"num_subbuf": 4},
+                        "iteration": iteration,
+                        "ns_per_event": 50.0 + iteration,
+                        "per_thread_event_counts": [10, 20],
+                    },
+                )
+                store.append_telemetry(
+                    writer,
+                    iteration,
+                    workload_telemetry(
+                        1000,
+                        numpy.array([0, 1000]),
+                        numpy.array([[0, 0], [10, 20]]),
+                    ),
+                )
+
+    records = store.load()
+    assert len(records) == 12
+    assert set(records["run_id"]) == {"run-0", "run-1", "run-2"}
+    assert records["ns_per_event"].median() == 51.5
+    assert list(records["per_thread_event_counts"][0]) == [10, 20]
+    assert records["parameters"][0] == '{"num_subbuf": 4}'
+
+    # A run written when the records had other fields
+    if format == "arrow":
+        import pyarrow
+        import pyarrow.ipc
+
+        old_run = pyarrow.table(
+            {
+                "run_id": ["run-old"],
+                "ns_per_event": [60.0],
+                "telemetry_counts": [[1, 2]],
+            }
+        )
+        with pyarrow.OSFile(str(tmp_path / "run-old.arrow"), "wb") as sink:
+            with pyarrow.ipc.new_file(sink, old_run.schema) as writer:
+                writer.write_table(old_run)
+    else:
+        (tmp_path / "run-old.jsonl").write_text(
+            '{"run_id": "run-old", "ns_per_event": 60.0, "telemetry_counts": [1, 2]}\n'
+        )
+    records = store.load()
+    assert len(records) == 13
+    assert "telemetry_counts" not in records.columns
+    old_record = records[records["run_id"] == "run-old"].iloc[0]
+    assert old_record["ns_per_event"] == 60.0
+    assert pandas.isna(old_record["scenario"])
+
+    telemetry = store.load_telemetry("run-1")
+    assert [series["iteration"] for series in telemetry] == [0, 1, 2, 3]
+    assert telemetry[0]["timestamps_ns"] == [0, 1000]
+    assert telemetry[0]["counts"] == [[0, 0], [10, 20]]
+    assert store.load_telemetry("run-3") == []
+
+
+def test_adaptive_stopping_rule():
+    import numpy
+
+    from lc22bench.stats import adaptive_stopping_rule, mad_outliers
+
+    points = [100.0, 100.1, 99.9, 100.0, 100.2, 99.8, 150.0]
+    assert mad_outliers(points).tolist() == [False] * 6 + [True]
+
+    rule = adaptive_stopping_rule(0.01, 5, 50, time_budget_s=60)
+    assert rule.stop_reason(points[:4], 0) is None
+    assert "CI of the median" in rule.stop_reason(points, 0)
+
+    noisy = numpy.random.default_rng(1).normal(100, 25, 10).tolist()
+    assert rule.stop_reason(noisy, 0) is None
+    assert "time budget" in rule.stop_reason(noisy, 60)
+    assert "maximum" in rule.stop_reason(noisy * 5, 0)
+
+
+def test_compare_samples():
+    import numpy
+
+    from lc22bench.stats import compare_samples, mann_whitney_u, median_difference
+
+    rng = numpy.random.default_rng(1)
+    baseline = numpy.round(rng.normal(100, 2, 40))
+    candidate = numpy.round(rng.normal(110, 2, 30))
+
+    u, _ = mann_whitney_u(baseline, candidate)
+    assert u == (baseline[:, None] > candidate).sum() + 0.5 * (
+        baseline[:, None] == candidate
+    ).sum()
+
+    comparison = compare_samples(baseline, candidate, rng=rng)
+    assert comparison["p_value"] < 0.001
+    assert 0 < comparison["ci_low"] < comparison["relative_delta"]
+    assert compare_samples(baseline, baseline, rng=rng)["p_value"] == 1.0
+
+    net, low, high = median_difference(baseline, candidate, rng=rng)
+    assert net == numpy.median(candidate) - numpy.median(baseline)
+    assert low < net < high
+
+
+def test_snapshot_session_description():
+    import xml.etree.ElementTree as ElementTree
+
+    from lc22bench.lttng_config import snapshot_session_description
+
+    session = ElementTree.fromstring(
+        snapshot_session_description(
+            "session_A", "UST", "channel_A", 4096, 4, ["lc2022:benchmark_event"]
+        )
+    ).find("session")
+    assert session.findtext("name") == "session_A"
+    assert session.findtext("started") == "true"
+    assert session.findtext("attributes/snapshot_mode") == "true"
+
+    domain = session.find("domains/domain")
+    assert domain.findtext("buffer_type") == "PER_UID"
+    channel = domain.find("channels/channel")
+    assert channel.findtext("subbuffer_size") == "4096"
+    assert channel.findtext("subbuffer_count") == "4"
+    assert channel.findtext("overwrite_mode") == "OVERWRITE"
+    assert [event.findtext("name") for event in channel.iterfind("events/event")] == [
+        "lc2022:benchmark_event"
+    ]
+
+
+def test_streaming_session_description():
+    import xml.etree.ElementTree as ElementTree
+
+    from lc22bench.lttng_config import streaming_session_description
+
+    session = ElementTree.fromstring(
+        streaming_session_description(
+            "session_A",
+            "KERNEL",
+            "channel_A",
+            4096,
+            4,
+            ["lttng_bench_event"],
+            "/dev/shm/trace",
+            "SPLICE",
+        )
+    ).find("session")
+    assert session.findtext("attributes/snapshot_mode") == "false"
+    assert session.findtext("output/consumer_output/destination/path") == (
+        "/dev/shm/trace"
+    )
+
+    channel = session.find("domains/domain/channels/channel")
+    assert channel.findtext("overwrite_mode") == "DISCARD"
+    assert channel.findtext("output_type") == "SPLICE"
+    assert channel.findtext("read_timer_interval") == "200000"
+
+
+def test_terminate_process():
+    import subprocess
+
+    from lc22bench.lifecycle import terminate_process
+
+    # Ignores SIGTERM, so that it has to be killed once the timeout expires
+    process = subprocess.Popen(
+        ["sh", "-c", "trap '' TERM; echo ready; while :; do sleep 0.1; done"],
+        stdout=subprocess.PIPE,
+    )
+    process.stdout.readline()
+    terminate_process(process.pid, timeout_s=0.5)
+    assert process.wait(timeout=5) == -9
+
+    process = subprocess.Popen(["sleep", "60"])
+    terminate_process(process.pid, timeout_s=5)
+    assert process.wait(timeout=5) == -15
+
+
+def test_linear_fit():
+    import numpy
+
+    from lc22bench.stats import linear_fit
+
+    rng = numpy.random.default_rng(0)
+    batch_sizes = numpy.repeat([1, 10, 100, 1000], 10)
+    ns_per_event = 40.0 + 800.0 / batch_sizes + rng.normal(0, 0.5, len(batch_sizes))
+
+    fit = linear_fit(1.0 / batch_sizes, ns_per_event, resamples=2000, rng=rng)
+    assert fit["intercept_ci"][0] < 40.0 < fit["intercept_ci"][1]
+    assert fit["slope_ci"][0] < 800.0 < fit["slope_ci"][1]
+    assert abs(fit["intercept"] - 40.0) < 0.5
+
+    with pytest.raises(ValueError):
+        linear_fit([1.0, 1.0], [2.0, 3.0])
+
+
+def test_key_sequence():
+    import numpy
+
+    from lc22bench.keys import key_sequence
+
+    sequential = key_sequence(1000, "sequential")
+    assert sequential[:3].tolist() == [0, 1, 2]
+    assert sequential[1000] == 0
+
+    # Every key of the largest key set is replayed
+    assert len(numpy.unique(key_sequence(65536, "uniform"))) == 65536
+    assert numpy.bincount(key_sequence(1000, "uniform")).min() == 65
+
+    uniform = numpy.bincount(key_sequence(16, "uniform"), minlength=16)
+    zipfian = numpy.bincount(key_sequence(16, "zipfian"), minlength=16)
+    assert uniform.sum() == zipfian.sum() == len(sequential)
+    assert zipfian.max() > 2 * uniform.max()
+
+    with pytest.raises(ValueError):
+        key_sequence(0, "uniform")
+
+
+def test_latency_histogram():
+    from lc22bench.histogram import bucket_bounds, parse_workload_latency
+
+    low, high = bucket_bounds([5, 32, 64, 65, 1919], 5)
+    assert low.tolist()[:4] == [5, 32, 64, 66]
+    assert high.tolist()[:4] == [6, 33, 66, 68]
+    assert int(low[4]) == 63 << 58
+
+    histogram = parse_workload_latency(
+        [
+            "thread cpus: 0,1",
+            "latency clock: 2 ticks per ns, 5 sub-bucket bits",
+            "latency histogram: max 20 10:98,20:1",
+            "latency histogram: max 130 96:1",
+        ]
+    )
+    assert histogram.sample_count == 100
+    assert histogram.quantiles_ns({"p50": 0.5, "p99": 0.99}) == {
+        "p50": 5.0,
+        "p99": 10.0,
+    }
+    assert histogram.quantiles_ns({"p100": 1.0}) == {"p100": 65.0}
+    assert histogram.max_ns == 65.0
+    assert parse_workload_latency(["thread cpus: 0"]) is None
+
+
+def test_latency_unit(monkeypatch, capsys):
+    import lc22bench.bench as bench
+    from lc22bench.histogram import parse_workload_latency
+
+    monkeypatch.setattr(bench.os, "getuid", lambda: 0)
+    assert bench.kernel_benchmark("workload", 1, 1).latency_unit == "write"
+    assert bench.empty_loop_benchmark("workload", 1, 1).latency_unit == "event"
+
+    histogram = parse_workload_latency(
+        [
+            "latency clock: 1 ticks per ns, 5 sub-bucket bits",
+            "latency histogram: max 20 10:1",
+        ]
+    )
+    results = bench.tracing_benchmark_results("kernel", "kernel")
+    results.add_per_event_time(1.0)
+    results.add_latency_histogram(histogram, "write")
+    results.summarize()
+    assert "Latency of sampled writes (ns)" in capsys.readouterr().out
+
+
+def test_cli_startup():
+    import subprocess
+    import sys
+    import time
+
+    # Loading libbcc and LLVM, pandas or numpy alone exceeds the budget
+    budget_s = 0.5
+    heavy_modules = {"bcc", "pandas", "numpy", "pyarrow", "humanfriendly", "psutil"}
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "lc22bench", "--help"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = {
+        line.split("|")[-1].strip().split(".")[0]
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+    assert "lc22bench" in imported
+    assert not imported & heavy_modules
+
+    durations = []
+    for _ in range(3):
+        begin = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "lc22bench", "--help"],
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        durations.append(time.perf_counter() - begin)
+    assert min(durations) < budget_s
+
+
+@pytest.mark.parametrize("event_header", ["compact", "large"])
+def test_scan_trace(tmp_path, event_header):
+    from lc22bench.ctf import (
+        scan_stream,
+        scan_trace,
+        stream_layout,
+        synthetic_stream,
+        write_synthetic_trace,
+    )
+
+    # Every 5th event is extended and followed by another event
+    write_synthetic_trace(
+        str(tmp_path), 2, [10, 0, 150], 4096, 12, event_header, irregular_every=5
+    )
+    trace = scan_trace(str(tmp_path))
+    assert trace["cpus"] == {
+        0: {"events": 192, "events_discarded": 0},
+        1: {"events": 192, "events_discarded": 0},
+    }
+    assert trace["bytes"] == 2 * 3 * 4096
+
+    layouts = {0: stream_layout(event_header, {0: 12, 1: 4})}
+    stream_path = tmp_path / "channel0_0"
+    stream_path.write_bytes(
+        synthetic_stream(
+            [100, 50, 80], 2048, 12, event_header, events_discarded=[0, 3, 7]
+        )
+    )
+    stream = scan_stream(str(stream_path), layouts)
+    assert stream["packets"] == 3
+    assert stream["events"] == 230
+    assert stream["events_discarded"] == 7
+
+
+def test_check_noise(tmp_path):
+    from lc22bench.preflight import check_noise, noise_score
+
+    cpu_path = tmp_path / "sys" / "devices" / "system" / "cpu"
+    for cpu, governor in [(0, "performance"), (1, "powersave")]:
+        cpufreq_path = cpu_path / "cpu{}".format(cpu) / "cpufreq"
+        cpufreq_path.mkdir(parents=True)
+        (cpufreq_path / "scaling_governor").write_text(governor + "\n")
+    (cpu_path / "intel_pstate").mkdir()
+    (cpu_path / "intel_pstate" / "no_turbo").write_text("1\n")
+    (cpu_path / "isolated").write_text("0-1\n")
+    (cpu_path / "nohz_full").write_text("0-1\n")
+    thp_path = tmp_path / "sys" / "kernel" / "mm" / "transparent_hugepage"
+    thp_path.mkdir(parents=True)
+    (thp_path / "enabled").write_text("always madvise [never]\n")
+    for irq, affinity in [(1, "2-3"), (2, "0")]:
+        (tmp_path / "proc" / "irq" / str(irq)).mkdir(parents=True)
+        (tmp_path / "proc" / "irq" / str(irq) / "smp_affinity_list").write_text(
+            affinity + "\n"
+        )
+
+    findings = check_noise([0, 1], 0, str(tmp_path / "sys"), str(tmp_path / "proc"))
+    assert {finding.check: finding.noisy for finding in findings} == {
+        "governor": True,
+        "turbo": False,
+        "isolation": False,
+        "irq_affinity": True,
+        "thp": False,
+    }
+    assert noise_score(findings) == pytest.approx(0.4 / 0.75)
+
+    findings = check_noise([2, 3], 0, str(tmp_path / "sys"), str(tmp_path / "proc"))
+    assert [finding.check for finding in findings if finding.noisy] == [
+        "isolation",
+        "irq_affinity",
+    ]
+
+
+def test_buffer_geometry_search():
+    from lc22bench.tuning import buffer_geometry_search, powers_of_two
+
+    measured = []
+
+    # Sub-buffer switches get cheaper with larger sub-buffers, and events are
+    # lost when there are fewer than 4 sub-buffers
+    def measure(num_subbuf, subbuf_size):
+        measured.append((num_subbuf, subbuf_size))
+        return {
+            "ns_per_event": 150 + 40000 / subbuf_size,
+            "loss_rate": 0.01 if num_subbuf < 4 else 0.0,
+        }
+
+    subbuf_sizes = powers_of_two(4096, 8 << 20)
+    assert len(subbuf_sizes) == 12
+    search = buffer_geometry_search(measure, [1, 2, 4, 8, 16], subbuf_sizes, 0.01)
+    assert search.run() == (4, 32768)
+    assert search.best()[1] == 8 << 20
+    assert len(measured) == len(set(measured)) < search.configuration_count
+
+    with pytest.raises(ValueError):
+        powers_of_two(4096, 3000)
+
+
+def test_folded_stacks(tmp_path):
+    from lc22bench.folded import (
+        diff_functions,
+        function_shares,
+        merge_folded,
+        read_folded,
+        write_folded,
+    )
+
+    baseline = {"main;emit;write_[k]": 50, "main;emit": 50}
+    candidate = merge_folded(
+        {"main;emit;write_[k]": 70, "main;emit": 10}, {"main;emit;memcpy": 20}
+    )
+    write_folded(str(tmp_path / "candidate.folded"), candidate)
+    assert read_folded(str(tmp_path / "candidate.folded")) == candidate
+
+    # Recursive calls count once towards the inclusive share
+    assert function_shares({"main;f;f": 3, "main": 1}) == {
+        "main": (0.25, 1.0),
+        "f": (0.75, 0.75),
+    }
+
+    rows = diff_functions(baseline, candidate, top=2)
+    assert [row[0] for row in rows] == ["emit", "memcpy"]
+    assert rows[0][1:3] == (0.5, 0.1)
+
+
+def _import_bcc_module(name):
+    import importlib
+
+    # bcc loads libbcc as it is imported
+    try:
+        return importlib.import_module(name)
+    except OSError as e:
+        pytest.skip("libbcc is unavailable: " + str(e))
+
+
+class fake_libbcc:
+    """Map operations of libbcc on a dict of byte strings, without batches."""
+
+    def __init__(self, key_size, leaf_size):
+        import ctypes as ct
+
+        self.entries = {}
+        elem_fn = ct.CFUNCTYPE(ct.c_int, ct.c_int, ct.c_void_p, ct.c_void_p)
+
+        def update_elem(fd, key, leaf, flags):
+            self.entries[ct.string_at(key, key_size)] = ct.string_at(leaf, leaf_size)
+            return 0
+
+        def lookup_elem(fd, key, leaf):
+            value = self.entries.get(ct.string_at(key, key_size))
+            if value is None:
+                return -1
+            ct.memmove(leaf, value, leaf_size)
+            return 0
+
+        def next_key(fd, key, next_key):
+            keys = sorted(self.entries)
+            if key is not None:
+                keys = [k for k in keys if k > ct.string_at(key, key_size)]
+            if not keys:
+                return -1
+            ct.memmove(next_key, keys[0], key_size)
+            return 0
+
+        self.bpf_update_elem = ct.CFUNCTYPE(
+            ct.c_int, ct.c_int, ct.c_void_p, ct.c_void_p, ct.c_ulonglong
+        )(update_elem)
+        self.bpf_lookup_elem = elem_fn(lookup_elem)
+        self.bpf_get_first_key = ct.CFUNCTYPE(
+            ct.c_int, ct.c_int, ct.c_void_p, ct.c_size_t
+        )(lambda fd, key, key_size: next_key(fd, None, key))
+        self.bpf_get_next_key = elem_fn(next_key)
+
+    def bpf_update_batch(self, *args):
+        return -1
+
+    def bpf_lookup_batch(self, *args):
+        return -1
+
+
+def test_keyed_map_setup_with_cached_program(monkeypatch):
+    import os
+    import struct
+
+    ebpf_program = _import_bcc_module("lc22bench.ebpf_program")
+    from lc22bench import bench
+    from lc22bench.keys import key_sequence
+
+    lib = fake_libbcc(4, 4)
+    monkeypatch.setattr(ebpf_program, "lib", lib)
+    sequence = ebpf_program.cached_bpf_table(
+        "key_sequence",
+        {
+            "type": 2,
+            "max_entries": 1 << 16,
+            "key_desc": '"unsigned int"',
+            "leaf_desc": '"unsigned int"',
+        },
+        -1,
+    )
+    monkeypatch.setattr(os, "getuid", lambda: 0)
+    monkeypatch.setattr(bench.kernel_benchmark, "setup", lambda self: None)
+    monkeypatch.setattr(
+        bench.ebpf_benchmark, "_load_program", lambda self, src: {"key_sequence": sequence}
+    )
+    monkeypatch.setattr(bench.ebpf_benchmark, "_attach_program", lambda self, fn: None)
+
+    bench.ebpf_keyed_map_benchmark("workload", 1, 1, "hash", 16, "zipfian").setup()
+    keys = key_sequence(16, "zipfian").tolist()
+    assert len(lib.entries) == len(keys)
+    assert sequence[5].value == keys[5]
+    assert [
+        struct.unpack("I", lib.entries[struct.pack("I", i)])[0] for i in range(len(keys))
+    ] == keys
+
+
+def test_keyed_map_lru_capacity(monkeypatch):
+    import ctypes as ct
+    import os
+
+    _import_bcc_module("bcc")
+    from bcc.utils import get_possible_cpus
+
+    from lc22bench import bench
+
+    class key_sequence_table:
+        Key = Leaf = ct.c_uint32
+
+        def items_update_batch(self, keys, values):
+            pass
+
+    sources = []
+    monkeypatch.setattr(os, "getuid", lambda: 0)
+    monkeypatch.setattr(bench.kernel_benchmark, "setup", lambda self: None)
+    monkeypatch.setattr(
+        bench.ebpf_benchmark,
+        "_load_program",
+        lambda self, src: sources.append(src) or {"key_sequence": key_sequence_table()},
+    )
+    monkeypatch.setattr(bench.ebpf_benchmark, "_attach_program", lambda self, fn: None)
+
+    for map_type in ("hash", "lru-hash"):
+        bench.ebpf_keyed_map_benchmark("workload", 1, 1, map_type, 1000, "uniform").setup()
+
+    assert "BPF_HASH(counts, u32, u64, 1000);" in sources[0]
+    assert 'BPF_TABLE("lru_hash", u32, u64, counts, {max_entries});'.format(
+        max_entries=1000 + bench.LRU_LOCAL_FREE_TARGET * len(get_possible_cpus())
+    ) in sources[1]
+
+
+def test_relocate_cached_program():
+    import struct
+
+    ebpf_program = _import_bcc_module("lc22bench.ebpf_program")
+
+    insn = struct.Struct("<BBhi")
+    insns = b"".join(
+        [
+            # r1 = map fd 3 (ld_imm64 spans two instructions)
+            insn.pack(0x18, 0x11, 0, 3),
+            insn.pack(0, 0, 0, 0),
+            # r2 = map value of fd 4
+            insn.pack(0x18, 0x22, 0, 4),
+            insn.pack(0, 0, 0, 0),
+            # r3 = 3, a plain 64-bit immediate
+            insn.pack(0x18, 0x03, 0, 3),
+            insn.pack(0, 0, 0, 0),
+            # r0 = 3
+            insn.pack(0xB7, 0x00, 0, 3),
+        ]
+    )
+    patched = ebpf_program.cached_bpf_program._relocate(insns, {3: 10, 4: 11})
+    assert [
+        insn.unpack_from(patched, offset)[3]
+        for offset in range(0, len(patched), insn.size)
+    ] == [10, 0, 11, 0, 3, 0, 3]
+
+    with pytest.raises(Exception):
+        ebpf_program.cached_bpf_program._relocate(insns, {3: 10})
+
+
+def test_ebpf_object_cache_key(tmp_path):
+    _import_bcc_module("bcc")
+    from lc22bench.ebpf_cache import ebpf_object_cache
+
+    cache = ebpf_object_cache(str(tmp_path), 1 << 20)
+    key = cache.key("int f() { return 0; }", ["-DN=1"])
+    assert key == cache.key("int f() { return 0; }", ["-DN=1"])
+    assert key != cache.key("int f() { return 1; }", ["-DN=1"])
+    assert key != cache.key("int f() { return 0; }", ["-DN=2"])
+
+
+def test_ebpf_object_cache(tmp_path, monkeypatch):
+    import json
+    import os
+    import sys
+    import types
+
+    from lc22bench.ebpf_cache import ebpf_object_cache
+
+    def spec(name):
+        return {"functions": [{"name": name}], "tables": [], "padding": "x" * 100}
+
+    # Stand-ins for the bcc-backed program loader and compiler
+    compiled = []
+    monkeypatch.setitem(
+        sys.modules,
+        "lc22bench.ebpf_program",
+        types.SimpleNamespace(
+            cached_bpf_program=lambda spec, compile_time_s=None: types.SimpleNamespace(
+                spec=spec, load_time_s=0.0
+            )
+        ),
+    )
+    monkeypatch.setattr(ebpf_object_cache, "key", lambda self, text, cflags: text)
+    monkeypatch.setattr(
+        ebpf_object_cache,
+        "_compile",
+        staticmethod(
+            lambda text, prog_type, cflags: compiled.append(text) or spec(text)
+        ),
+    )
+
+    cache = ebpf_object_cache(str(tmp_path / "ebpf"), 1 << 20)
+    assert cache.entries() == []
+    assert cache.load("a", 0).spec["functions"] == [{"name": "a"}]
+    assert cache.load("a", 0).spec["functions"] == [{"name": "a"}]
+    assert compiled == ["a"]
+    [entry] = cache.entries()
+    assert entry["key"] == "a" and entry["functions"] == ["a"]
+    assert entry["compile_time_s"] is not None
+
+    # A corrupt entry is recompiled
+    with open(entry["path"], "w") as entry_file:
+        entry_file.write("{")
+    cache.load("a", 0)
+    assert compiled == ["a", "a"]
+
+    # The least recently used entries are evicted past the maximum size
+    entry_size = len(json.dumps(spec("b")))
+    cache = ebpf_object_cache(str(tmp_path / "evicted"), 2 * entry_size + 60)
+    for age, name in enumerate(["c", "b"]):
+        cache._store(cache._entry_path(name), spec(name))
+        os.utime(cache._entry_path(name), (1000 + age, 1000 + age))
+    cache.load("d", 0)
+    assert sorted(entry["key"] for entry in cache.entries()) == ["b", "d"]
+
+    assert cache.purge() == 2
+    assert cache.entries() == []
+
+
+def test_scan_ringbuf_records():
+    import struct
+
+    from lc22bench.stream_records import scan_ringbuf_records
+
+    def record(length, flags=0):
+        padded = (8 + length + 7) // 8 * 8
+        return struct.pack("=II", length | flags, 0).ljust(padded, b"\x01")
+
+    # Regular samples are counted in bulk, others one by one
+    committed = (
+        record(16) * 3
+        + record(16, 1 << 30)
+        + record(16) * 2
+        + record(4)
+        + record(16)
+    )
+    data = committed + record(16, 1 << 31) + record(16) * 2
+    assert scan_ringbuf_records(data, 16) == (7, len(committed))
+    assert scan_ringbuf_records(record(16) * 4, 16) == (4, 96)
+    assert scan_ringbuf_records(b"", 16) == (0, 0)
+
+
+def test_scan_perf_records():
+    import struct
+
+    from lc22bench.stream_records import scan_perf_records
+
+    sample = struct.pack("=IHHI", 9, 0, 32, 16).ljust(32, b"\x01")
+
+    def lost(count):
+        return struct.pack("=IHHQQ", 2, 0, 24, 7, count)
+
+    complete = sample * 3 + lost(5) + sample * 2 + lost(2) + sample
+    data = complete + sample[:20]
+    assert scan_perf_records(data, 16) == (6, 7, len(complete))
+    assert scan_perf_records(sample * 4, 16) == (4, 0, 128)
+    assert scan_perf_records(struct.pack("=IHH", 9, 0, 4) + sample, 16) == (0, 0, 0)
+
+
+def test_buffer_page_counts():
+    import mmap
+
+    from lc22bench.stream_records import perf_buffer_page_count, ringbuf_page_count
+
+    assert perf_buffer_page_count(4096) == max(1, 4096 // mmap.PAGESIZE)
+    assert perf_buffer_page_count(3 * mmap.PAGESIZE) == 4
+    assert ringbuf_page_count(3 * mmap.PAGESIZE, 2) == 8
+    assert ringbuf_page_count(mmap.PAGESIZE, 1) == 1
+
+
+def test_workload_telemetry():
+    import os
+    import struct
+
+    from lc22bench.telemetry import telemetry_reader, workload_telemetry
+
+    # Two threads sampled every 100 ms, producing 1000 events per sample
+    # each after a warmup of 200 ms during which they produce 100
+    data = struct.pack("=IIII", 0x3232434C, 1, 2, 100000)
+    count = 0
+    for i in range(11):
+        data += struct.pack("=QQQ", i * 100000000, count, 2 * count)
+        count += 100 if i < 2 else 1000
+    data += struct.pack("=QQ", 0, 0)
+
+    read_fd, write_fd = os.pipe()
+    reader = telemetry_reader(read_fd)
+    reader.start()
+    os.write(write_fd, data)
+    os.close(write_fd)
+    reader.join()
+    telemetry = reader.parse()
+
+    assert telemetry.interval_ns == 100000000
+    assert telemetry.thread_count == 2
+    assert telemetry.timestamps_ns.tolist() == [i * 100000000 for i in range(11)]
+    assert telemetry.per_thread_event_counts.tolist() == [8200, 16400]
+    # 2 threads x 800 ms over 8000 + 16000 events
+    assert telemetry.steady_state_ns_per_event(200000000, 0) == pytest.approx(
+        2 * 800000000 / 24000
+    )
+    assert telemetry.steady_state_ns_per_event(200000000, 300000000) == pytest.approx(
+        2 * 500000000 / 15000
+    )
+
+    with pytest.raises(ValueError):
+        telemetry.steady_state_ns_per_event(600000000, 500000000)
+    with pytest.raises(ValueError):
+        workload_telemetry.parse(data[:8])
+    with pytest.raises(ValueError):
+        workload_telemetry.parse(struct.pack("=IIII", 0x3232434C, 2, 2, 100000))
+
+
+def test_perf_counters(monkeypatch):
+    import errno
+    import os
+    import struct
+
+    from lc22bench import perf_counters as pc
+
+    # Counters are pipes, to which the test writes the group read format
+    pipes = {}
+    errors = {}
+
+    def perf_event_open(perf_type, config, cpu, group_fd):
+        if (perf_type, config) in errors:
+            error = errors[(perf_type, config)]
+            raise OSError(error, os.strerror(error))
+        read_fd, write_fd = os.pipe()
+        pipes[read_fd] = write_fd
+        return read_fd
+
+    def write_group(group, enabled, running, values):
+        os.write(
+            pipes[group.fds[0]],
+            struct.pack(
+                "={}Q".format(3 + len(values)), len(values), enabled, running, *values
+            ),
+        )
+
+    # Unknown architectures have no syscall number to use
+    monkeypatch.setattr(pc, "_NR_PERF_EVENT_OPEN", None)
+    with pytest.raises(OSError) as e:
+        pc.perf_counters([0])
+    assert e.value.errno == errno.ENOSYS
+
+    monkeypatch.setattr(pc, "_perf_event_open", perf_event_open)
+    monkeypatch.setattr(pc._counter_group, "_ioctl", lambda self, request: None)
+
+    # The hardware group of CPU 0 was multiplexed, CPU 1's never ran
+    with pc.perf_counters([0, 1]) as counters:
+        assert counters.names == pc.COUNTER_NAMES
+        hardware_0, software_0, hardware_1, software_1 = counters._groups
+        write_group(hardware_0, 100, 25, [10, 20, 30])
+        write_group(software_0, 100, 100, [1, 2, 3, 4])
+        write_group(hardware_1, 100, 0, [10, 20, 30])
+        write_group(software_1, 100, 50, [1, 2, 3, 4])
+        counters.start()
+        assert counters.stop() == {
+            "cycles": 40,
+            "instructions": 80,
+            "cache_misses": 120,
+            "task_clock_ns": 3,
+            "context_switches": 6,
+            "cpu_migrations": 9,
+            "page_faults": 12,
+            "hardware_coverage": 0.0,
+        }
+
+    # Hardware counters are skipped without a PMU
+    errors[(pc._PERF_TYPE_HARDWARE, pc._PERF_COUNT_HW_CPU_CYCLES)] = errno.ENOENT
+    with pc.perf_counters([0]) as counters:
+        assert counters.names == [name for name, _, _ in pc.SOFTWARE_COUNTERS]
+        write_group(counters._groups[0], 100, 100, [1, 2, 3, 4])
+        counters.start()
+        totals = counters.stop()
+    assert totals == {
+        "task_clock_ns": 1,
+        "context_switches": 2,
+        "cpu_migrations": 3,
+        "page_faults": 4,
+    }
+    assert pc.per_event(totals, 2)["page_faults"] == 2.0
+    assert pc.per_event(totals, 2)["cycles"] is None
+
+    # Other errors are raised, once the counters opened so far are closed
+    errors.clear()
+    errors[(pc._PERF_TYPE_SOFTWARE, pc._PERF_COUNT_SW_PAGE_FAULTS)] = errno.EACCES
+    pipes.clear()
+    with pytest.raises(OSError):
+        pc.perf_counters([0])
+    assert len(pipes) == 6
+    for read_fd, write_fd in pipes.items():
+        with pytest.raises(OSError):
+            os.fstat(read_fd)
+        os.close(write_fd)
+
+
+@pytest.mark.parametrize(
+    "backend_counts, recorded, unaccounted, loss_ratio",
+    [
+        # Counted by the backend (eBPF and LTTng maps, streamed traces)
+        ({"recorded": 900, "discarded_events": 60}, 900, 40, 0.1),
+        # Every event that isn't reported as discarded is recorded
+        ({"discarded_events": 100}, 900, 0, 0.1),
+        # Overwrite mode channels only report lost packets
+        ({"lost_packets": 3}, None, None, None),
+    ],
+)
+def test_event_accounting(backend_counts, recorded, unaccounted, loss_ratio):
+    import numpy
+
+    from lc22bench.bench import benchmark
+    from lc22bench.telemetry import workload_telemetry
+
+    run = benchmark("workload", 2, 1)
+    run._telemetry = workload_telemetry(
+        500000000,
+        numpy.array([0, 500000000, 1000000000]),
+        numpy.array([[0, 0], [200, 250], [400, 600]]),
+    )
+    run._backend_counts = backend_counts
+    accounting = run.event_accounting
+    assert accounting["emitted_events"] == 1000
+    assert accounting["recorded_events"] == recorded
+    assert accounting["unaccounted_events"] == unaccounted
+    assert accounting["loss_ratio"] == pytest.approx(loss_ratio)
+    assert accounting["lost_packets"] == backend_counts.get("lost_packets")
+    assert accounting["recorded_events_per_s"] == recorded
+
+
+def _stub_benchmark(backend_counts=None, results=None):
+    # Benchmark that emits 100 events per iteration without running a workload
+    import numpy
+
+    from lc22bench import bench
+    from lc22bench.telemetry import workload_telemetry
+
+    class stub_benchmark(bench.benchmark):
+        setups = 0
+        closes = 0
+
+        @property
+        def workload_type(self) -> str:
+            return "empty"
+
+        def setup(self):
+            type(self).setups += 1
+
+        def close(self):
+            type(self).closes += 1
+
+        def run(self, workload_options=None, counters=None, profiler=None):
+            self._result = results.pop(0) if results else 10.0
+            self._telemetry = workload_telemetry(
+                1000, numpy.array([0, 1000, 2000]), numpy.array([[0], [50], [100]])
+            )
+            self._backend_counts = backend_counts
+
+    return stub_benchmark
+
+
+def _iterations_context(tmp_path, **options):
+    import click
+
+    from lc22bench import bench
+    from lc22bench.results import results_store
+
+    return click.Context(
+        bench.cli,
+        obj={
+            "workload_path": "workload",
+            "preflight": False,
+            "warm_session": True,
+            "cold_restart_interval": 0,
+            "results_store": results_store(str(tmp_path), "jsonl"),
+            "stopping_rule": None,
+            "workload_options": {"placement": "none", "latency-sample-period": 0},
+            "loss_tolerance": 0.01,
+            "iteration_count": 4,
+            "use_perf_counters": False,
+            "profile_frequency": None,
+            "warmup_ns": 0,
+            "cooldown_ns": 0,
+            "duration_s": 1,
+            **options,
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "warm_session, cold_restart_interval, cold_starts",
+    [
+        (True, 0, [True, False, False, False]),
+        (True, 2, [True, False, True, False]),
+        (False, 0, [True, True, True, True]),
+    ],
+)
+def test_run_iterations(tmp_path, warm_session, cold_restart_interval, cold_starts):
+    from lc22bench import bench
+
+    ctx = _iterations_context(
+        tmp_path,
+        warm_session=warm_session,
+        cold_restart_interval=cold_restart_interval,
+    )
+    benchmark = _stub_benchmark()
+    results = bench.tracing_benchmark_results("stub", "stub")
+    bench._run_iterations(ctx, results, lambda: benchmark("workload", 1, 1))
+
+    assert results.times_per_event == [10.0] * 4
+    assert results.stop_reason == "completed 4 iterations"
+    assert benchmark.setups == benchmark.closes == cold_starts.count(True)
+
+    store = ctx.obj["results_store"]
+    records = store.load()
+    assert records["cold_start"].tolist() == cold_starts
+    assert records["setup_time_s"].notna().tolist() == cold_starts
+    # The tracer is torn down before each cold start and after the last iteration
+    assert records["teardown_time_s"].notna().tolist() == cold_starts[1:] + [True]
+    assert records["steady_state_ns_per_event"].tolist() == [20.0] * 4
+    assert [series["iteration"] for series in store.load_telemetry(results.run_id)] == [
+        0,
+        1,
+        2,
+        3,
+    ]
+
+
+def test_run_iterations_stopping_rule(tmp_path):
+    from lc22bench import bench
+    from lc22bench.stats import adaptive_stopping_rule
+
+    ctx = _iterations_context(
+        tmp_path, stopping_rule=adaptive_stopping_rule(0.05, 3, 10)
+    )
+    benchmark = _stub_benchmark(results=[10.0, 50.0, 10.0, 10.0, 10.0, 10.0])
+    results = bench.tracing_benchmark_results("stub", "stub")
+    bench._run_iterations(ctx, results, lambda: benchmark("workload", 1, 1))
+
+    # Stops once the confidence interval of the median is narrow enough
+    assert 3 <= len(results.times_per_event) < 10
+    assert results.stop_reason.startswith("95% CI of the median")
+    assert benchmark.setups == benchmark.closes == 1
+    assert len(ctx.obj["results_store"].load()) == len(results.times_per_event)
+
+
+def test_run_scenario_sweeps(monkeypatch, capsys):
+    import click
+
+    from lc22bench import bench
+
+    runs = []
+
+    def run_iterations(ctx, results, make_benchmark, workload_options):
+        kind, thread_count = make_benchmark()
+        batch_size = workload_options["batch-size"]
+        runs.append((kind, thread_count, batch_size))
+        # 2 ns per event and 1000 ns per write, twice as slow with 4 threads
+        time_per_event = (
+            1.0
+            if kind == "baseline"
+            else (2.0 + 1000.0 / batch_size) * thread_count**0.5
+        )
+        for i in range(3):
+            results.add_per_event_time(time_per_event)
+
+    monkeypatch.setattr(bench, "_run_iterations", run_iterations)
+    monkeypatch.setattr(
+        bench,
+        "make_baseline_benchmark",
+        lambda ctx, baseline, thread_count: ("baseline", thread_count),
+    )
+    ctx = click.Context(
+        bench.cli,
+        obj={
+            "thread_counts": [1, 4],
+            "subtract_baseline": True,
+            "efficiency_threshold": 0.8,
+        },
+    )
+    sweep = bench._run_scenario(
+        ctx,
+        "eBPF map",
+        "ebpf-map",
+        {},
+        lambda thread_count: ("scenario", thread_count),
+        [10, 100],
+    )
+
+    assert sorted(sweep) == [(1, 10), (1, 100), (4, 10), (4, 100)]
+    assert sweep[1, 10] == [102.0] * 3
+    # Each point is preceded by its baseline
+    assert runs[:4] == [
+        ("baseline", 1, 10),
+        ("scenario", 1, 10),
+        ("baseline", 1, 100),
+        ("scenario", 1, 100),
+    ]
+
+    output = capsys.readouterr().out
+    assert (
+        "eBPF map (4 threads, batch size 100) - Time per event net of baseline"
+        in output
+    )
+    assert output.count("Batch size sweep") == 2
+    assert "Per-event cost: 2.000 ns" in output
+    assert "Per-write cost: 1000.0 ns" in output
+    assert output.count("Scalability") == 2
+    assert "parallel efficiency falls below 80% at 4 threads" in output
+
+    # Without sweeps, there is a single point and no sweep summary
+    ctx.obj.update(thread_counts=[1], subtract_baseline=False)
+    runs.clear()
+    sweep = bench._run_scenario(
+        ctx,
+        "eBPF map",
+        "ebpf-map",
+        {},
+        lambda thread_count: ("scenario", thread_count),
+        [10],
+    )
+    assert list(sweep) == [(1, 10)]
+    assert runs == [("scenario", 1, 10)]
+    output = capsys.readouterr().out
+    assert "Batch size sweep" not in output and "Scalability" not in output
+
+
+@pytest.mark.parametrize(
+    "backend_counts",
+    [
+        {"recorded": 50},
+        {"lost_packets": 2},
+    ],
+)
+def test_run_iterations_loss_tolerance(tmp_path, backend_counts):
+    import click
+
+    from lc22bench import bench
+
+    ctx = _iterations_context(tmp_path)
+    benchmark = _stub_benchmark(backend_counts)
+    results = bench.tracing_benchmark_results("stub", "stub")
+    with pytest.raises(click.ClickException, match="Iteration 0"):
+        bench._run_iterations(ctx, results, lambda: benchmark("workload", 1, 1))
+    # The failed iteration is saved and its tracer torn down
+    assert len(ctx.obj["results_store"].load()) == 1
+    assert benchmark.setups == benchmark.closes == 1
+
+    # An explicit tolerance overrides that of the context
+    results = bench.tracing_benchmark_results("stub", "stub")
+    bench._run_iterations(
+        ctx,
+        results,
+        lambda: benchmark("workload", 1, 1),
+        loss_tolerance=float("inf"),
+    )
+    assert len(results.times_per_event) == 4
+    assert ctx.obj["loss_tolerance"] == 0.01
+
+
+def test_snapshot_counts(tmp_path, monkeypatch):
+    from lc22bench.bench import lttng_benchmark
+    from lc22bench.ctf import write_synthetic_trace
+
+    commands = []
+
+    def run_lttng_cmd(self, cmd_args):
+        commands.append(cmd_args)
+        snapshot_dir = cmd_args.rsplit("file://", 1)[1]
+        write_synthetic_trace(snapshot_dir, 2, [10, 20], 4096, 12, "compact")
+
+    monkeypatch.setattr(lttng_benchmark, "_run_lttng_cmd", run_lttng_cmd)
+    monkeypatch.setattr(
+        lttng_benchmark,
+        "_channel_counts",
+        lambda self: {"discarded_events": 0, "lost_packets": 5},
+    )
+    tracer = lttng_benchmark("")
+    tracer._trace_dir = None
+    assert tracer._ringbuffer_counts() == {"lost_packets": 5, "recorded": 60}
+    assert commands[0].startswith("snapshot record --session " + tracer._session_name)
+
+
+def test_loss_rate():
+    from lc22bench.bench import tracing_benchmark_results
+
+    def accounting(emitted, recorded, lost_packets=None):
+        return {
+            "emitted_events": emitted,
+            "recorded_events": recorded,
+            "lost_packets": lost_packets,
+        }
+
+    results = tracing_benchmark_results("Ring buffer", "lttng-ust-ringbuffer")
+    assert results.loss_rate == 0.0
+    results.add_event_accounting(accounting(1000, 1000, 0))
+    results.add_event_accounting(accounting(1000, 600, 4))
+    assert results.loss_rate == pytest.approx(0.2)
+    results.add_event_accounting(accounting(1000, None, 1))
+    assert results.loss_rate == 1.0
+
+
+def test_table_arrays(monkeypatch):
+    import ctypes as ct
+    import struct
+
+    table_module = _import_bcc_module("bcc.table")
+
+    class fake_table(table_module.TableArrayMixin):
+        # Listed in key order, looked up key by key: no batch operations
+        map_fd = -1
+
+        def __init__(self, lib, max_entries):
+            self._lib = lib
+            self.max_entries = max_entries
+
+        def __iter__(self):
+            for key in sorted(self._lib.entries):
+                yield self.Key.from_buffer_copy(key)
+
+    # u64 counts
+    lib = fake_libbcc(4, 8)
+    monkeypatch.setattr(table_module, "lib", lib)
+    for key, value in ((3, 30), (1, 10), (2, 20)):
+        lib.entries[struct.pack("=I", key)] = struct.pack("=Q", value)
+    table = fake_table(lib, 16)
+    table.Key = ct.c_uint32
+    table.Leaf = ct.c_uint64
+    keys, values = table.items_array()
+    assert keys.tolist() == [1, 2, 3]
+    assert values.tolist() == [10, 20, 30]
+    assert table.getvalue_array(2) == 20
+    with pytest.raises(KeyError):
+        table.getvalue_array(4)
+    with pytest.raises(TypeError):
+        table.sum_array()
+
+    # Per-CPU u32 counts, each in an 8-byte slot of which the high bytes are
+    # left uninitialized
+    lib = fake_libbcc(4, 3 * 8)
+    monkeypatch.setattr(table_module, "lib", lib)
+    for key, values in ((0, (1, 2, 3)), (7, (4, 0, 8))):
+        lib.entries[struct.pack("=I", key)] = b"".join(
+            struct.pack("=II", value, 0xFFFFFFFF) for value in values
+        )
+    table = fake_table(lib, 2)
+    table.Key = ct.c_uint32
+    table.sLeaf = ct.c_uint32
+    table.total_cpu = 3
+    table.Leaf = ct.c_uint64 * 3
+    assert table.getvalue_array(7).tolist() == [4, 0, 8]
+    keys, values = table.items_array()
+    assert keys.tolist() == [0, 7]
+    assert values.shape == (2, 3)
+    assert values.tolist() == [[1, 2, 3], [4, 0, 8]]
+    assert table.sum_array(0) == 6
+    assert table.max_array(7) == 8
+    keys, sums = table.sum_array()
+    assert keys.tolist() == [0, 7] and sums.tolist() == [6, 12]
+    assert table.max_array()[1].tolist() == [3, 8]
+    assert table.mean_array()[1].tolist() == [2.0, 4.0]